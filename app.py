@@ -1,17 +1,29 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, Response
 from flask_cors import CORS
 import os
 import uuid
-import subprocess
 import threading
 import json
 import csv
 import io
+import glob
+import itertools
+import shutil
+import time
 from datetime import datetime, timedelta
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 import logging
 from PIL import Image
 import base64
+from concurrent.futures import TimeoutError as JobTimeoutError
+import worker_pool
+import metrics
+from job_scheduler import JobScheduler, QueueFull, PRIORITY_CLASSES
+from detection_store import get_detection_store
+from result_cache import ResultCache, cache_key
+from chunked_upload import ChunkedUploads, UploadError
+from video_io import OUTPUT_MODES
 
 app = Flask(__name__)
 CORS(app)
@@ -20,16 +32,26 @@ CORS(app)
 UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
 OUTPUT_FOLDER = os.environ.get('OUTPUT_FOLDER', 'output')
 TEMP_INPUT_FOLDER = os.environ.get('TEMP_INPUT_FOLDER', 'temp_input')
-MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
+MAX_FILE_SIZE = int(float(os.environ.get('MAX_FILE_SIZE', 100 * 1024 * 1024)))  # per request; larger files use /api/uploads
+UPLOAD_EXPIRY = float(os.environ.get('UPLOAD_EXPIRY', 24 * 3600))  # seconds an idle chunked upload is kept
+JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT', 6000))  # seconds
+CSV_PAGE_SIZE = int(os.environ.get('CSV_PAGE_SIZE', 500))  # default rows per /api/csv-json page
+SSE_HEARTBEAT = float(os.environ.get('SSE_HEARTBEAT', 15))  # seconds between keep-alive comments
+JOB_RESULT_TTL = float(os.environ.get('JOB_RESULT_TTL', 24 * 3600))  # seconds finished jobs and outputs are kept; 0 = forever
+JOB_EVICT_INTERVAL = float(os.environ.get('JOB_EVICT_INTERVAL', 60))  # seconds between eviction sweeps
+PRELOAD_MODELS = os.environ.get('PRELOAD_MODELS', '0') == '1'  # start the workers and load models at boot
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'jpg', 'jpeg', 'png'}
 
 # Ensure directories exist
 for folder in [UPLOAD_FOLDER, OUTPUT_FOLDER, TEMP_INPUT_FOLDER]:
     os.makedirs(folder, exist_ok=True)
 
+app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+
 # Job tracking
 active_jobs = {}
 job_results = {}
+job_events = {}  # job_id -> JobEventLog
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -80,16 +102,149 @@ def parse_csv_results(csv_path):
         logger.error(f"Error parsing CSV: {e}")
     return results
 
-def process_file_async(job_id, input_path, filename):
-    """Process file in background thread"""
+def job_output_dir(job_id):
+    """Each job writes its annotated files and vehicle_log.csv to its own folder"""
+    return os.path.join(OUTPUT_FOLDER, job_id)
+
+def log_csv_paths(job_id=None):
+    """CSV logs for one job, or for every job (oldest first) plus a CLI-run vehicle_log.csv"""
+    if job_id:
+        path = os.path.join(job_output_dir(secure_filename(job_id)), "vehicle_log.csv")
+        return [path] if os.path.exists(path) else []
+    paths = glob.glob(os.path.join(OUTPUT_FOLDER, '*', 'vehicle_log.csv'))
+    legacy_path = os.path.join(OUTPUT_FOLDER, "vehicle_log.csv")
+    if os.path.exists(legacy_path):
+        paths.append(legacy_path)
+    return sorted(paths, key=os.path.getmtime)
+
+def iter_csv_rows(paths):
+    """Yield CSV rows one at a time across several files without loading them into memory"""
+    for path in paths:
+        try:
+            with open(path, newline='') as csvfile:
+                for row in csv.DictReader(csvfile):
+                    yield row
+        except OSError as e:
+            logger.error(f"Error reading CSV {path}: {e}")
+
+def parse_time_arg(name):
+    """Query argument as epoch seconds; accepts a number or an ISO 8601 datetime"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+class JobEventLog:
+    """Events of one job, numbered from 1, with a condition to wake up SSE subscribers"""
+    def __init__(self):
+        self.events = []
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def publish(self, event):
+        with self.cond:
+            if self.closed:
+                return  # late events of a job that already timed out
+            self.events.append(event)
+            self.cond.notify_all()
+
+    def close(self, event):
+        with self.cond:
+            self.events.append(event)
+            self.closed = True
+            self.cond.notify_all()
+
+    def wait(self, after, timeout):
+        """Events numbered after `after` (waits up to timeout for new ones) and whether the log is closed"""
+        with self.cond:
+            self.cond.wait_for(lambda: len(self.events) > after or self.closed, timeout=timeout)
+            return self.events[after:], self.closed
+
+def format_sse(event_id, event):
+    return f"id: {event_id}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+def job_event_handler(job_id):
+    """Records worker events for a job and mirrors them into active_jobs for /api/status"""
+    log = job_events[job_id]
+
+    def on_event(event):
+        job = active_jobs.get(job_id)
+        if job is not None:
+            if event['type'] == 'progress' and event['frames_total']:
+                eta = f", ETA {event['eta_seconds']:.0f}s" if event['eta_seconds'] is not None else ""
+                job['progress'] = (f"{event['file']}: {event['frames_done']}/{event['frames_total']} frames "
+                                   f"({event['fps']:.1f} FPS{eta})")
+            elif event['type'] == 'vehicle':
+                job.setdefault('vehicles', []).append(event)
+        log.publish(event)
+    return on_event
+
+def finish_job_events(job_id):
+    """Send the final end event once every event from the worker has been delivered"""
+    worker_pool.wait_events_delivered(job_id)
+    result = job_results.get(job_id, {})
+    job_events[job_id].close({
+        'type': 'end',
+        'status': result.get('status', 'error'),
+        'output_image': result.get('output_image'),
+        'output_video': result.get('output_video'),
+        'total_vehicles': result.get('total_vehicles'),
+        'error': result.get('error')
+    })
+
+def completed_result(job_id, filename, stdout, cached=False):
+    """job_results entry for a job whose outputs are in its output folder"""
+    output_dir = job_output_dir(job_id)
+    # Determine output files
+    output_image_path = None
+    output_video_path = None
+    csv_path = os.path.join(output_dir, "vehicle_log.csv")
+    
+    if is_image_file(filename):
+        output_image_path = os.path.join(output_dir, f"annotated_{filename}")
+    elif is_video_file(filename) and os.path.exists(os.path.join(output_dir, f"annotated_{filename}")):
+        output_video_path = os.path.join(output_dir, f"annotated_{filename}")
+    # Keyframes of new vehicles, written instead of a video with output mode "none"
+    thumbnail_dir = os.path.join(output_dir, 'thumbnails')
+    thumbnails = sorted(os.listdir(thumbnail_dir)) if os.path.isdir(thumbnail_dir) else []
+    
+    # Parse CSV results
+    csv_data = parse_csv_results(csv_path)
+    
+    # Generate preview
+    preview_image = None
+    if output_image_path and os.path.exists(output_image_path):
+        preview_image = image_to_base64(output_image_path)
+    
+    return {
+        'status': 'completed',
+        'completed_at': datetime.now(),
+        'filename': filename,
+        'file_type': 'image' if is_image_file(filename) else 'video',
+        'output_image': f"{job_id}/annotated_{filename}" if output_image_path else None,
+        'output_video': f"{job_id}/annotated_{filename}" if output_video_path else None,
+        'preview_image': preview_image,
+        'thumbnails': [f"{job_id}/thumbnails/{name}" for name in thumbnails],
+        'csv_data': csv_data,
+        'total_vehicles': len(csv_data),
+        'cached': cached,
+        'stdout': stdout
+    }
+
+def process_file_async(job_id, input_path, filename, key=None, output_mode=None):
+    """Process a file; called by the scheduler's runner threads"""
     try:
         logger.info(f"[JOB {job_id}] Starting process_file_async for file: {filename}")
-        active_jobs[job_id] = {
+        active_jobs[job_id].update({
             'status': 'processing',
             'started_at': datetime.now(),
-            'filename': filename,
             'progress': 'Starting detection...'
-        }
+        })
+        job = active_jobs[job_id]
+        metrics.JOB_QUEUE_WAIT.observe((job['started_at'] - job['queued_at']).total_seconds())
         
         # Update progress
         active_jobs[job_id]['progress'] = 'Running vehicle detection...'
@@ -99,77 +254,56 @@ def process_file_async(job_id, input_path, filename):
         os.makedirs(job_input_dir, exist_ok=True)
         logger.info(f"[JOB {job_id}] Created job input dir: {job_input_dir}")
         
-        # Copy file to job input directory
+        # Move file to job input directory (a file still being uploaded is already there)
         job_input_path = os.path.join(job_input_dir, filename)
-        os.rename(input_path, job_input_path)
-        logger.info(f"[JOB {job_id}] Moved input file to: {job_input_path}")
-        
-        # Run detection (modify main.py to accept custom input/output dirs)
-        env = os.environ.copy()
-        env['INPUT_DIR'] = job_input_dir
-        env['OUTPUT_DIR'] = OUTPUT_FOLDER
-        logger.info(f"[JOB {job_id}] Running main.py with INPUT_DIR={job_input_dir} OUTPUT_DIR={OUTPUT_FOLDER}")
+        if os.path.abspath(input_path) != os.path.abspath(job_input_path):
+            os.rename(input_path, job_input_path)
+            logger.info(f"[JOB {job_id}] Moved input file to: {job_input_path}")
         
-        result = subprocess.run(
-            ['python', 'main.py'],
-            capture_output=True,
-            text=True,
-            timeout=6000,
-            env=env
-        )
-        logger.info(f"[JOB {job_id}] main.py finished with return code {result.returncode}")
-        logger.info(f"[JOB {job_id}] main.py stdout: {result.stdout}")
-        logger.info(f"[JOB {job_id}] main.py stderr: {result.stderr}")
+        # Run detection on the persistent worker pool (models are already loaded there)
+        output_dir = job_output_dir(job_id)
+        logger.info(f"[JOB {job_id}] Submitting to worker pool with INPUT_DIR={job_input_dir} OUTPUT_DIR={output_dir}")
+        future = worker_pool.submit_job(job_input_dir, output_dir, job_id, on_event=job_event_handler(job_id),
+                                        output_mode=output_mode)
+        if active_jobs[job_id].get('cancelled'):
+            worker_pool.cancel_job(job_id)  # cancel arrived before the job reached the pool
+        try:
+            stdout = future.result(timeout=JOB_TIMEOUT)
+            error = None
+        except JobTimeoutError:
+            worker_pool.cancel_job(job_id)  # free the worker instead of letting the job run on
+            raise
+        except Exception as e:
+            stdout = ''
+            error = str(e)
+        logger.info(f"[JOB {job_id}] Worker finished {'successfully' if error is None else 'with an error'}")
+        logger.info(f"[JOB {job_id}] Worker stdout: {stdout}")
         
-        if result.returncode == 0:
-            active_jobs[job_id]['progress'] = 'Processing complete, generating preview...'
-            
-            # Determine output files
-            output_image_path = None
-            output_video_path = None
-            csv_path = os.path.join(OUTPUT_FOLDER, "vehicle_log.csv")
-            
-            if is_image_file(filename):
-                output_image_path = os.path.join(OUTPUT_FOLDER, f"annotated_{filename}")
-            elif is_video_file(filename):
-                output_video_path = os.path.join(OUTPUT_FOLDER, f"annotated_{filename}")
-                # For videos, we'll extract a frame for preview
-                # You might want to modify main.py to also output a preview frame
-            
-            # Parse CSV results
-            csv_data = parse_csv_results(csv_path)
-            
-            # Generate preview
-            preview_image = None
-            if output_image_path and os.path.exists(output_image_path):
-                preview_image = image_to_base64(output_image_path)
-            
+        if active_jobs[job_id].get('cancelled'):
             job_results[job_id] = {
-                'status': 'completed',
+                'status': 'cancelled',
+                'error': 'Cancelled while processing; partial results were kept',
                 'completed_at': datetime.now(),
-                'filename': filename,
-                'file_type': 'image' if is_image_file(filename) else 'video',
-                'output_image': f"annotated_{filename}" if output_image_path else None,
-                'output_video': f"annotated_{filename}" if output_video_path else None,
-                'preview_image': preview_image,
-                'csv_data': csv_data,
-                'total_vehicles': len(csv_data),
-                'stdout': result.stdout
+                'filename': filename
             }
+        elif error is None:
+            active_jobs[job_id]['progress'] = 'Processing complete, generating preview...'
+            job_results[job_id] = completed_result(job_id, filename, stdout)
+            if key:
+                result_cache.put(key, output_dir, filename, job_id=job_id)
         else:
             job_results[job_id] = {
                 'status': 'failed',
-                'error': result.stderr,
+                'error': error,
                 'completed_at': datetime.now(),
                 'filename': filename
             }
         
         # Cleanup temp directory
-        import shutil
         shutil.rmtree(job_input_dir, ignore_errors=True)
             
-    except subprocess.TimeoutExpired:
-        logger.error(f"[JOB {job_id}] main.py timed out.")
+    except JobTimeoutError:
+        logger.error(f"[JOB {job_id}] Worker timed out.")
         job_results[job_id] = {
             'status': 'timeout',
             'error': 'Processing timeout exceeded',
@@ -187,7 +321,141 @@ def process_file_async(job_id, input_path, filename):
     finally:
         logger.info(f"[JOB {job_id}] Finished process_file_async.")
         # Clean up active job
+        job = active_jobs.pop(job_id, None)
+        if job and job.get('started_at'):
+            metrics.JOB_DURATION.observe((datetime.now() - job['started_at']).total_seconds(),
+                                         status=job_results.get(job_id, {}).get('status', 'error'))
+        finish_job_events(job_id)
+
+# Worker processes are spawned, so when app.py is run as a script each of them re-imports it as
+# __mp_main__ (before multiprocessing.parent_process() is set). Only the web process owns the job
+# queue, caches, cameras and background threads.
+IS_WEB_PROCESS = __name__ != '__mp_main__'
+
+if IS_WEB_PROCESS:
+    scheduler = JobScheduler(process_file_async)
+    result_cache = ResultCache()
+    chunked_uploads = ChunkedUploads(os.path.join(UPLOAD_FOLDER, 'chunked'), max_chunk_size=MAX_FILE_SIZE)
+    cameras = worker_pool.CameraSupervisorProcess(os.path.join(OUTPUT_FOLDER, 'cameras'))
+
+def evict_expired_jobs(now=None):
+    """Forget finished jobs older than JOB_RESULT_TTL and delete their output folders"""
+    if not JOB_RESULT_TTL:
+        return []
+    cutoff = (now or datetime.now()) - timedelta(seconds=JOB_RESULT_TTL)
+    expired = [job_id for job_id, result in list(job_results.items()) if result['completed_at'] < cutoff]
+    for job_id in expired:
+        job_results.pop(job_id, None)
+        job_events.pop(job_id, None)
+        shutil.rmtree(job_output_dir(job_id), ignore_errors=True)
+    if expired:
+        logger.info(f"Evicted {len(expired)} expired jobs")
+    return expired
+
+def evict_expired_jobs_loop():
+    while True:
+        time.sleep(JOB_EVICT_INTERVAL)
+        try:
+            evict_expired_jobs()
+            removed = chunked_uploads.evict(UPLOAD_EXPIRY)
+            if removed:
+                logger.info(f"Removed {len(removed)} idle chunked uploads")
+        except Exception as e:
+            logger.error(f"Job eviction failed: {e}")
+
+if IS_WEB_PROCESS:
+    threading.Thread(target=evict_expired_jobs_loop, name="job-evictor", daemon=True).start()
+
+model_warmup = {'status': 'cold'}  # cold -> warming -> ready (or error)
+_warmup_lock = threading.Lock()
+_warmup_done = threading.Event()
+
+def _load_worker_models():
+    started = time.monotonic()
+    try:
+        workers = worker_pool.warm_up()
+    except Exception as e:
+        logger.error(f"Model warm-up failed: {e}")
+        model_warmup.update(status='error', error=str(e))
+    else:
+        model_warmup.update(status='ready', seconds=round(time.monotonic() - started, 2),
+                            workers={str(pid): {name: round(t, 2) for name, t in loads.items()}
+                                     for pid, loads in workers.items()})
+        logger.info(f"Models loaded in {len(workers)} workers in {model_warmup['seconds']}s")
+    _warmup_done.set()
+
+def warm_up_workers(wait=False):
+    """Start the inference workers and load their models, once; returns the warm-up state"""
+    with _warmup_lock:
+        if model_warmup['status'] in ('cold', 'error'):
+            model_warmup.update(status='warming', started_at=datetime.now().isoformat(), error=None)
+            _warmup_done.clear()
+            threading.Thread(target=_load_worker_models, name="model-warmup", daemon=True).start()
+    if wait:
+        _warmup_done.wait()
+    return model_warmup
+
+if PRELOAD_MODELS and IS_WEB_PROCESS:
+    warm_up_workers()
+
+def cached_response(job_id, filename, key):
+    """Response for a file whose outputs are in the result cache, or None on a miss"""
+    meta = result_cache.get(key, job_output_dir(job_id), filename) if key else None
+    if not meta:
+        return None
+    # Record the detections under this job, as processing the file would have
+    store = get_detection_store()
+    if store and meta.get('job_id'):
+        store.copy_job(meta['job_id'], job_id, source=filename)
+    job_results[job_id] = completed_result(job_id, filename, '', cached=True)
+    job_events[job_id] = JobEventLog()
+    finish_job_events(job_id)
+    logger.info(f"Cache hit for job {job_id} ({filename})")
+    result = job_results[job_id]
+    return jsonify({
+        'job_id': job_id,
+        'filename': filename,
+        'message': 'Identical file already processed; returning cached results',
+        'status': 'completed',
+        'cached': True,
+        'file_type': result['file_type'],
+        'output_image': result['output_image'],
+        'output_video': result['output_video'],
+        'preview_image': result['preview_image'],
+        'thumbnails': result['thumbnails'],
+        'csv_data': result['csv_data'],
+        'total_vehicles': result['total_vehicles']
+    }), 200
+
+def enqueue_job(job_id, input_path, filename, priority, key=None, output_mode=None, **job):
+    """Add a job to active_jobs and the scheduler. Returns None, or an error response"""
+    job_events[job_id] = JobEventLog()
+    active_jobs[job_id] = {
+        'status': 'queued',
+        'queued_at': datetime.now(),
+        'filename': filename,
+        'priority': priority,
+        'input_path': input_path,
+        'output_mode': output_mode,
+        'progress': 'Waiting in queue...',
+        **job
+    }
+    try:
+        scheduler.submit(job_id, priority, input_path, filename, key, output_mode)
+    except QueueFull:
         active_jobs.pop(job_id, None)
+        job_events.pop(job_id, None)
+        return jsonify({'error': 'Too many queued jobs, try again later'}), 429
+    logger.info(f"Queued job {job_id} for file {filename} ({priority})")
+    return None
+
+def default_priority(filename):
+    # Images jump ahead of long videos unless the client asks otherwise
+    return 'image' if is_image_file(filename) else 'video'
+
+def stored_filename(job_id, filename):
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"{timestamp}_{job_id[:8]}_{filename}"  # same file uploaded twice in a second
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
@@ -208,47 +476,191 @@ def upload_file():
         # Generate unique job ID and filename
         job_id = str(uuid.uuid4())
         filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        unique_filename = f"{timestamp}_{filename}"
+        priority = request.form.get('priority') or default_priority(filename)
+        if priority not in PRIORITY_CLASSES:
+            return jsonify({'error': 'Unknown priority', 'priorities': list(PRIORITY_CLASSES)}), 400
+        output_mode = request.form.get('output') or None
+        if output_mode and output_mode not in OUTPUT_MODES:
+            return jsonify({'error': 'Unknown output mode', 'outputs': list(OUTPUT_MODES)}), 400
         
         # Save file
-        input_path = os.path.join(UPLOAD_FOLDER, unique_filename)
+        input_path = os.path.join(UPLOAD_FOLDER, stored_filename(job_id, filename))
         file.save(input_path)
+        metrics.UPLOAD_BYTES.inc(os.path.getsize(input_path), kind='single')
+
+        # Same file, weights and settings as an earlier job: reuse its outputs
+        key = cache_key(input_path, output_mode=output_mode) if result_cache.enabled else None
+        cached = cached_response(job_id, filename, key)
+        if cached:
+            os.remove(input_path)
+            return cached
         
-        # Start background processing
-        thread = threading.Thread(
-            target=process_file_async,
-            args=(job_id, input_path, filename)
-        )
-        thread.daemon = True
-        thread.start()
-        
-        logger.info(f"Started processing job {job_id} for file {filename}")
+        error = enqueue_job(job_id, input_path, filename, priority, key, output_mode)
+        if error:
+            os.remove(input_path)
+            return error
         
         return jsonify({
             'job_id': job_id,
             'filename': filename,
-            'message': 'File uploaded and processing started',
-            'status': 'processing'
+            'message': 'File uploaded and queued for processing',
+            'status': 'queued',
+            'queue_position': scheduler.position(job_id)
         }), 202
         
     except Exception as e:
         logger.error(f"Upload error: {e}")
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
 
+@app.route('/api/uploads', methods=['POST'])
+def init_chunked_upload():
+    """Start a chunked upload. JSON body: filename, size, optional chunk_size, sha256 of the
+    whole file, priority, output, and process_early to start processing a video before it has fully arrived"""
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename') or '')
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'File type not allowed', 'allowed_types': list(ALLOWED_EXTENSIONS)}), 400
+    priority = data.get('priority') or default_priority(filename)
+    if priority not in PRIORITY_CLASSES:
+        return jsonify({'error': 'Unknown priority', 'priorities': list(PRIORITY_CLASSES)}), 400
+    output_mode = data.get('output') or None
+    if output_mode and output_mode not in OUTPUT_MODES:
+        return jsonify({'error': 'Unknown output mode', 'outputs': list(OUTPUT_MODES)}), 400
+    early = bool(data.get('process_early')) and is_video_file(filename)
+
+    try:
+        job_id = str(uuid.uuid4())
+        # Early processing assembles the file straight into the job's input folder
+        target_path = os.path.join(TEMP_INPUT_FOLDER, job_id, filename) if early else None
+        meta = chunked_uploads.create(filename, data.get('size', 0), data.get('chunk_size'), data.get('sha256'),
+                                      target_path=target_path, priority=priority, output_mode=output_mode,
+                                      job_id=job_id if early else None)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    except (TypeError, ValueError):
+        return jsonify({'error': 'size and chunk_size must be integers'}), 400
+
+    if early:
+        # No cache key: the file's hash is only known once the upload completes
+        error = enqueue_job(job_id, meta['target_path'], filename, priority, output_mode=output_mode,
+                            upload_id=meta['upload_id'])
+        if error:
+            chunked_uploads.abort(meta['upload_id'])
+            shutil.rmtree(os.path.dirname(meta['target_path']), ignore_errors=True)
+            return error
+        logger.info(f"[JOB {job_id}] Processing chunked upload {meta['upload_id']} as it arrives")
+
+    response = chunked_uploads.status(meta)
+    if early:
+        response['queue_position'] = scheduler.position(job_id)
+    return jsonify(response), 201
+
+@app.route('/api/uploads/<upload_id>/parts/<int:index>', methods=['PUT'])
+def upload_part(upload_id, index):
+    """Raw bytes of one part; an optional X-Chunk-SHA256 header is checked against them"""
+    try:
+        meta = chunked_uploads.write_part(upload_id, index, request.stream, request.headers.get('X-Chunk-SHA256'))
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    metrics.UPLOAD_BYTES.inc(chunked_uploads.part_size(meta, index), kind='chunked')
+    status = chunked_uploads.status(meta)
+    return jsonify({'index': index, 'received_chunks': status['received_chunks'],
+                    'contiguous_bytes': status['contiguous_bytes']})
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def chunked_upload_status(upload_id):
+    """Received and missing parts, so an interrupted client can resume"""
+    try:
+        return jsonify(chunked_uploads.status(chunked_uploads.get(upload_id)))
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(upload_id):
+    """Verify the assembled file and queue it, unless it is already being processed"""
+    try:
+        meta = chunked_uploads.get(upload_id)
+        if meta['completed'] and meta.get('job_id'):
+            return jsonify({'job_id': meta['job_id'], 'filename': meta['filename'], 'status': 'completed_upload'})
+        meta = chunked_uploads.complete(upload_id)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+
+    job_id, filename = meta.get('job_id'), meta['filename']
+    if job_id:
+        # Started early; the job reads the rest of the file now that the marker is gone
+        logger.info(f"[JOB {job_id}] Chunked upload {upload_id} complete")
+        return jsonify({'job_id': job_id, 'filename': filename, 'status': 'processing',
+                        'message': 'Upload complete; processing started while it was uploading'}), 202
+
+    try:
+        job_id = str(uuid.uuid4())
+        input_path = os.path.join(UPLOAD_FOLDER, stored_filename(job_id, filename))
+        os.rename(meta['target_path'], input_path)
+        chunked_uploads.update(upload_id, job_id=job_id, target_path=input_path)
+
+        output_mode = meta.get('output_mode')
+        key = cache_key(input_path, meta['sha256'], output_mode) if result_cache.enabled else None
+        cached = cached_response(job_id, filename, key)
+        if cached:
+            os.remove(input_path)
+            return cached
+
+        error = enqueue_job(job_id, input_path, filename, meta['priority'], key, output_mode)
+        if error:
+            os.remove(input_path)
+            return error
+        return jsonify({
+            'job_id': job_id,
+            'filename': filename,
+            'message': 'File uploaded and queued for processing',
+            'status': 'queued',
+            'queue_position': scheduler.position(job_id)
+        }), 202
+    except Exception as e:
+        logger.error(f"Upload error: {e}")
+        return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def abort_chunked_upload(upload_id):
+    """Drop an upload and cancel the job processing it early, if any"""
+    try:
+        meta = chunked_uploads.abort(upload_id)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    job_id = meta.get('job_id')
+    if job_id in active_jobs and not meta['completed']:
+        cancel_job(job_id)
+    return jsonify({'upload_id': upload_id, 'status': 'aborted', 'job_id': job_id})
+
 @app.route('/api/status/<job_id>', methods=['GET'])
 def get_job_status(job_id):
     # Check if job is still active
     if job_id in active_jobs:
         job = active_jobs[job_id]
+        if job['status'] == 'queued':
+            return jsonify({
+                'job_id': job_id,
+                'status': 'queued',
+                'filename': job['filename'],
+                'priority': job['priority'],
+                'progress': job['progress'],
+                'queued_at': job['queued_at'].isoformat(),
+                'queue_position': scheduler.position(job_id)
+            })
         processing_time = datetime.now() - job['started_at']
+        # Rows of files this job has already finished
+        csv_path = os.path.join(job_output_dir(job_id), "vehicle_log.csv")
         return jsonify({
             'job_id': job_id,
             'status': job['status'],
             'filename': job['filename'],
+            'priority': job['priority'],
             'progress': job.get('progress', 'Processing...'),
             'started_at': job['started_at'].isoformat(),
-            'processing_time': str(processing_time).split('.')[0]  # Remove microseconds
+            'processing_time': str(processing_time).split('.')[0],  # Remove microseconds
+            'csv_data': parse_csv_results(csv_path) if os.path.exists(csv_path) else [],
+            'vehicles': job.get('vehicles', [])
         })
     
     # Check if job is completed
@@ -267,21 +679,97 @@ def get_job_status(job_id):
                 'output_image': result.get('output_image'),
                 'output_video': result.get('output_video'),
                 'preview_image': result.get('preview_image'),
+                'thumbnails': result.get('thumbnails', []),
                 'csv_data': result['csv_data'],
-                'total_vehicles': result['total_vehicles']
+                'total_vehicles': result['total_vehicles'],
+                'cached': result.get('cached', False)
             })
-        elif result['status'] in ['failed', 'timeout', 'error']:
+        elif result['status'] in ['failed', 'timeout', 'error', 'cancelled']:
             response['error'] = result['error']
             
         return jsonify(response)
     
     return jsonify({'error': 'Job not found'}), 404
 
-@app.route('/api/output/<filename>', methods=['GET'])
+@app.route('/api/cancel/<job_id>', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a queued job, or stop a running one after its current frame batch"""
+    job = active_jobs.get(job_id)
+    if job is None:
+        if job_id in job_results:
+            return jsonify({'error': 'Job already finished', 'status': job_results[job_id]['status']}), 409
+        return jsonify({'error': 'Job not found'}), 404
+
+    if job.get('upload_id'):
+        # Still uploading: stop waiting for the rest of the file
+        try:
+            chunked_uploads.abort(job['upload_id'])
+        except UploadError:
+            pass
+
+    args = scheduler.cancel(job_id)
+    if args is not None:
+        input_path, filename = args[:2]
+        if job.get('upload_id'):
+            shutil.rmtree(os.path.dirname(input_path), ignore_errors=True)
+        elif os.path.exists(input_path):
+            os.remove(input_path)
+        active_jobs.pop(job_id, None)
+        job_results[job_id] = {
+            'status': 'cancelled',
+            'error': 'Cancelled before processing started',
+            'completed_at': datetime.now(),
+            'filename': filename
+        }
+        finish_job_events(job_id)
+        logger.info(f"[JOB {job_id}] Cancelled while queued")
+        return jsonify({'job_id': job_id, 'status': 'cancelled'})
+
+    job['cancelled'] = True
+    job['progress'] = 'Cancelling...'
+    worker_pool.cancel_job(job_id)
+    logger.info(f"[JOB {job_id}] Cancel requested")
+    return jsonify({'job_id': job_id, 'status': 'cancelling'}), 202
+
+@app.route('/api/events/<job_id>', methods=['GET'])
+def job_event_stream(job_id):
+    """Server-Sent Events for a job: progress, vehicle and file_done events, then a final end event.
+
+    Events already sent are replayed from the start, or after the Last-Event-ID a
+    reconnecting client sends.
+    """
+    log = job_events.get(job_id)
+    if log is None:
+        if job_id not in job_results:
+            return jsonify({'error': 'Job not found'}), 404
+        # Finished before events were recorded (e.g. the server restarted): just report the outcome
+        log = JobEventLog()
+        log.close({'type': 'end', 'status': job_results[job_id]['status']})
+    try:
+        last_id = int(request.headers.get('Last-Event-ID', request.args.get('last_event_id', 0)))
+    except ValueError:
+        last_id = 0
+
+    def generate():
+        sent = max(last_id, 0)
+        while True:
+            events, closed = log.wait(sent, timeout=SSE_HEARTBEAT)
+            for event in events:
+                sent += 1
+                yield format_sse(sent, event)
+            if closed and not events:
+                return
+            if not events:
+                yield f": keep-alive {time.time():.0f}\n\n"
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/output/<path:filename>', methods=['GET'])
 def get_output(filename):
-    file_path = os.path.join(OUTPUT_FOLDER, filename)
+    file_path = safe_join(OUTPUT_FOLDER, filename)
     
-    if not os.path.exists(file_path):
+    if file_path is None or not os.path.exists(file_path):
         return jsonify({'error': 'File not found'}), 404
 
     return send_from_directory(OUTPUT_FOLDER, filename, as_attachment=True)
@@ -316,7 +804,6 @@ def download_csv(job_id):
     output.close()
     
     # Return as downloadable file
-    from flask import Response
     return Response(
         csv_content,
         mimetype='text/csv',
@@ -328,15 +815,163 @@ def download_csv(job_id):
 
 @app.route('/api/csv-json', methods=['GET'])
 def csv_as_json():
-    import csv
-    csv_path = os.path.join(OUTPUT_FOLDER, "vehicle_log.csv")
-    data = []
-    if os.path.exists(csv_path):
-        with open(csv_path, newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                data.append(row)
-    return jsonify(data)
+    """Detection log rows, paged with ?offset=&limit= and optionally limited to ?job_id=.
+
+    ?stream=1 returns newline-delimited JSON rows as they are read (all rows unless a
+    limit is given) instead of one JSON array.
+    """
+    job_id = request.args.get('job_id')
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    stream = request.args.get('stream', '0') == '1'
+    limit = request.args.get('limit', 0 if stream else CSV_PAGE_SIZE, type=int)
+
+    rows = iter_csv_rows(log_csv_paths(job_id))
+    rows = itertools.islice(rows, offset, offset + limit if limit > 0 else None)
+    if stream:
+        return Response((json.dumps(row) + '\n' for row in rows), mimetype='application/x-ndjson')
+
+    data = list(rows)
+    response = jsonify(data)
+    if limit > 0 and len(data) == limit:
+        response.headers['X-Next-Offset'] = str(offset + limit)
+    return response
+
+@app.route('/api/plates/<plate>', methods=['GET'])
+def plate_sightings(plate):
+    """Has this plate been seen? Exact match on the cleaned plate text"""
+    store = get_detection_store()
+    if store is None:
+        return jsonify({'error': 'Detection store is disabled'}), 503
+    sightings = store.find_plate(plate, limit=request.args.get('limit', 100, type=int))
+    return jsonify({'plate': plate, 'seen': bool(sightings), 'sightings': sightings})
+
+@app.route('/api/detections', methods=['GET'])
+def detections_query():
+    """Detections by ?source= or ?job_id=, written in an ingest-time range (?start=&end= as epoch seconds
+    or ISO 8601) and/or first seen in a video-time range (?seen_from=&seen_to= in seconds into the source)"""
+    store = get_detection_store()
+    if store is None:
+        return jsonify({'error': 'Detection store is disabled'}), 503
+    try:
+        start, end = parse_time_arg('start'), parse_time_arg('end')
+    except ValueError as e:
+        return jsonify({'error': f'Invalid time: {e}'}), 400
+    return jsonify(store.query(
+        start=start,
+        end=end,
+        source=request.args.get('source'),
+        job_id=request.args.get('job_id'),
+        seen_from=request.args.get('seen_from', type=float),
+        seen_to=request.args.get('seen_to', type=float),
+        limit=request.args.get('limit', 100, type=int),
+        offset=request.args.get('offset', 0, type=int)
+    ))
+
+@app.route('/api/cameras', methods=['GET'])
+def camera_counts():
+    """Vehicle counts per camera / source file, optionally written within ?start=&end= (ingest time)"""
+    store = get_detection_store()
+    if store is None:
+        return jsonify({'error': 'Detection store is disabled'}), 503
+    try:
+        start, end = parse_time_arg('start'), parse_time_arg('end')
+    except ValueError as e:
+        return jsonify({'error': f'Invalid time: {e}'}), 400
+    return jsonify(store.camera_counts(start=start, end=end))
+
+@app.route('/api/detections/import', methods=['POST'])
+def import_detections():
+    """Bulk-load existing vehicle_log.csv files (all of them under OUTPUT_FOLDER by default)"""
+    store = get_detection_store()
+    if store is None:
+        return jsonify({'error': 'Detection store is disabled'}), 503
+    imported = {}
+    for path in log_csv_paths():
+        parent = os.path.dirname(path)
+        # Per-job logs live in OUTPUT_FOLDER/<job_id>/
+        job_id = os.path.basename(parent) if os.path.abspath(parent) != os.path.abspath(OUTPUT_FOLDER) else None
+        imported[path] = store.import_csv(path, job_id=job_id)
+    return jsonify({'imported': imported, 'records': sum(imported.values())})
+
+@app.route('/api/cctv', methods=['POST'])
+def add_camera():
+    """Start processing a live stream; it shares the inference engine with the other cameras"""
+    data = request.get_json(silent=True) or {}
+    stream_url = (data.get('stream_url') or '').strip()
+    if not stream_url:
+        return jsonify({'error': 'stream_url is required'}), 400
+    output_mode = data.get('output') or 'none'
+    if output_mode not in OUTPUT_MODES:
+        return jsonify({'error': 'Unknown output mode', 'outputs': list(OUTPUT_MODES)}), 400
+    camera_id = secure_filename(data.get('camera_id') or '') or None
+    options = {'output_mode': output_mode}
+    try:
+        for field in ('target_fps', 'max_latency'):
+            if data.get(field) is not None:
+                options[field] = float(data[field])
+    except (TypeError, ValueError):
+        return jsonify({'error': 'target_fps and max_latency must be numbers'}), 400
+    try:
+        camera = cameras.add(stream_url, camera_id, **options)
+    except worker_pool.CameraError as e:
+        return jsonify({'error': str(e)}), e.status
+    logger.info(f"[CAMERA {camera['camera_id']}] Started: {stream_url}")
+    return jsonify({**camera, 'message': f"Camera {camera['camera_id']} started"}), 202
+
+@app.route('/api/cctv', methods=['GET'])
+def list_cameras():
+    """Per-camera statistics plus the shared inference engine's batching"""
+    if not cameras.started:
+        return jsonify({'cameras': [], 'engine': None, 'processed_fps': 0.0})
+    try:
+        return jsonify(cameras.stats())
+    except worker_pool.CameraError as e:
+        return jsonify({'error': str(e)}), e.status
+
+@app.route('/api/cctv/<camera_id>', methods=['GET'])
+def camera_status(camera_id):
+    if not cameras.started:
+        return jsonify({'error': 'Camera not found'}), 404
+    try:
+        return jsonify(cameras.stats(camera_id))
+    except worker_pool.CameraError as e:
+        return jsonify({'error': str(e)}), e.status
+
+@app.route('/api/cctv/<camera_id>', methods=['DELETE'])
+def remove_camera(camera_id):
+    """Stop a camera; its vehicles are written to the detection store"""
+    if not cameras.started:
+        return jsonify({'error': 'Camera not found'}), 404
+    try:
+        stats = cameras.remove(camera_id)
+    except worker_pool.CameraError as e:
+        return jsonify({'error': str(e)}), e.status
+    logger.info(f"[CAMERA {camera_id}] Stopped")
+    return jsonify(stats)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Counters and histograms in the Prometheus text format, including the workers' and cameras'"""
+    scheduler_stats = scheduler.stats()
+    metrics.JOBS_RUNNING.set(scheduler_stats['running'])
+    metrics.JOBS_QUEUED.set(scheduler_stats['queued'])
+    metrics.WORKERS.set(worker_pool.INFERENCE_WORKERS)
+    if cameras.started:
+        try:
+            camera_metrics = cameras.metrics()
+        except worker_pool.CameraError as e:
+            logger.warning(f"Could not collect camera metrics: {e}")
+        else:
+            metrics.REGISTRY.merge(camera_metrics['metrics'])
+            for status in ('starting', 'running', 'reconnecting', 'finished', 'failed', 'stopped'):
+                metrics.CAMERAS.set(camera_metrics['cameras'].get(status, 0), status=status)
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/warmup', methods=['POST'])
+def warmup():
+    """Load the models in every inference worker now instead of on the first job; ?wait=1 blocks until done"""
+    state = warm_up_workers(wait=request.args.get('wait', '0') == '1')
+    return jsonify(state), {'ready': 200, 'error': 500}.get(state['status'], 202)
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -344,6 +979,9 @@ def health_check():
         'status': 'healthy',
         'active_jobs': len(active_jobs),
         'completed_jobs': len(job_results),
+        'scheduler': scheduler.stats(),
+        'result_cache': result_cache.stats(),
+        'models': model_warmup,
         'timestamp': datetime.now().isoformat()
     })
 
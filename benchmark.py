@@ -0,0 +1,944 @@
+"""Throughput benchmarks for the detection pipeline.
+
+Usage:
+    python benchmark.py detect --video sample.mp4 --frames 200 --batch-sizes 1 4 8 16
+    python benchmark.py ocr --video sample.mp4 --frames 200
+    python benchmark.py tracker --vehicles 10000 --queries 100
+    python benchmark.py stream --video sample.mp4 --target-fps 10 --max-latency 0.5
+    python benchmark.py gating --video night.mp4 --strides 1 2 4
+    python benchmark.py enhance --frames 50
+    python benchmark.py roi --video sample.mp4 --truth plates.txt
+    python benchmark.py chunks --video long.mp4 --workers 1 2 4 8
+    python benchmark.py io --video sample.mp4 --backends opencv pyav --outputs full preview none
+    python benchmark.py resolution --video sample.mp4 --sizes 0 1280 960 640 480 320 --truth plates.txt
+    python benchmark.py backend --video sample.mp4 --backends torch onnx openvino
+    python benchmark.py cameras --video sample.mp4 --cameras 1 4 8 --seconds 30
+    python benchmark.py profile --stubs --frames 300 --report profile.json --baseline old_profile.json
+    python benchmark.py import --repeat 5 --max-seconds 1.0
+    python benchmark.py ocrcache --plates 300
+"""
+import argparse
+import copy
+import difflib
+import json
+import os
+import platform
+import random
+import string
+import subprocess
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+
+# === Helpers ===
+def load_frames(video_path, max_frames):
+    """Decode up to max_frames frames into memory so decoding is not timed"""
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while cap.isOpened() and len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        raise SystemExit(f"[ERROR] Could not read any frames from {video_path}")
+    return frames
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(v)) for v in col) for col in zip(headers, *rows)]
+    line = "  ".join(f"{{:>{w}}}" for w in widths)
+    print(line.format(*headers))
+    for row in rows:
+        print(line.format(*row))
+
+
+def random_plate(rng):
+    """Synthetic Indian-style plate such as MH12AB1234"""
+    return (''.join(rng.choices(string.ascii_uppercase, k=2)) + f"{rng.randint(1, 99):02}"
+            + ''.join(rng.choices(string.ascii_uppercase, k=2)) + f"{rng.randint(0, 9999):04}")
+
+
+def noisy_reading(rng, plate):
+    """Simulate an OCR misread: one substituted or dropped character, or spacing"""
+    i = rng.randrange(len(plate))
+    choice = rng.random()
+    if choice < 0.4:
+        return plate[:i] + rng.choice(string.ascii_uppercase + string.digits) + plate[i + 1:]
+    if choice < 0.7:
+        return plate[:i] + plate[i + 1:]
+    return plate[:4] + " " + plate[4:]
+
+
+class LinearVehicleTracker:
+    """The original VehicleTracker matching loop, kept as the baseline for bench_tracker"""
+    def __init__(self, vehicles):
+        self.vehicles = vehicles
+
+    def clean_plate(self, text):
+        if text == "UNREADABLE":
+            return text
+        return ''.join(c.upper() for c in text if c.isalnum())
+
+    def plates_similar(self, plate1, plate2, threshold=0.75):
+        if plate1 == "UNREADABLE" and plate2 == "UNREADABLE":
+            return True
+        if plate1 == "UNREADABLE" or plate2 == "UNREADABLE":
+            return False
+        clean1 = self.clean_plate(plate1)
+        clean2 = self.clean_plate(plate2)
+        if clean1 == clean2:
+            return True
+        return difflib.SequenceMatcher(None, clean1, clean2).ratio() >= threshold
+
+    def add_detection(self, plate_text, timestamp):
+        for i, (best_plate, readings, first_time) in enumerate(self.vehicles):
+            if self.plates_similar(plate_text, best_plate) or any(self.plates_similar(plate_text, r) for r in readings):
+                readings.append(plate_text)
+                readable = [r for r in readings if r != "UNREADABLE"]
+                new_best = max(readable, key=len) if readable else "UNREADABLE"
+                self.vehicles[i] = [new_best, readings, first_time]
+                return False
+        self.vehicles.append([plate_text, [plate_text], timestamp])
+        return True
+
+
+def legacy_enhance_image(image):
+    """enhance_image as it was before classification sampling and the LUT low-light path"""
+    from PIL import Image, ImageEnhance
+    import main
+
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    brightness = np.mean(gray)
+    contrast = np.std(gray)
+    if brightness < 80:
+        pil_img = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        pil_img = ImageEnhance.Brightness(pil_img).enhance(1.5)
+        pil_img = ImageEnhance.Contrast(pil_img).enhance(1.3)
+        return cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR), "Lowlight"
+    elif contrast < 30:
+        lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
+        l, a, b = cv2.split(lab)
+        l = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8)).apply(l)
+        return cv2.cvtColor(cv2.merge((l, a, b)), cv2.COLOR_LAB2BGR), "Foggy"
+    elif brightness > 200 and contrast < 40:
+        return main.enhance_rain(image), "Rainy"
+    return image, "Clear"
+
+
+def synthetic_scene(rng, condition, width, height):
+    """Random 1080p-style frame whose brightness/contrast falls in the given condition"""
+    base, spread = {"Lowlight": (40, 60), "Foggy": (130, 40), "Rainy": (215, 130), "Clear": (120, 250)}[condition]
+    noise = np.repeat(rng.random((height, width, 1)) * spread, 3, axis=2)
+    return np.clip(base - spread / 2 + noise, 0, 255).astype(np.uint8)
+
+
+def synthetic_traffic(rng, count, width, height, vehicles=3):
+    """Frames of white plates with black text crossing a dim, slightly noisy road"""
+    background = np.tile(np.linspace(40, 110, width, dtype=np.float32), (height, 1))
+    background = np.repeat(background[:, :, None], 3, axis=2)
+    plate_w, plate_h = max(60, width // 12), max(20, width // 48)
+    cars = [(random_plate(rng), rng.randrange(height // 4, height - plate_h), rng.randrange(width), rng.randint(4, 12))
+            for _ in range(vehicles)]
+    frames = []
+    for i in range(count):
+        noise = np.random.default_rng(i).normal(0, 4, (height, width, 1)).astype(np.float32)
+        frame = np.clip(background + noise, 0, 255).astype(np.uint8)
+        for plate, y, x0, speed in cars:
+            x = (x0 + i * speed) % (width - plate_w)
+            cv2.rectangle(frame, (x, y), (x + plate_w, y + plate_h), (235, 235, 235), -1)
+            cv2.putText(frame, plate, (x + 4, y + plate_h - 6), cv2.FONT_HERSHEY_SIMPLEX, plate_h / 40, (20, 20, 20), 1)
+        frames.append(frame)
+    return frames
+
+
+def render_plate(text, width=160, height=40, brightness=0, noise=0, nrng=None):
+    """Plate crop with dark text on a light background, optionally brighter and/or with sensor noise"""
+    img = np.full((height, width, 3), 235, np.uint8)
+    cv2.putText(img, text, (4, height - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.75, (20, 20, 20), 2)
+    img = img.astype(np.float32) + brightness
+    if noise:
+        img += nrng.normal(0, noise, img.shape)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far (None where the resource module is missing)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if platform.system() == "Darwin" else 1024), 1)  # bytes on macOS, KiB elsewhere
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+
+
+def latency_summary(samples):
+    seconds = np.array(samples or [0.0])
+    return {
+        'count': len(samples),
+        'p50_ms': round(float(np.percentile(seconds, 50)) * 1000, 3),
+        'p95_ms': round(float(np.percentile(seconds, 95)) * 1000, 3),
+        'mean_ms': round(float(seconds.mean()) * 1000, 3),
+        'total_s': round(float(seconds.sum()), 3),
+    }
+
+
+# === Benchmarks ===
+def bench_detect(args):
+    """Single-frame detect_plates loop vs. detect_plates_batch at several batch sizes"""
+    import main
+
+    frames = load_frames(args.video, args.frames)
+    main.detect_plates(frames[0])  # warm-up
+
+    rows = []
+    start = time.perf_counter()
+    single_count = 0
+    for frame in frames:
+        single_count += len(main.detect_plates(frame))
+    single_fps = len(frames) / (time.perf_counter() - start)
+    rows.append(["single", f"{single_fps:.2f}", "1.00x", single_count])
+
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        batch_count = 0
+        for i in range(0, len(frames), batch_size):
+            for detections in main.detect_plates_batch(frames[i:i + batch_size]):
+                batch_count += len(detections)
+        fps = len(frames) / (time.perf_counter() - start)
+        rows.append([f"batch={batch_size}", f"{fps:.2f}", f"{fps / single_fps:.2f}x", batch_count])
+
+    print(f"\n[BENCH] detect_plates on {len(frames)} frames from {args.video}")
+    print_table(["mode", "frames/sec", "speedup", "plates"], rows)
+
+
+def bench_ocr(args):
+    """Per-crop PaddleOCR (detect + classify + recognize) vs. one batched recognizer pass"""
+    import main
+
+    frames = load_frames(args.video, args.frames)
+    crops = []
+    for frame, r in zip(frames, main.get_yolo()(frames, verbose=False)):
+        for xyxy in r.boxes.xyxy.cpu().numpy():
+            x1, y1, x2, y2 = map(int, xyxy)
+            crops.append(frame[y1:y2, x1:x2])
+    crops = [c for c in crops if c.size > 0]
+    if not crops:
+        raise SystemExit("[ERROR] YOLO found no plates in the sample frames")
+
+    start = time.perf_counter()
+    for crop in crops:
+        main.get_ocr().ocr(crop, cls=True)
+    per_crop = time.perf_counter() - start
+
+    start = time.perf_counter()
+    main.recognize_plates(crops)
+    batched = time.perf_counter() - start
+
+    print(f"\n[BENCH] OCR on {len(crops)} plate crops from {len(frames)} frames")
+    print_table(["mode", "total s", "ms/crop", "speedup"], [
+        ["per-crop", f"{per_crop:.3f}", f"{per_crop / len(crops) * 1000:.2f}", "1.00x"],
+        ["batched", f"{batched:.3f}", f"{batched / len(crops) * 1000:.2f}", f"{per_crop / batched:.2f}x"],
+    ])
+
+
+def bench_tracker(args):
+    """Indexed VehicleTracker vs. the original linear scan over a large set of known vehicles"""
+    import main
+
+    rng = random.Random(args.seed)
+    indexed = main.VehicleTracker()
+    for i in range(args.vehicles):
+        plate = random_plate(rng)
+        indexed.add_detection(plate, f"t{i}")
+        for _ in range(args.readings - 1):
+            indexed.add_detection(noisy_reading(rng, plate), f"t{i}")
+    linear = LinearVehicleTracker(copy.deepcopy(indexed.vehicles))
+
+    # Half the queries re-read known vehicles, half are plates never seen before
+    known = [best for best, _, _ in indexed.vehicles]
+    queries = [noisy_reading(rng, rng.choice(known)) if i % 2 else random_plate(rng) for i in range(args.queries)]
+
+    start = time.perf_counter()
+    linear_new = [linear.add_detection(q, "query") for q in queries]
+    linear_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexed_new = [indexed.add_detection(q, "query") for q in queries]
+    indexed_time = time.perf_counter() - start
+
+    same = (linear_new == indexed_new
+            and [v[0] for v in linear.vehicles] == [v[0] for v in indexed.vehicles])
+    print(f"\n[BENCH] VehicleTracker.add_detection with {args.vehicles} known vehicles, {args.queries} queries")
+    print_table(["tracker", "ms/detection", "speedup"], [
+        ["linear", f"{linear_time / len(queries) * 1000:.3f}", "1.00x"],
+        ["indexed", f"{indexed_time / len(queries) * 1000:.3f}", f"{linear_time / indexed_time:.1f}x"],
+    ])
+    print(f"[BENCH] identical results: {same}")
+
+
+def bench_stream(args):
+    """Replay a local file at its native FPS as a stand-in camera through process_stream"""
+    import main
+
+    stats = {}
+    main.process_stream(args.video, save_name="bench_stream.mp4", target_fps=args.target_fps,
+                        max_latency=args.max_latency, replay=True, stats=stats)
+    print(f"\n[BENCH] live stream replay of {args.video}")
+    print_table(list(stats), [list(stats.values())])
+
+
+def bench_gating(args):
+    """Frames/sec and unique vehicles with and without motion gating / inference stride"""
+    import main
+
+    configs = [(False, 1)] + [(True, stride) for stride in args.strides]
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for gated, stride in configs:
+            cap = cv2.VideoCapture(args.video)
+            fps = cap.get(cv2.CAP_PROP_FPS) or 25
+            size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+            out = cv2.VideoWriter(os.path.join(tmp, "gating.mp4"), cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+            tracker = main.VehicleTracker()
+            start = time.perf_counter()
+            main.process_capture(cap, out, fps, tracker, max_frames=args.frames, motion_gate=gated, stride=stride)
+            elapsed = time.perf_counter() - start
+            frames = int(min(args.frames, cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+            cap.release()
+            out.release()
+            rows.append(["on" if gated else "off", stride, f"{frames / elapsed:.2f}",
+                         len(tracker.get_unique_vehicles())])
+
+    print(f"\n[BENCH] motion gating on {args.video}")
+    print_table(["gate", "stride", "frames/sec", "unique vehicles"], rows)
+
+
+def bench_enhance(args):
+    """Per-frame enhance_image cost at 1080p: legacy full-frame/PIL path vs. sampled + cached path"""
+    import main
+
+    rng = np.random.default_rng(0)
+    rows = []
+    for condition in ["Clear", "Lowlight", "Foggy", "Rainy"]:
+        frames = [synthetic_scene(rng, condition, args.width, args.height) for _ in range(4)]
+        timings = {}
+        for name, enhance in [("legacy", legacy_enhance_image),
+                              ("sampled", main.enhance_image),
+                              ("cached", lambda f, c=main.ConditionClassifier(): main.enhance_image(f, c))]:
+            start = time.perf_counter()
+            for i in range(args.frames):
+                _, detected = enhance(frames[i % len(frames)])
+            timings[name] = (time.perf_counter() - start) / args.frames * 1000
+        rows.append([condition, detected] + [f"{timings[n]:.2f}" for n in ("legacy", "sampled", "cached")]
+                    + [f"{timings['legacy'] / timings['cached']:.1f}x"])
+
+    print(f"\n[BENCH] enhance_image at {args.width}x{args.height}, ms/frame")
+    print_table(["scene", "classified", "legacy", "sampled", "cached", "speedup"], rows)
+
+
+def bench_roi(args):
+    """Full-frame enhancement vs. plate-crop (ROI) enhancement: throughput and plate quality"""
+    import main
+
+    truth = []
+    if args.truth:
+        with open(args.truth) as f:
+            truth = [line.strip() for line in f if line.strip()]
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ["frame", "roi"]:
+            cap = cv2.VideoCapture(args.video)
+            fps = cap.get(cv2.CAP_PROP_FPS) or 25
+            size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+            out = cv2.VideoWriter(os.path.join(tmp, "roi.mp4"), cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+            tracker = main.VehicleTracker()
+            start = time.perf_counter()
+            main.process_capture(cap, out, fps, tracker, max_frames=args.frames, enhance_mode=mode)
+            elapsed = time.perf_counter() - start
+            frames = int(min(args.frames, cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+            cap.release()
+            out.release()
+
+            plates = [plate for plate, _ in tracker.get_unique_vehicles()]
+            readable = [p for p in plates if p != "UNREADABLE"]
+            row = [mode, f"{frames / elapsed:.2f}", len(plates), len(readable)]
+            if truth:
+                found = sum(any(tracker.plates_similar(t, p) for p in readable) for t in truth)
+                row.append(f"{found}/{len(truth)}")
+            rows.append(row)
+
+    print(f"\n[BENCH] enhancement mode on {args.video}")
+    print_table(["mode", "frames/sec", "vehicles", "readable"] + (["recall"] if truth else []), rows)
+
+
+def bench_chunks(args):
+    """Wall time of one long video split into chunks over 1..N worker processes"""
+    import main
+    from concurrent.futures import ProcessPoolExecutor, wait
+
+    cap = cv2.VideoCapture(args.video)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    cap.release()
+
+    rows = []
+    baseline = None
+    sequential = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in args.workers:
+            ranges = main.chunk_ranges(total, fps, workers, args.min_seconds)
+            out = main.VideoOutput(os.path.join(tmp, "chunks.mp4"), fps, size, mode="full")
+            tracker = main.VehicleTracker()
+            if len(ranges) == 1:
+                cap = cv2.VideoCapture(args.video)
+                start = time.perf_counter()
+                main.process_capture(cap, out, fps, tracker)
+                elapsed = time.perf_counter() - start
+                cap.release()
+            else:
+                with ProcessPoolExecutor(max_workers=workers,
+                                         mp_context=main.multiprocessing.get_context('spawn')) as pool:
+                    # Load the models in every worker before timing
+                    wait([pool.submit(main.warm_up) for _ in range(workers * 2)])
+                    start = time.perf_counter()
+                    main.process_video_chunked(args.video, out, tracker, ranges, pool=pool)
+                    elapsed = time.perf_counter() - start
+            out.release()
+
+            plates = sorted(plate for plate, _ in tracker.get_unique_vehicles())
+            baseline = baseline or elapsed
+            sequential = sequential if sequential is not None else plates
+            rows.append([workers, len(ranges), f"{elapsed:.2f}", f"{total / elapsed:.2f}",
+                         f"{baseline / elapsed:.2f}x", len(plates), "yes" if plates == sequential else "no"])
+
+    print(f"\n[BENCH] chunked processing of {args.video} ({total} frames, {os.cpu_count()} CPUs)")
+    print_table(["workers", "chunks", "seconds", "frames/sec", "speedup", "vehicles", "same plates"], rows)
+
+
+def bench_io(args):
+    """Decode backend, YOLO input downscaling (DECODE_MAX_WIDTH) and output mode: frames/sec and output size"""
+    import main
+    import video_io
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends:
+            if backend == "pyav" and video_io.av is None:
+                print("[WARN] PyAV is not installed, skipping the pyav backend")
+                continue
+            for max_width in args.max_widths:
+                for mode in args.outputs:
+                    cap = video_io.open_capture(args.video, backend=backend)
+                    fps = cap.get(cv2.CAP_PROP_FPS) or 25
+                    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+                    path = os.path.join(tmp, f"{backend}_{max_width}_{mode}.mp4")
+                    out = video_io.VideoOutput(path, fps, size, mode, backend=backend,
+                                               thumbnail_dir=os.path.join(tmp, f"thumbs_{backend}_{max_width}"))
+                    tracker = main.VehicleTracker()
+                    start = time.perf_counter()
+                    main.process_capture(cap, out, fps, tracker, max_frames=args.frames, decode_max_width=max_width)
+                    out.release()
+                    elapsed = time.perf_counter() - start
+                    frames = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+                    cap.release()
+                    output_bytes = os.path.getsize(path) if out.path else 0
+                    yolo_size = video_io.scaled_size(*size, max_width)
+                    rows.append([backend, f"{yolo_size[0]}x{yolo_size[1]}", mode, f"{frames / elapsed:.2f}",
+                                 f"{output_bytes / 1e6:.2f}", len(out.thumbnails), len(tracker.get_unique_vehicles())])
+
+    print(f"\n[BENCH] video I/O on {args.video}")
+    print_table(["backend", "YOLO input", "output", "frames/sec", "output MB", "thumbnails", "vehicles"], rows)
+
+
+def bench_resolution(args):
+    """YOLO inference size vs. throughput and plate recall (0 = full frames, YOLO letterboxes itself)"""
+    import main
+
+    truth = []
+    if args.truth:
+        with open(args.truth) as f:
+            truth = [line.strip() for line in f if line.strip()]
+
+    rows = []
+    reference = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            cap = cv2.VideoCapture(args.video)
+            fps = cap.get(cv2.CAP_PROP_FPS) or 25
+            frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+            out = cv2.VideoWriter(os.path.join(tmp, "resolution.mp4"), cv2.VideoWriter_fourcc(*'mp4v'), fps, frame_size)
+            tracker = main.VehicleTracker()
+            start = time.perf_counter()
+            main.process_capture(cap, out, fps, tracker, max_frames=args.frames, inference_size=size)
+            elapsed = time.perf_counter() - start
+            frames = int(min(args.frames, cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+            cap.release()
+            out.release()
+
+            readable = [p for p, _ in tracker.get_unique_vehicles() if p != "UNREADABLE"]
+            # Without ground truth, recall is measured against the first (largest) size's plates
+            expected = truth or reference
+            if expected is None:
+                reference = expected = readable
+            found = sum(any(tracker.plates_similar(e, p) for p in readable) for e in expected)
+            rows.append([size or "full", f"{frames / elapsed:.2f}", len(readable),
+                         f"{found}/{len(expected)}" if expected else "-"])
+
+    print(f"\n[BENCH] inference resolution on {args.video} "
+          f"(recall vs {'ground truth' if truth else 'first size'})")
+    print_table(["size", "frames/sec", "readable plates", "recall"], rows)
+
+
+def box_iou(a, b):
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def detection_parity(reference, detections, min_iou):
+    """Boxes of reference matched (IoU >= min_iou) in detections: (matched, total, mean IoU, same text)"""
+    matched, total, ious, same_text = 0, 0, [], 0
+    for ref_frame, frame in zip(reference, detections):
+        total += max(len(ref_frame), len(frame))
+        unmatched = list(frame)
+        for ref in ref_frame:
+            best = max(unmatched, key=lambda det: box_iou(ref[:4], det[:4]), default=None)
+            if best is None or box_iou(ref[:4], best[:4]) < min_iou:
+                continue
+            unmatched.remove(best)
+            matched += 1
+            ious.append(box_iou(ref[:4], best[:4]))
+            same_text += ref[4] == best[4]
+    return matched, total, (sum(ious) / len(ious) if ious else 0.0), same_text
+
+
+def bench_backend(args):
+    """Detector backends on CPU: load/export time, YOLO frames/sec and parity of detect_plates output"""
+    import main
+    from detector_backend import load_detector
+
+    frames = load_frames(args.video, args.frames)
+    rows = []
+    failures = []
+    reference = None
+    for backend in args.backends:
+        start = time.perf_counter()
+        try:
+            model = load_detector(main.YOLO_MODEL_PATH, backend, fallback=False)
+        except Exception as e:
+            print(f"[WARN] {backend} backend unavailable: {e}")
+            rows.append([backend, "-", "-", "-", "-", "-"])
+            continue
+        load_seconds = time.perf_counter() - start
+        model(frames[:args.batch_size], verbose=False)  # warm-up
+
+        start = time.perf_counter()
+        for i in range(0, len(frames), args.batch_size):
+            model(frames[i:i + args.batch_size], verbose=False)
+        fps = len(frames) / (time.perf_counter() - start)
+
+        # detect_plates output (boxes, OCR text) with this backend, against the first backend
+        main.set_models(yolo=model)
+        detections = []
+        for i in range(0, len(frames), args.batch_size):
+            detections += main.detect_plates_batch(frames[i:i + args.batch_size])
+        if reference is None:
+            reference = detections
+        matched, total, mean_iou, same_text = detection_parity(reference, detections, args.min_iou)
+        rows.append([backend, f"{load_seconds:.1f}", f"{fps:.2f}", f"{matched}/{total}", f"{mean_iou:.3f}",
+                     f"{same_text}/{matched}"])
+        if total and matched / total < args.min_matched:
+            failures.append(f"{backend}: {matched}/{total} boxes matched (need {args.min_matched:.0%})")
+        if matched and same_text / matched < args.min_same_text:
+            failures.append(f"{backend}: same text for {same_text}/{matched} boxes (need {args.min_same_text:.0%})")
+
+    print(f"\n[BENCH] detector backends on {len(frames)} frames of {args.video}, "
+          f"batch {args.batch_size} (parity vs {args.backends[0]})")
+    print_table(["backend", "load s", "YOLO frames/sec", "boxes matched", "mean IoU", "same text"], rows)
+    if failures:
+        raise SystemExit("[ERROR] backend parity below tolerance:\n  " + "\n  ".join(failures))
+
+
+def bench_cameras(args):
+    """N replayed copies of one video as cameras sharing one inference engine"""
+    from camera_supervisor import CameraSupervisor
+
+    rows = []
+    for count in args.cameras:
+        with tempfile.TemporaryDirectory() as tmp:
+            supervisor = CameraSupervisor(tmp)
+            for i in range(count):
+                supervisor.add(args.video, f"cam{i + 1}", replay=True, output_mode="none")
+            supervisor.wait(args.seconds)
+            supervisor.stop()
+            stats = supervisor.stats()
+        cameras = stats['cameras']
+        processed = sum(c['frames_processed'] for c in cameras)
+        read = sum(c['frames_read'] for c in cameras)
+        rows.append([count, f"{stats['processed_fps']:.1f}", f"{processed}/{read}",
+                     f"{stats['engine']['avg_batch_size']:.2f}",
+                     f"{max(c['avg_lag_ms'] for c in cameras):.0f}", f"{max(c['max_lag_ms'] for c in cameras):.0f}"])
+
+    print(f"\n[BENCH] cameras replaying {args.video} for up to {args.seconds}s")
+    print_table(["cameras", "total fps", "processed/read", "avg batch", "worst avg lag ms", "max lag ms"], rows)
+
+
+def bench_profile(args):
+    """Per-stage p50/p95 latency, end-to-end frames/sec, peak RSS and model load time, saved as JSON"""
+    if args.stubs:
+        os.environ['MODEL_STUBS'] = '1'  # read when main is imported
+    start = time.perf_counter()
+    import main
+    import_seconds = time.perf_counter() - start
+    from result_cache import PIPELINE_SETTINGS
+
+    main.warm_up()  # model load time is recorded in main.model_load_seconds
+
+    if args.video:
+        frames = load_frames(args.video, args.frames + args.warmup)
+        workload = {'video': os.path.basename(args.video)}
+    else:
+        frames = synthetic_traffic(random.Random(args.seed), args.frames + args.warmup, args.width, args.height)
+        workload = {'synthetic': True, 'seed': args.seed}
+    workload.update(frames=len(frames) - args.warmup, warmup=args.warmup,
+                    width=frames[0].shape[1], height=frames[0].shape[0])
+
+    stages = ['enhance_image', 'detect', 'recognize_plate', 'add_detection', 'annotate_frame', 'encode']
+    timings = {stage: [] for stage in stages + ['frame']}
+    tracker = main.VehicleTracker()
+    classifier = main.ConditionClassifier()
+    resizer = main.default_resizer()
+    clock = time.perf_counter
+    with tempfile.TemporaryDirectory() as tmp:
+        out = main.VideoOutput(os.path.join(tmp, "profile.mp4"), 25, (frames[0].shape[1], frames[0].shape[0]),
+                               mode=args.output)
+        for i, frame in enumerate(frames):
+            if i == args.warmup:
+                timings = {stage: [] for stage in timings}
+                tracker = main.VehicleTracker()
+                started = clock()
+            frame = frame.copy()  # annotate_frame draws in place
+            t0 = clock()
+            frame, condition = main.enhance_image(frame, classifier)
+            t1 = clock()
+            # The YOLO half of detect_plates (the OCR half is timed per crop below)
+            if resizer is not None:
+                inference_frame = resizer.resize(frame)
+                xyxys = main.get_yolo()([inference_frame], verbose=False, imgsz=resizer.size)[0].boxes.xyxy.cpu().numpy()
+                boxes = [resizer.to_frame(xyxy) for xyxy in xyxys]
+                resizer.release([inference_frame])
+            else:
+                xyxys = main.get_yolo()([frame], verbose=False)[0].boxes.xyxy.cpu().numpy()
+                boxes = [tuple(map(int, xyxy)) for xyxy in xyxys]
+            t2 = clock()
+            timings['detect'].append(t2 - t1)
+            detections = []
+            for (x1, y1, x2, y2) in boxes:
+                t = clock()
+                text = main.recognize_plate(frame[y1:y2, x1:x2])
+                timings['recognize_plate'].append(clock() - t)
+                detections.append((x1, y1, x2, y2, text, 0.0))
+            for (x1, y1, x2, y2, text, confidence) in detections:
+                t = clock()
+                tracker.add_detection(text, main.format_timestamp(i, 25), (x1, y1, x2, y2), confidence)
+                timings['add_detection'].append(clock() - t)
+            t3 = clock()
+            annotated = main.annotate_frame(frame, detections, extra_text=condition)
+            t4 = clock()
+            out.write(annotated)
+            t5 = clock()
+            timings['enhance_image'].append(t1 - t0)
+            timings['annotate_frame'].append(t4 - t3)
+            timings['encode'].append(t5 - t4)
+            timings['frame'].append(t5 - t0)
+        elapsed = clock() - started
+        out.release()
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'model_stubs': main.MODEL_STUBS,
+        'settings': {name: os.environ[name] for name in PIPELINE_SETTINGS if name in os.environ},
+        'workload': workload,
+        'model_load_seconds': {name: round(seconds, 3) for name, seconds in main.model_load_seconds.items()},
+        'import_seconds': round(import_seconds, 3),
+        'stages': {stage: latency_summary(samples) for stage, samples in timings.items()},
+        'fps': round(workload['frames'] / elapsed, 2),
+        'peak_rss_mb': peak_rss_mb(),
+        'vehicles': len(tracker.vehicles),
+        'ocr_cache': main.ocr_cache.stats(),
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    def change(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if old else "-"
+
+    rows = []
+    for stage, summary in report['stages'].items():
+        row = [stage, summary['count'], f"{summary['p50_ms']:.2f}", f"{summary['p95_ms']:.2f}",
+               f"{summary['total_s']:.2f}"]
+        if baseline is not None:
+            old = baseline['stages'].get(stage)
+            row += [change(summary['p50_ms'], old['p50_ms']) if old else "-",
+                    change(summary['p95_ms'], old['p95_ms']) if old else "-"]
+        rows.append(row)
+    headers = ["stage", "calls", "p50 ms", "p95 ms", "total s"] + (["p50 vs base", "p95 vs base"] if baseline else [])
+
+    source = workload.get('video', 'synthetic frames')
+    print(f"\n[BENCH] profile of {workload['frames']} frames ({workload['width']}x{workload['height']}, {source})"
+          f"{' with stub models' if main.MODEL_STUBS else ''}")
+    print_table(headers, rows)
+    loads = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in report['model_load_seconds'].items())
+    vs_base = f" ({change(report['fps'], baseline['fps'])} vs base)" if baseline else ""
+    print(f"end-to-end {report['fps']} frames/sec{vs_base}, "
+          f"peak RSS {report['peak_rss_mb']} MB, model load {loads}, import main {report['import_seconds']:.2f}s")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"[DONE] Report written to {args.report}")
+
+
+def bench_import(args):
+    """Time `import main` in fresh interpreters; fails if it loads a model or exceeds --max-seconds"""
+    import sys
+
+    code = ("import time; t = time.perf_counter(); import main; t = time.perf_counter() - t; "
+            "print(t, main._yolo is not None or main._ocr is not None)")
+    repo = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    for _ in range(args.repeat):
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=repo)
+        if result.returncode:
+            raise SystemExit(f"[ERROR] import main failed:\n{result.stderr}")
+        seconds, loaded = result.stdout.split()[-2:]
+        if loaded == "True":
+            raise SystemExit("[ERROR] importing main loaded a model; models must load on first use")
+        times.append(float(seconds))
+
+    # Slowest imported modules by cumulative time (python -X importtime)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], capture_output=True,
+                            text=True, cwd=repo)
+    modules = []
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            modules.append((int(parts[1]), parts[2].strip()))
+    top = [m for m in sorted(modules, reverse=True) if m[1] != "main"][:args.top]
+
+    best, median = min(times), sorted(times)[len(times) // 2]
+    print(f"\n[BENCH] import main over {args.repeat} fresh interpreters (bound {args.max_seconds}s)")
+    print_table(["best s", "median s", "worst s"], [[f"{best:.3f}", f"{median:.3f}", f"{max(times):.3f}"]])
+    print_table(["module", "cumulative ms"], [[name, f"{us / 1000:.1f}"] for us, name in top])
+    if median > args.max_seconds:
+        raise SystemExit(f"[ERROR] import main took {median:.3f}s (median), over the {args.max_seconds}s bound")
+
+
+def bench_ocrcache(args):
+    """Repeated plate crops must hit the OCR cache (near-duplicates too unless --max-diff 0); different plates
+    must never get another plate's text"""
+    import main
+
+    rng = random.Random(args.seed)
+    nrng = np.random.default_rng(args.seed)
+    max_diff = main.OCR_CACHE_MAX_DIFF if args.max_diff is None else args.max_diff
+    cache = main.OCRCache(max_entries=args.plates, ttl=float('inf'), max_diff=max_diff)
+    plates = list(dict.fromkeys(random_plate(rng) for _ in range(args.plates)))
+    for plate in plates:
+        cache.put(cache.fingerprint(render_plate(plate)), (plate, 0.95))
+
+    def variant(kind, plate):
+        """(true text, crop) of a lookup; the "same plate" kinds show the cached plate itself"""
+        if kind == "same plate, same pixels":
+            return plate, render_plate(plate)
+        if kind == "same plate, noise":
+            return plate, render_plate(plate, noise=4, nrng=nrng)
+        if kind == "same plate, brighter":
+            return plate, render_plate(plate, brightness=15)
+        if kind == "same plate, JPEG q70":
+            _, encoded = cv2.imencode('.jpg', render_plate(plate), [cv2.IMWRITE_JPEG_QUALITY, 70])
+            return plate, cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+        if kind == "one character changed":
+            i = rng.randrange(len(plate))
+            other = plate[:i] + rng.choice([c for c in string.ascii_uppercase + string.digits if c != plate[i]])
+            other += plate[i + 1:]
+        else:
+            other = random_plate(rng)
+        return other, render_plate(other)
+
+    near = "hit" if cache.max_diff > 0 else "miss"
+    kinds = {"same plate, same pixels": "hit", "same plate, noise": near, "same plate, brighter": near,
+             "same plate, JPEG q70": near, "one character changed": "miss", "other plate": "miss"}
+    rows = []
+    wrong = 0
+    missed = {}  # kind -> share of lookups that should have hit but missed
+    lookup_seconds = 0.0
+    for kind, expected in kinds.items():
+        hits = merged = 0
+        for plate in plates:
+            text, crop = variant(kind, plate)
+            start = time.perf_counter()
+            reading = cache.get(cache.fingerprint(crop))
+            lookup_seconds += time.perf_counter() - start
+            if reading is not None:
+                hits += 1
+                merged += reading[0] != text
+        wrong += merged
+        if expected == "hit":
+            missed[kind] = 1 - hits / len(plates)
+        rows.append([kind, expected, len(plates), f"{hits / len(plates):.0%}", merged])
+
+    lookups = len(plates) * len(kinds)
+    print(f"\n[BENCH] OCR cache with {len(plates)} cached plates (max diff {cache.max_diff} grey levels)")
+    print_table(["crops", "expected", "lookups", "hit rate", "wrong text"], rows)
+    print(f"lookup + fingerprint {lookup_seconds / lookups * 1e6:.0f} us/crop with a full cache")
+    if wrong:
+        raise SystemExit(f"[ERROR] {wrong} crops were given another plate's reading")
+    if missed["same plate, same pixels"]:
+        raise SystemExit("[ERROR] pixel-identical crops missed the cache")
+    too_low = [f"{kind} ({1 - share:.0%} hits)" for kind, share in missed.items() if share > 1 - args.min_near_hits]
+    if too_low:
+        raise SystemExit(f"[ERROR] near-duplicates below the {args.min_near_hits:.0%} hit rate: {', '.join(too_low)}")
+
+
+# === MAIN ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    detect_parser = subparsers.add_parser("detect", help="batched vs single-frame YOLO detection")
+    detect_parser.add_argument("--video", required=True)
+    detect_parser.add_argument("--frames", type=int, default=200)
+    detect_parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16])
+    detect_parser.set_defaults(func=bench_detect)
+
+    ocr_parser = subparsers.add_parser("ocr", help="batched vs per-crop plate OCR")
+    ocr_parser.add_argument("--video", required=True)
+    ocr_parser.add_argument("--frames", type=int, default=200)
+    ocr_parser.set_defaults(func=bench_ocr)
+
+    tracker_parser = subparsers.add_parser("tracker", help="indexed vs linear VehicleTracker matching")
+    tracker_parser.add_argument("--vehicles", type=int, default=10000)
+    tracker_parser.add_argument("--readings", type=int, default=3, help="readings per known vehicle")
+    tracker_parser.add_argument("--queries", type=int, default=100)
+    tracker_parser.add_argument("--seed", type=int, default=0)
+    tracker_parser.set_defaults(func=bench_tracker)
+
+    stream_parser = subparsers.add_parser("stream", help="continuous stream mode on a replayed file")
+    stream_parser.add_argument("--video", required=True)
+    stream_parser.add_argument("--target-fps", type=float, default=0)
+    stream_parser.add_argument("--max-latency", type=float, default=1.0)
+    stream_parser.set_defaults(func=bench_stream)
+
+    gating_parser = subparsers.add_parser("gating", help="motion-gated / strided inference vs every frame")
+    gating_parser.add_argument("--video", required=True)
+    gating_parser.add_argument("--frames", type=int, default=1000)
+    gating_parser.add_argument("--strides", type=int, nargs="+", default=[1, 2, 4])
+    gating_parser.set_defaults(func=bench_gating)
+
+    enhance_parser = subparsers.add_parser("enhance", help="per-frame enhancement cost at 1080p")
+    enhance_parser.add_argument("--frames", type=int, default=50)
+    enhance_parser.add_argument("--width", type=int, default=1920)
+    enhance_parser.add_argument("--height", type=int, default=1080)
+    enhance_parser.set_defaults(func=bench_enhance)
+
+    roi_parser = subparsers.add_parser("roi", help="full-frame vs plate-crop enhancement")
+    roi_parser.add_argument("--video", required=True)
+    roi_parser.add_argument("--frames", type=int, default=1000)
+    roi_parser.add_argument("--truth", help="text file with one expected plate per line")
+    roi_parser.set_defaults(func=bench_roi)
+
+    chunks_parser = subparsers.add_parser("chunks", help="one long video split over 1..N processes")
+    chunks_parser.add_argument("--video", required=True)
+    chunks_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    chunks_parser.add_argument("--min-seconds", type=float, default=10.0)
+    chunks_parser.set_defaults(func=bench_chunks)
+
+    io_parser = subparsers.add_parser("io", help="decode backends, decode downscaling and output modes")
+    io_parser.add_argument("--video", required=True)
+    io_parser.add_argument("--frames", type=int, default=500)
+    io_parser.add_argument("--backends", nargs="+", default=["opencv", "pyav"])
+    io_parser.add_argument("--max-widths", type=int, nargs="+", default=[0], help="YOLO input widths; 0 keeps the full resolution")
+    io_parser.add_argument("--outputs", nargs="+", default=["full", "preview", "none"])
+    io_parser.set_defaults(func=bench_io)
+
+    resolution_parser = subparsers.add_parser("resolution", help="YOLO inference size vs throughput and recall")
+    resolution_parser.add_argument("--video", required=True)
+    resolution_parser.add_argument("--frames", type=int, default=1000)
+    resolution_parser.add_argument("--sizes", type=int, nargs="+", default=[0, 1280, 960, 640, 480, 320])
+    resolution_parser.add_argument("--truth", help="text file with one expected plate per line")
+    resolution_parser.set_defaults(func=bench_resolution)
+
+    backend_parser = subparsers.add_parser("backend", help="PyTorch vs ONNX Runtime vs OpenVINO detector")
+    backend_parser.add_argument("--video", required=True)
+    backend_parser.add_argument("--frames", type=int, default=200)
+    backend_parser.add_argument("--batch-size", type=int, default=8)
+    backend_parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "openvino"])
+    backend_parser.add_argument("--min-iou", type=float, default=0.9, help="IoU for a box to count as the same")
+    backend_parser.add_argument("--min-matched", type=float, default=0.98,
+                                help="fail when a backend matches a smaller fraction of the reference boxes")
+    backend_parser.add_argument("--min-same-text", type=float, default=0.95,
+                                help="fail when a smaller fraction of matched boxes gets the same OCR text")
+    backend_parser.set_defaults(func=bench_backend)
+
+    cameras_parser = subparsers.add_parser("cameras", help="several cameras sharing one inference engine")
+    cameras_parser.add_argument("--video", required=True)
+    cameras_parser.add_argument("--cameras", type=int, nargs="+", default=[1, 4, 8])
+    cameras_parser.add_argument("--seconds", type=float, default=30)
+    cameras_parser.set_defaults(func=bench_cameras)
+
+    profile_parser = subparsers.add_parser("profile", help="per-stage latency, fps, peak RSS and model load as JSON")
+    profile_parser.add_argument("--video", help="sample video (default: synthetic frames)")
+    profile_parser.add_argument("--frames", type=int, default=300)
+    profile_parser.add_argument("--warmup", type=int, default=5, help="frames run before timing starts")
+    profile_parser.add_argument("--width", type=int, default=1280, help="synthetic frame width")
+    profile_parser.add_argument("--height", type=int, default=720, help="synthetic frame height")
+    profile_parser.add_argument("--seed", type=int, default=0)
+    profile_parser.add_argument("--output", default="full", help="video output mode timed as the encode stage")
+    profile_parser.add_argument("--stubs", action="store_true", help="stand-in models (MODEL_STUBS=1)")
+    profile_parser.add_argument("--report", default="profile.json", help="JSON report path ('' to skip)")
+    profile_parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    profile_parser.set_defaults(func=bench_profile)
+
+    import_parser = subparsers.add_parser("import", help="time to import main without loading models")
+    import_parser.add_argument("--repeat", type=int, default=5)
+    import_parser.add_argument("--max-seconds", type=float, default=1.0, help="fail when the median is slower")
+    import_parser.add_argument("--top", type=int, default=8, help="slowest imported modules to list")
+    import_parser.set_defaults(func=bench_import)
+
+    ocrcache_parser = subparsers.add_parser("ocrcache", help="OCR cache hit rate and no merging of different plates")
+    ocrcache_parser.add_argument("--plates", type=int, default=300)
+    ocrcache_parser.add_argument("--seed", type=int, default=0)
+    ocrcache_parser.add_argument("--max-diff", type=int, default=None,
+                                 help="grey levels near-duplicates may differ by (default OCR_CACHE_MAX_DIFF, "
+                                      "0 = pixel-identical only)")
+    ocrcache_parser.add_argument("--min-near-hits", type=float, default=0.95,
+                                 help="hit rate each near-duplicate kind must reach when max diff > 0")
+    ocrcache_parser.set_defaults(func=bench_ocrcache)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,405 @@
+"""Many camera streams processed at once with one shared inference engine.
+
+Every camera runs in its own thread with its own LatestFrameReader, condition
+classifier, plate/vehicle trackers, output and statistics. Instead of calling YOLO
+and PaddleOCR itself, a camera hands its newest frame to the InferenceEngine. The
+engine collects frames from all cameras into one batch (up to DETECT_BATCH_SIZE,
+waiting at most CAMERA_BATCH_WAIT seconds) and runs detect_plates_batch over it.
+A camera waits only for its own frame. Frames that arrive meanwhile are dropped
+by its reader, so a slow or broken camera never holds up the others. Live
+sources that fail or stop are reopened after CAMERA_RECONNECT_DELAY seconds.
+
+The Flask app runs the supervisor in a separate process (see
+worker_pool.CameraSupervisorProcess), so the models are loaded there and not in
+the web server.
+
+Usage (local files stand in for cameras and are paced at their native FPS):
+  python camera_supervisor.py cam1.mp4 cam2.mp4 rtsp://host/stream --seconds 60
+"""
+import os
+import csv
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import Future
+
+import main
+import metrics
+from main import (VehicleTracker, PlateTracker, ConditionClassifier, InferenceResizer, detect_plates_batch,
+                  enhance_image, normalize_image, annotate_frame, format_timestamp)
+from stream_reader import LatestFrameReader
+from video_io import VideoOutput
+from detection_store import get_detection_store, timestamp_seconds, VehicleRecorder
+
+# === CONFIGURATION ===
+CAMERA_BATCH_WAIT = float(os.environ.get('CAMERA_BATCH_WAIT', 0.02))  # seconds the engine waits to fill a batch
+CAMERA_RECONNECT_DELAY = float(os.environ.get('CAMERA_RECONNECT_DELAY', 5))  # seconds before reopening a live source
+CAMERA_READ_TIMEOUT = float(os.environ.get('CAMERA_READ_TIMEOUT', 10))  # seconds without a frame before reconnecting
+CAMERA_OUTPUT = os.environ.get('CAMERA_OUTPUT', 'none')  # output mode per camera: 'full', 'preview' or 'none'
+MAX_CAMERAS = int(os.environ.get('MAX_CAMERAS', 64))
+
+
+# === Shared Inference ===
+class InferenceEngine:
+    """One thread running detection and OCR for frames submitted by any camera"""
+    def __init__(self, batch_size=main.DETECT_BATCH_SIZE, max_wait=CAMERA_BATCH_WAIT, inference_size=main.INFERENCE_SIZE):
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.inference_size = inference_size
+        self._requests = queue.Queue()
+        self._resizers = {}  # frame shape -> InferenceResizer
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.frames = 0
+        self.errors = 0
+        main.warm_up()  # load the shared models before the first camera's frame arrives
+        self._thread = threading.Thread(target=self._run, name="inference-engine", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame, plate_tracker, crop_frame=None, condition=None):
+        """Queue one frame; the Future resolves to its list of (x1, y1, x2, y2, text, confidence)"""
+        future = Future()
+        self._requests.put((frame, plate_tracker, crop_frame, condition, future))
+        return future
+
+    def _next_batch(self):
+        request = self._requests.get()
+        if request is None:
+            return None
+        batch = [request]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                request = self._requests.get(timeout=remaining) if remaining > 0 else self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                self._requests.put(None)  # stop after this batch
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            # Cameras differ in resolution; a resizer (and so a YOLO call) serves one frame size
+            groups = {}
+            for request in batch:
+                groups.setdefault(request[0].shape, []).append(request)
+            for shape, requests in groups.items():
+                self._detect(shape, requests)
+            with self._stats_lock:
+                self.batches += 1
+                self.frames += len(batch)
+
+    def _detect(self, shape, requests):
+        frames, trackers, crop_frames, conditions, futures = zip(*requests)
+        resizer = None
+        if self.inference_size:
+            resizer = self._resizers.get(shape)
+            if resizer is None:
+                resizer = self._resizers[shape] = InferenceResizer(self.inference_size)
+        try:
+            results = detect_plates_batch(list(frames), crop_frames=None if crop_frames[0] is None else list(crop_frames),
+                                          conditions=None if conditions[0] is None else list(conditions),
+                                          resizer=resizer, plate_trackers=list(trackers))
+        except Exception as e:
+            with self._stats_lock:
+                self.errors += 1
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future, detections in zip(futures, results):
+            future.set_result(detections)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'batches': self.batches,
+                'frames': self.frames,
+                'avg_batch_size': round(self.frames / self.batches, 2) if self.batches else 0.0,
+                'errors': self.errors,
+                'queued': self._requests.qsize(),
+            }
+
+    def stop(self):
+        self._requests.put(None)
+        self._thread.join(timeout=30)
+
+
+# === Cameras ===
+class Camera:
+    """One camera source with its own reader, trackers, output and statistics"""
+    def __init__(self, camera_id, source, engine, output_dir, target_fps=main.STREAM_TARGET_FPS,
+                 max_latency=main.STREAM_MAX_LATENCY, replay=None, output_mode=CAMERA_OUTPUT,
+                 reconnect_delay=CAMERA_RECONNECT_DELAY, read_timeout=CAMERA_READ_TIMEOUT):
+        self.camera_id = camera_id
+        self.source = source
+        self.engine = engine
+        self.output_dir = os.path.join(output_dir, camera_id)
+        self.target_fps = target_fps
+        self.max_latency = max_latency
+        self.replay = os.path.isfile(str(source)) if replay is None else replay
+        self.output_mode = output_mode
+        self.reconnect_delay = reconnect_delay
+        self.read_timeout = read_timeout
+
+        self.tracker = VehicleTracker()
+        self.plate_tracker = PlateTracker()
+        self.classifier = ConditionClassifier()
+        self.out = None
+        self.status = 'starting'
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.frames_processed = 0
+        self.frames_stale = 0
+        self.frames_failed = 0
+        self.reconnects = 0
+        self._reader = None  # reader of the current connection
+        self._recorder = None  # writes vehicles to the detection store while the camera runs
+        self._lag_total = 0.0
+        self._lag_max = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"camera-{camera_id}", daemon=True)
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._thread.start()
+        return self
+
+    def stop(self, wait=True):
+        self._stop.set()
+        if wait:
+            self._thread.join()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    def _run(self):
+        csv_path = os.path.join(self.output_dir, "vehicle_log.csv")
+        frame_offset = 0  # keeps video timestamps increasing across reconnects
+        store = get_detection_store()
+        self._recorder = VehicleRecorder(store, self.camera_id) if store else None
+        try:
+            with open(csv_path, mode='w', newline='') as csvfile:
+                csv_writer = csv.writer(csvfile)
+                csv_writer.writerow(["Video Timestamp", "Plates Detected", "Vehicle Count", "Condition"])
+                while not self._stop.is_set():
+                    reader = LatestFrameReader(self.source, replay=self.replay)
+                    if reader.is_opened():
+                        self.status = 'running'
+                        try:
+                            frame_offset = self._process(reader.start(), csv_writer, csvfile, frame_offset)
+                        except Exception as e:
+                            self.error = str(e)
+                            print(f"[WARN] Camera {self.camera_id}: {e}")
+                        finally:
+                            reader.stop()
+                            self.frames_read += reader.frames_read
+                            self.frames_dropped += reader.frames_dropped
+                            metrics.FRAMES_DROPPED.inc(reader.frames_dropped, source='camera', reason='behind')
+                            self._reader = None
+                    else:
+                        self.error = f"Could not open {self.source}"
+                    if self._stop.is_set():
+                        break
+                    if self.replay:  # a file stand-in ends like a recording does
+                        self.status = 'finished' if self.frames_read else 'failed'
+                        return
+                    self.status = 'reconnecting'
+                    self.reconnects += 1
+                    print(f"[WARN] Camera {self.camera_id} lost ({self.error or 'stream ended'}); "
+                          f"reconnecting in {self.reconnect_delay}s")
+                    self._stop.wait(self.reconnect_delay)
+            self.status = 'stopped'
+        finally:
+            self.finished_at = time.time()
+            if self.out is not None:
+                self.out.release()
+            if self._recorder is not None:
+                self._recorder.finish(self.tracker, self.classifier.condition)
+            print(f"[DONE] Camera {self.camera_id}: {self.frames_processed} frames, "
+                  f"{len(self.tracker.vehicles)} unique vehicles")
+
+    def _process(self, reader, csv_writer, csvfile, frame_offset):
+        """Feed the newest frames to the engine until the source ends or the camera is stopped"""
+        fps = reader.fps
+        if self.out is None:
+            out_path = os.path.join(self.output_dir, f"annotated_{self.camera_id}.mp4")
+            self.out = VideoOutput(out_path, self.target_fps or fps, (reader.width, reader.height), self.output_mode,
+                                   name=self.camera_id)
+        self._reader = reader
+        next_frame = frame_offset
+        while not self._stop.is_set():
+            item = reader.read(timeout=self.read_timeout)
+            if item is None:
+                if not reader.finished:
+                    self.error = f"No frame for {self.read_timeout}s"
+                break
+            frame_num, frame, captured_at = item
+            frame_num += frame_offset
+            next_frame = frame_num + 1
+            started = time.monotonic()
+            if started - captured_at > self.max_latency:
+                self.frames_stale += 1
+                metrics.FRAMES_DROPPED.inc(source='camera', reason='stale')
+                continue
+
+            if main.ENHANCE_MODE == "roi":
+                original = frame
+                frame, condition = normalize_image(frame, self.classifier)
+                future = self.engine.submit(frame, self.plate_tracker, crop_frame=original, condition=condition)
+            else:
+                frame, condition = enhance_image(frame, self.classifier)
+                future = self.engine.submit(frame, self.plate_tracker)
+            try:
+                detections = future.result()
+            except Exception as e:  # the whole shared batch failed; carry on with the next frame
+                self.error = f"Inference failed: {e}"
+                self.frames_failed += 1
+                continue
+
+            annotated = annotate_frame(frame, detections, extra_text=condition) if self.out.write_frames else None
+            self.out.write(annotated)
+            video_ts = format_timestamp(frame_num, fps)
+            for (x1, y1, x2, y2, text, confidence) in detections:
+                if self.tracker.add_detection(text, video_ts, (x1, y1, x2, y2), confidence):
+                    csv_writer.writerow([video_ts, text, 1, condition])
+                    csvfile.flush()
+                    if annotated is None:
+                        annotated = annotate_frame(frame, detections, extra_text=condition)
+                    self.out.thumbnail(annotated, frame_num, text)
+            if self._recorder is not None:
+                self._recorder.update(self.tracker, timestamp_seconds(video_ts), condition)
+
+            lag = time.monotonic() - captured_at
+            self.frames_processed += 1
+            metrics.FRAMES.inc(source='camera')
+            metrics.CAMERA_LAG.observe(lag, source='camera')
+            self._lag_total += lag
+            self._lag_max = max(self._lag_max, lag)
+            if self.target_fps:
+                remaining = 1.0 / self.target_fps - (time.monotonic() - started)
+                if remaining > 0:
+                    self._stop.wait(remaining)
+        return next_frame
+
+    def stats(self):
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        reader = self._reader
+        return {
+            'camera_id': self.camera_id,
+            'source': self.source,
+            'status': self.status,
+            'error': self.error,
+            'frames_read': self.frames_read + (reader.frames_read if reader else 0),
+            'frames_processed': self.frames_processed,
+            'frames_dropped': self.frames_dropped + (reader.frames_dropped if reader else 0),
+            'frames_stale': self.frames_stale,
+            'frames_failed': self.frames_failed,
+            'processed_fps': round(self.frames_processed / elapsed, 2) if elapsed > 0 else 0.0,
+            'avg_lag_ms': round(1000 * self._lag_total / self.frames_processed, 1) if self.frames_processed else 0.0,
+            'max_lag_ms': round(1000 * self._lag_max, 1),
+            'reconnects': self.reconnects,
+            'vehicles': len(self.tracker.vehicles),
+            'output_dir': self.output_dir,
+            'thumbnails': len(self.out.thumbnails) if self.out is not None else 0,
+        }
+
+
+class CameraSupervisor:
+    """Adds, removes and reports on cameras sharing one InferenceEngine"""
+    def __init__(self, output_dir=os.path.join(main.OUTPUT_DIR, 'cameras'), max_cameras=MAX_CAMERAS, engine=None):
+        self.output_dir = output_dir
+        self.max_cameras = max_cameras
+        self.engine = engine or InferenceEngine()
+        self.cameras = {}
+        self._lock = threading.Lock()
+
+    def add(self, source, camera_id=None, **options):
+        """Start a camera; options are passed to Camera (target_fps, max_latency, replay, output_mode)"""
+        with self._lock:
+            if camera_id in self.cameras:
+                raise ValueError(f"Camera {camera_id} already exists")
+            if sum(camera.running for camera in self.cameras.values()) >= self.max_cameras:
+                raise OverflowError(f"At most {self.max_cameras} cameras can run at once")
+            camera_id = camera_id or f"cam{len(self.cameras) + 1}"
+            while camera_id in self.cameras:
+                camera_id += "_"
+            camera = Camera(camera_id, source, self.engine, self.output_dir, **options)
+            self.cameras[camera_id] = camera
+        print(f"[INFO] Camera {camera_id} started: {source}")
+        return camera.start()
+
+    def remove(self, camera_id):
+        with self._lock:
+            camera = self.cameras.pop(camera_id)
+        camera.stop()
+        return camera.stats()
+
+    def stats(self, camera_id=None):
+        if camera_id is not None:
+            return self.cameras[camera_id].stats()
+        cameras = [camera.stats() for camera in list(self.cameras.values())]
+        return {
+            'cameras': cameras,
+            'engine': self.engine.stats(),
+            'processed_fps': round(sum(c['processed_fps'] for c in cameras), 2),
+        }
+
+    def wait(self, timeout=None):
+        """Block until every camera finished (file sources) or timeout seconds passed"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for camera in list(self.cameras.values()):
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not camera.join(remaining):
+                return False
+        return True
+
+    def stop(self):
+        for camera in list(self.cameras.values()):
+            camera.stop(wait=False)
+        for camera in list(self.cameras.values()):
+            camera.join()
+        self.engine.stop()
+
+
+# === MAIN ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process several camera streams with one shared model")
+    parser.add_argument('sources', nargs='+', help="stream URLs or video files standing in for cameras")
+    parser.add_argument('--seconds', type=float, default=None, help="stop after this long (default: until files end)")
+    parser.add_argument('--target-fps', type=float, default=main.STREAM_TARGET_FPS)
+    parser.add_argument('--output', default=CAMERA_OUTPUT, help="output mode per camera: full, preview or none")
+    args = parser.parse_args()
+
+    supervisor = CameraSupervisor()
+    for source in args.sources:
+        supervisor.add(source, target_fps=args.target_fps, output_mode=args.output)
+    try:
+        supervisor.wait(args.seconds)
+    except KeyboardInterrupt:
+        pass
+    supervisor.stop()
+
+    stats = supervisor.stats()
+    print("\n[SUMMARY]")
+    for camera in stats['cameras']:
+        print(f"{camera['camera_id']}: {camera['status']}, {camera['frames_processed']} frames "
+              f"({camera['processed_fps']} fps), lag avg {camera['avg_lag_ms']}ms max {camera['max_lag_ms']}ms, "
+              f"{camera['vehicles']} vehicles")
+    engine = stats['engine']
+    print(f"Engine: {engine['frames']} frames in {engine['batches']} batches (avg {engine['avg_batch_size']}), "
+          f"total {stats['processed_fps']} fps")
@@ -0,0 +1,264 @@
+"""Chunked, resumable uploads streamed straight to disk.
+
+A client initialises an upload, PUTs numbered parts in any order (and again after
+a dropped connection), then completes it. Each part is streamed to its own file
+while its SHA-256 is computed. Parts are appended to the target file as soon as
+every earlier part is there, so the target always holds the contiguous prefix
+received so far. That lets a job start decoding a video before the last part has
+arrived (see stream_reader.GrowingFileCapture).
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+
+from stream_reader import UPLOADING_SUFFIX
+
+# === CONFIGURATION ===
+UPLOAD_CHUNK_SIZE = int(float(os.environ.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)))  # suggested part size
+MAX_CHUNKED_UPLOAD_SIZE = int(float(os.environ.get('MAX_CHUNKED_UPLOAD_SIZE', 20 * 1024 ** 3)))
+
+_BLOCK_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class ChunkedUploads:
+    def __init__(self, root, max_size=MAX_CHUNKED_UPLOAD_SIZE, chunk_size=UPLOAD_CHUNK_SIZE,
+                 max_chunk_size=None):
+        self.root = root
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.max_chunk_size = max_chunk_size
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._hashes = {}  # upload_id -> (parts hashed, running sha256 of the target file)
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, upload_id):
+        if not upload_id or any(c not in "0123456789abcdef-" for c in upload_id):
+            raise UploadError('Upload not found', 404)
+        return os.path.join(self.root, upload_id)
+
+    def _lock(self, upload_id):
+        with self._locks_lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _save(self, meta):
+        # Write then rename so a crash never leaves half a meta.json
+        path = os.path.join(self._dir(meta['upload_id']), 'meta.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(path + '.tmp', path)
+
+    def get(self, upload_id):
+        try:
+            with open(os.path.join(self._dir(upload_id), 'meta.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadError('Upload not found', 404)
+
+    def update(self, upload_id, **fields):
+        with self._lock(upload_id):
+            meta = self.get(upload_id)
+            meta.update(fields)
+            self._save(meta)
+        return meta
+
+    # === Upload lifecycle ===
+    def create(self, filename, size, chunk_size=None, sha256=None, target_path=None, **extra):
+        """Start an upload of `size` bytes. target_path (default inside the upload folder) is
+        the file the parts are assembled into; it is marked as growing until completion."""
+        size = int(size)
+        chunk_size = int(chunk_size or self.chunk_size)
+        if size <= 0:
+            raise UploadError('size must be positive')
+        if size > self.max_size:
+            raise UploadError(f'File too large (max {self.max_size} bytes)', 413)
+        if chunk_size <= 0 or (self.max_chunk_size and chunk_size > self.max_chunk_size):
+            raise UploadError(f'chunk_size must be between 1 and {self.max_chunk_size} bytes')
+
+        upload_id = str(uuid.uuid4())
+        upload_dir = self._dir(upload_id)
+        os.makedirs(os.path.join(upload_dir, 'parts'))
+        target_path = target_path or os.path.join(upload_dir, 'data')
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        open(target_path, 'wb').close()
+        open(target_path + UPLOADING_SUFFIX, 'w').close()
+
+        meta = {
+            'upload_id': upload_id,
+            'filename': filename,
+            'size': size,
+            'chunk_size': chunk_size,
+            'total_chunks': (size + chunk_size - 1) // chunk_size,
+            'sha256': sha256.lower() if sha256 else None,
+            'target_path': target_path,
+            'next_index': 0,  # parts below this are already appended to target_path
+            'pending': [],  # received parts waiting for an earlier one
+            'created_at': time.time(),
+            'completed': False,
+            **extra
+        }
+        self._save(meta)
+        return meta
+
+    def part_size(self, meta, index):
+        if index == meta['total_chunks'] - 1:
+            return meta['size'] - index * meta['chunk_size']
+        return meta['chunk_size']
+
+    def write_part(self, upload_id, index, stream, sha256=None):
+        """Stream part `index` from a file-like object to disk and append what became contiguous"""
+        meta = self.get(upload_id)
+        if meta['completed']:
+            raise UploadError('Upload already completed', 409)
+        if not 0 <= index < meta['total_chunks']:
+            raise UploadError(f"Part index must be between 0 and {meta['total_chunks'] - 1}")
+        expected = self.part_size(meta, index)
+
+        part_path = os.path.join(self._dir(upload_id), 'parts', str(index))
+        tmp_path = f"{part_path}.{threading.get_ident()}.tmp"
+        digest = hashlib.sha256()
+        received = 0
+        with open(tmp_path, 'wb') as f:
+            while True:
+                block = stream.read(min(_BLOCK_SIZE, expected + 1 - received))
+                if not block:
+                    break
+                received += len(block)
+                if received > expected:
+                    break
+                digest.update(block)
+                f.write(block)
+        if received != expected:
+            os.remove(tmp_path)
+            raise UploadError(f'Part {index} must be {expected} bytes, got {received}{"+" if received > expected else ""}')
+        if sha256 and digest.hexdigest() != sha256.lower():
+            os.remove(tmp_path)
+            raise UploadError(f'Part {index} failed the integrity check (SHA-256 mismatch)', 422)
+
+        with self._lock(upload_id):
+            meta = self.get(upload_id)
+            if index < meta['next_index'] or meta['completed']:
+                os.remove(tmp_path)  # a retry of a part that is already assembled
+                return meta
+            os.replace(tmp_path, part_path)
+            if index not in meta['pending']:
+                meta['pending'].append(index)
+            self._assemble(meta)
+            self._save(meta)
+        return meta
+
+    def _assemble(self, meta):
+        """Append parts to the target file while the next one in order is available"""
+        upload_id = meta['upload_id']
+        parts_dir = os.path.join(self._dir(upload_id), 'parts')
+        hashed, digest = self._hashes.get(upload_id, (0, hashlib.sha256()))
+        if not os.path.exists(os.path.dirname(meta['target_path'])):
+            raise UploadError('The job reading this upload has ended', 409)
+        with open(meta['target_path'], 'ab') as target:
+            while meta['next_index'] in meta['pending']:
+                part_path = os.path.join(parts_dir, str(meta['next_index']))
+                with open(part_path, 'rb') as part:
+                    for block in iter(lambda: part.read(_BLOCK_SIZE), b''):
+                        target.write(block)
+                        if hashed == meta['next_index']:
+                            digest.update(block)
+                if hashed == meta['next_index']:
+                    hashed += 1
+                os.remove(part_path)
+                meta['pending'].remove(meta['next_index'])
+                meta['next_index'] += 1
+        self._hashes[upload_id] = (hashed, digest)
+
+    def complete(self, upload_id):
+        """Check that every part arrived and the whole file matches the declared SHA-256"""
+        with self._lock(upload_id):
+            meta = self.get(upload_id)
+            if meta['completed']:
+                return meta
+            missing = self.missing(meta)
+            if missing:
+                raise UploadError(f'{len(missing)} parts missing, first: {missing[0]}', 409)
+            if os.path.getsize(meta['target_path']) != meta['size']:
+                raise UploadError('Assembled file size does not match', 422)
+
+            hashed, digest = self._hashes.pop(upload_id, (0, None))
+            if hashed != meta['total_chunks']:
+                # The running hash was lost (e.g. a server restart mid-upload); hash the file again
+                digest = hashlib.sha256()
+                with open(meta['target_path'], 'rb') as f:
+                    for block in iter(lambda: f.read(_BLOCK_SIZE), b''):
+                        digest.update(block)
+            actual = digest.hexdigest()
+            if meta['sha256'] and actual != meta['sha256']:
+                raise UploadError('File failed the integrity check (SHA-256 mismatch)', 422)
+
+            meta['sha256'] = actual
+            meta['completed'] = True
+            self._save(meta)
+            marker = meta['target_path'] + UPLOADING_SUFFIX
+            if os.path.exists(marker):
+                os.remove(marker)
+        return meta
+
+    def abort(self, upload_id):
+        """Drop an upload; a job reading it stops at the data received so far"""
+        meta = self.get(upload_id)
+        marker = meta['target_path'] + UPLOADING_SUFFIX
+        if os.path.exists(marker):
+            os.remove(marker)
+        self.remove(upload_id)
+        return meta
+
+    def remove(self, upload_id):
+        shutil.rmtree(self._dir(upload_id), ignore_errors=True)
+        self._hashes.pop(upload_id, None)
+        with self._locks_lock:
+            self._locks.pop(upload_id, None)
+
+    # === Status ===
+    def missing(self, meta):
+        return [i for i in range(meta['next_index'], meta['total_chunks']) if i not in meta['pending']]
+
+    def status(self, meta):
+        received = meta['next_index'] + len(meta['pending'])
+        return {
+            'upload_id': meta['upload_id'],
+            'filename': meta['filename'],
+            'size': meta['size'],
+            'chunk_size': meta['chunk_size'],
+            'total_chunks': meta['total_chunks'],
+            'received_chunks': received,
+            'contiguous_bytes': min(meta['next_index'] * meta['chunk_size'], meta['size']),
+            'missing': self.missing(meta)[:100],
+            'completed': meta['completed'],
+            'job_id': meta.get('job_id'),
+        }
+
+    def evict(self, max_age):
+        """Remove uploads not touched for max_age seconds (abandoned or already handed to a job)"""
+        cutoff = time.time() - max_age
+        removed = []
+        for upload_id in os.listdir(self.root):
+            meta_path = os.path.join(self.root, upload_id, 'meta.json')
+            try:
+                if os.path.getmtime(meta_path) >= cutoff:
+                    continue
+                meta = self.get(upload_id)
+            except (OSError, UploadError, ValueError):
+                continue
+            marker = meta['target_path'] + UPLOADING_SUFFIX
+            if os.path.exists(marker):
+                os.remove(marker)
+            self.remove(upload_id)
+            removed.append(upload_id)
+        return removed
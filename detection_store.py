@@ -0,0 +1,295 @@
+"""SQLite store for detection history.
+
+One row per unique vehicle per processed file or stream, written in batches. A file's
+vehicles are written as soon as the file is done; live streams and cameras write each
+vehicle from their processing loop once it has left the scene (see VehicleRecorder).
+The database runs in WAL mode so the Flask API can query it while inference workers
+are writing.
+
+Two clocks are stored: detected_at is the wall-clock time a row was written (ingest
+time), first_seen_s/last_seen_s are seconds into the source's video.
+
+Usage:
+    python detection_store.py import output/vehicle_log.csv [more.csv ...]
+"""
+import os
+import re
+import csv
+import sys
+import time
+import sqlite3
+import threading
+import contextlib
+
+# === CONFIGURATION ===
+DETECTION_DB = os.environ.get('DETECTION_DB', os.path.join('output', 'detections.db'))
+DETECTION_BATCH_SIZE = int(os.environ.get('DETECTION_BATCH_SIZE', 200))
+DETECTION_IDLE_SECONDS = float(os.environ.get('DETECTION_IDLE_SECONDS', 5))  # video time a live vehicle must be gone before it is written
+DETECTION_FLUSH_SECONDS = float(os.environ.get('DETECTION_FLUSH_SECONDS', 10))  # max wall time live rows stay buffered
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    plate TEXT NOT NULL,
+    plate_key TEXT NOT NULL,
+    first_seen TEXT,
+    last_seen TEXT,
+    first_seen_s REAL,
+    last_seen_s REAL,
+    detected_at REAL NOT NULL,
+    source TEXT,
+    job_id TEXT,
+    condition TEXT,
+    x1 INTEGER, y1 INTEGER, x2 INTEGER, y2 INTEGER,
+    confidence REAL
+);
+CREATE INDEX IF NOT EXISTS idx_detections_plate ON detections(plate_key, detected_at);
+CREATE INDEX IF NOT EXISTS idx_detections_time ON detections(detected_at);
+CREATE INDEX IF NOT EXISTS idx_detections_source ON detections(source, detected_at);
+CREATE INDEX IF NOT EXISTS idx_detections_seen ON detections(source, first_seen_s);
+CREATE INDEX IF NOT EXISTS idx_detections_job ON detections(job_id);
+CREATE TABLE IF NOT EXISTS imported_files (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    rows INTEGER NOT NULL
+);
+"""
+
+COLUMNS = ["plate", "plate_key", "first_seen", "last_seen", "first_seen_s", "last_seen_s", "detected_at",
+           "source", "job_id", "condition", "x1", "y1", "x2", "y2", "confidence"]
+
+_TIMESTAMP_RE = re.compile(r"^(\d+):(\d\d):(\d\d)\.(\d{3})$")
+
+
+def plate_key(plate):
+    """Same normalisation as VehicleTracker.clean_plate, used for exact plate lookups"""
+    if plate == "UNREADABLE":
+        return plate
+    return ''.join(c.upper() for c in plate if c.isalnum())
+
+
+def timestamp_seconds(timestamp):
+    """'HH:MM:SS.mmm' from format_timestamp -> seconds; None for image rows"""
+    match = _TIMESTAMP_RE.match(timestamp or "")
+    if not match:
+        return None
+    h, m, s, ms = map(int, match.groups())
+    return h * 3600 + m * 60 + s + ms / 1000
+
+
+class DetectionStore:
+    def __init__(self, path=DETECTION_DB, batch_size=DETECTION_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def connect(self):
+        """Short-lived connection that commits on success and is always closed"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # === Writes ===
+    def add(self, plate, first_seen=None, last_seen=None, source=None, job_id=None, condition=None,
+            box=None, confidence=None, detected_at=None):
+        """Buffer one record; it is written with the next batch"""
+        x1, y1, x2, y2 = box if box else (None, None, None, None)
+        row = (plate, plate_key(plate), first_seen, last_seen or first_seen,
+               timestamp_seconds(first_seen), timestamp_seconds(last_seen or first_seen),
+               detected_at or time.time(), source, job_id, condition, x1, y1, x2, y2, confidence)
+        with self._lock:
+            self._pending.append(row)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self.flush()
+
+    def add_vehicles(self, records, source=None, job_id=None, condition=None):
+        """Buffer VehicleTracker.get_vehicle_records() output for one file or stream"""
+        for record in records:
+            self.add(record['plate'], record['first_seen'], record['last_seen'], source=source, job_id=job_id,
+                     condition=condition, box=record.get('box'), confidence=record.get('confidence'))
+
+    def flush(self):
+        """Write all buffered records in a single transaction"""
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        with self.connect() as conn:
+            conn.executemany(f"INSERT INTO detections ({', '.join(COLUMNS)}) VALUES ({placeholders})", rows)
+        return len(rows)
+
+    def copy_job(self, from_job_id, job_id, source=None):
+        """Record the detections of an earlier job again for job_id (e.g. when its results were
+        served from the result cache), optionally under a new source; returns the row count"""
+        self.flush()
+        now = time.time()
+        replace = {'job_id': job_id, 'detected_at': now}
+        if source is not None:
+            replace['source'] = source
+        with self.connect() as conn:
+            rows = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM detections WHERE job_id = ? ORDER BY id",
+                                (from_job_id,)).fetchall()
+            copies = [tuple(replace.get(column, row[column]) for column in COLUMNS) for row in rows]
+            placeholders = ", ".join("?" for _ in COLUMNS)
+            conn.executemany(f"INSERT INTO detections ({', '.join(COLUMNS)}) VALUES ({placeholders})", copies)
+        return len(copies)
+
+    def import_csv(self, csv_path, job_id=None):
+        """Load an existing vehicle_log.csv; files already imported unchanged are skipped"""
+        path = os.path.abspath(csv_path)
+        mtime = os.path.getmtime(path)
+        with self.connect() as conn:
+            seen = conn.execute("SELECT mtime FROM imported_files WHERE path = ?", (path,)).fetchone()
+            # Jobs processed since the store existed were already written by the processing loop
+            recorded = job_id and conn.execute("SELECT 1 FROM detections WHERE job_id = ? LIMIT 1",
+                                               (job_id,)).fetchone()
+        if (seen and seen['mtime'] >= mtime) or recorded:
+            return 0
+
+        count = 0
+        with open(path, newline='') as csvfile:
+            for row in csv.DictReader(csvfile):
+                timestamp = row.get('Video Timestamp', '')
+                source = timestamp[len("Image: "):] if timestamp.startswith("Image: ") else path
+                # Image rows list every plate of the image in one comma-separated cell
+                for plate in (p.strip() for p in row.get('Plates Detected', '').split(',')):
+                    if plate:
+                        self.add(plate, timestamp, source=source, job_id=job_id,
+                                 condition=row.get('Condition'), detected_at=mtime)
+                        count += 1
+        self.flush()
+        with self.connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO imported_files (path, mtime, rows) VALUES (?, ?, ?)",
+                         (path, mtime, count))
+        return count
+
+    # === Queries ===
+    def find_plate(self, plate, limit=100):
+        """Sightings of a plate (exact match on the cleaned plate text), newest first"""
+        with self.connect() as conn:
+            rows = conn.execute("SELECT * FROM detections WHERE plate_key = ? ORDER BY detected_at DESC LIMIT ?",
+                                (plate_key(plate), limit)).fetchall()
+        return [dict(r) for r in rows]
+
+    def query(self, start=None, end=None, source=None, job_id=None, seen_from=None, seen_to=None,
+              limit=100, offset=0):
+        """Detections written in the wall-clock range [start, end) (epoch seconds, ingest time) and/or
+        first seen in [seen_from, seen_to) seconds into their video, optionally per source/job.
+
+        Video-time filters are ordered by first_seen_s and use the (source, first_seen_s)
+        index when a source is given; otherwise rows come in ingest order."""
+        clauses, params = [], []
+        for clause, value in [("detected_at >= ?", start), ("detected_at < ?", end),
+                              ("source = ?", source), ("job_id = ?", job_id),
+                              ("first_seen_s >= ?", seen_from), ("first_seen_s < ?", seen_to)]:
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        order = "first_seen_s, id" if seen_from is not None or seen_to is not None else "detected_at"
+        with self.connect() as conn:
+            rows = conn.execute(f"SELECT * FROM detections {where} ORDER BY {order} LIMIT ? OFFSET ?",
+                                params + [limit, offset]).fetchall()
+        return [dict(r) for r in rows]
+
+    def camera_counts(self, start=None, end=None):
+        """Number of vehicles per source (camera or uploaded file) written in the wall-clock range
+        [start, end), with the ingest-time span and the video-time span they were seen in"""
+        clauses, params = [], []
+        if start is not None:
+            clauses.append("detected_at >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("detected_at < ?")
+            params.append(end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self.connect() as conn:
+            rows = conn.execute(f"SELECT source, COUNT(*) AS vehicles, MIN(detected_at) AS first_detected_at, "
+                                f"MAX(detected_at) AS last_detected_at, MIN(first_seen_s) AS first_seen_s, "
+                                f"MAX(last_seen_s) AS last_seen_s FROM detections {where} "
+                                f"GROUP BY source ORDER BY vehicles DESC", params).fetchall()
+        return [dict(r) for r in rows]
+
+
+class VehicleRecorder:
+    """Writes a live source's vehicles to the store from its processing loop.
+
+    A vehicle is written once it has not been seen for idle_seconds of video time, so
+    its row already has its final last_seen; finish() writes the rest when the source
+    ends. Buffered rows are flushed at least every flush_seconds of wall time so the API
+    sees a running camera. A written vehicle that comes back is not written again.
+    """
+    def __init__(self, store, source, job_id=None, idle_seconds=DETECTION_IDLE_SECONDS,
+                 flush_seconds=DETECTION_FLUSH_SECONDS):
+        self.store = store
+        self.source = source
+        self.job_id = job_id
+        self.idle_seconds = idle_seconds
+        self.flush_seconds = flush_seconds
+        self._written = set()  # indexes into the tracker's vehicles
+        self._checked_at = None  # video time of the last check
+        self._flushed_at = time.monotonic()
+
+    def _write(self, index, record, condition):
+        self._written.add(index)
+        self.store.add(record['plate'], record['first_seen'], record['last_seen'], source=self.source,
+                       job_id=self.job_id, condition=condition, box=record.get('box'),
+                       confidence=record.get('confidence'))
+
+    def update(self, tracker, now_s, condition=None):
+        """Write the vehicles of a VehicleTracker that left the scene by video time now_s (seconds)"""
+        if self._checked_at is not None and now_s - self._checked_at < 1:
+            return
+        self._checked_at = now_s
+        for index, record in enumerate(tracker.get_vehicle_records()):
+            last_seen = timestamp_seconds(record['last_seen'])
+            if index not in self._written and last_seen is not None and now_s - last_seen >= self.idle_seconds:
+                self._write(index, record, condition)
+        if time.monotonic() - self._flushed_at >= self.flush_seconds:
+            self.store.flush()
+            self._flushed_at = time.monotonic()
+
+    def finish(self, tracker, condition=None):
+        """Write every vehicle not written yet; returns how many were written in total"""
+        for index, record in enumerate(tracker.get_vehicle_records()):
+            if index not in self._written:
+                self._write(index, record, condition)
+        self.store.flush()
+        return len(self._written)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_detection_store(path=DETECTION_DB):
+    """Process-wide store for path, created on first use; None when DETECTION_DB is empty"""
+    if not path:
+        return None
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = DetectionStore(path)
+        return _stores[path]
+
+
+# === MAIN ===
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "import":
+        print(__doc__)
+        sys.exit(1)
+    store = get_detection_store()
+    for csv_path in sys.argv[2:]:
+        print(f"[IMPORT] {csv_path}: {store.import_csv(csv_path)} records")
@@ -0,0 +1,82 @@
+"""Plate detector loading for PyTorch, ONNX Runtime and OpenVINO.
+
+With DETECTOR_BACKEND=onnx or openvino the YOLO weights are exported once with
+ultralytics' exporter and the result is cached under DETECTOR_CACHE_DIR, keyed by
+the weights' SHA-256 and the export options. Later starts load the cached model
+directly. The exported model is wrapped by the same ultralytics YOLO class, so
+results (and detect_plates output) keep the PyTorch format. If the runtime or the
+export is not available, the PyTorch model is used with a warning.
+"""
+import os
+import shutil
+import tempfile
+
+from ultralytics import YOLO
+
+from result_cache import weights_sha256
+
+# === CONFIGURATION ===
+YOLO_MODEL_PATH = os.environ.get("YOLO_MODEL_PATH", "best.pt")
+DEVICE = os.environ.get('DEVICE', 'cpu')
+DETECTOR_BACKEND = os.environ.get('DETECTOR_BACKEND', 'torch')  # 'torch', 'onnx' or 'openvino'
+DETECTOR_CACHE_DIR = os.environ.get('DETECTOR_CACHE_DIR', os.path.join('cache', 'models'))
+DETECTOR_IMGSZ = int(os.environ.get('DETECTOR_IMGSZ', os.environ.get('INFERENCE_SIZE', 0)) or 640)
+DETECTOR_INT8 = os.environ.get('DETECTOR_INT8', '0') == '1'  # OpenVINO only; needs DETECTOR_INT8_DATA
+DETECTOR_INT8_DATA = os.environ.get('DETECTOR_INT8_DATA', '')  # dataset YAML used to calibrate INT8
+
+BACKENDS = ('torch', 'onnx', 'openvino')
+
+
+def export_name(weights, backend, imgsz=DETECTOR_IMGSZ, int8=False):
+    """Cache entry name; changes whenever the weights or the export options do"""
+    precision = 'int8' if int8 else 'fp32'
+    return f"{weights_sha256(weights)[:16]}_{imgsz}_{precision}_{backend}"
+
+
+def export_model(weights=YOLO_MODEL_PATH, backend=DETECTOR_BACKEND, imgsz=DETECTOR_IMGSZ, int8=DETECTOR_INT8,
+                 cache_dir=DETECTOR_CACHE_DIR):
+    """Path of the exported model, exporting it first if it is not cached yet"""
+    int8 = int8 and backend == 'openvino'
+    if int8 and not DETECTOR_INT8_DATA:
+        print("[WARN] DETECTOR_INT8=1 needs DETECTOR_INT8_DATA (calibration dataset YAML); exporting FP32")
+        int8 = False
+    suffix = '.onnx' if backend == 'onnx' else ''
+    target = os.path.join(cache_dir, export_name(weights, backend, imgsz, int8) + suffix)
+    if os.path.exists(target):
+        return target
+
+    print(f"[INFO] Exporting {weights} to {backend} ({'INT8' if int8 else 'FP32'}, {imgsz}px), this runs once...")
+    os.makedirs(cache_dir, exist_ok=True)
+    # Export from a private copy: the exporter writes next to the weights, and
+    # concurrent workers must not see each other's half-written files
+    work_dir = tempfile.mkdtemp(prefix='.export-', dir=cache_dir)
+    try:
+        work_weights = os.path.join(work_dir, os.path.basename(weights))
+        shutil.copy2(weights, work_weights)
+        options = {'format': backend, 'imgsz': imgsz, 'dynamic': True}
+        if int8:
+            options.update(int8=True, data=DETECTOR_INT8_DATA)
+        exported = YOLO(work_weights).export(**options)
+        try:
+            os.rename(exported, target)
+        except OSError:
+            if not os.path.exists(target):  # another worker finished the same export first
+                raise
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"[INFO] Exported model cached at {target}")
+    return target
+
+
+def load_detector(weights=YOLO_MODEL_PATH, backend=DETECTOR_BACKEND, device=DEVICE, fallback=True):
+    """YOLO model for the chosen backend; falls back to PyTorch if export or loading fails"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown DETECTOR_BACKEND {backend!r}, expected one of {BACKENDS}")
+    if backend != 'torch':
+        try:
+            return YOLO(export_model(weights, backend), task='detect')
+        except Exception as e:
+            if not fallback:
+                raise
+            print(f"[WARN] Could not use the {backend} detector ({e}); using PyTorch")
+    return YOLO(weights).to(device)
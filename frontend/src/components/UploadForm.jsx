@@ -2,11 +2,88 @@ import React, { useState } from 'react';
 import axios from 'axios';
 import './UploadForm.css';
 
+// Resolves with the final job status; progress/vehicle events are passed to onUpdate.
+// Falls back to polling /api/status when EventSource is unavailable or the stream fails.
+const waitForJob = (jobId, onUpdate) => new Promise((resolve, reject) => {
+  const poll = async () => {
+    while (true) {
+      await new Promise(r => setTimeout(r, 1500));
+      const statusRes = await axios.get(`/api/status/${jobId}`);
+      const { status, progress, queue_position: position } = statusRes.data;
+      if (status !== 'processing' && status !== 'queued') {
+        resolve(statusRes.data);
+        return;
+      }
+      onUpdate({ progress: status === 'queued' ? `#${position} in queue` : progress });
+    }
+  };
+
+  if (typeof EventSource === 'undefined') {
+    poll().catch(reject);
+    return;
+  }
+  const source = new EventSource(`/api/events/${jobId}`);
+  let vehicles = 0;
+  source.addEventListener('progress', (e) => {
+    const data = JSON.parse(e.data);
+    if (data.frames_total) {
+      onUpdate({ progress: `${Math.round(100 * data.frames_done / data.frames_total)}%` });
+    }
+  });
+  source.addEventListener('vehicle', () => {
+    vehicles += 1;
+    onUpdate({ vehicles });
+  });
+  source.addEventListener('end', (e) => {
+    source.close();
+    resolve(JSON.parse(e.data));
+  });
+  source.onerror = () => {
+    source.close();
+    poll().catch(reject);
+  };
+});
+
+// Files above this go through the chunked upload API instead of one multipart request
+const CHUNKED_UPLOAD_THRESHOLD = 50 * 1024 * 1024;
+const CHUNK_SIZE = 8 * 1024 * 1024;
+const PART_RETRIES = 3;
+
+// Uploads the file in parts, skipping the ones the server already has, and returns the
+// same { job_id, queue_position } as /api/upload. Videos start processing while uploading.
+const uploadInChunks = async (file, outputMode, onUpdate) => {
+  const init = await axios.post('/api/uploads', {
+    filename: file.name,
+    size: file.size,
+    chunk_size: CHUNK_SIZE,
+    output: outputMode,
+    process_early: file.type.startsWith('video/'),
+  });
+  const { upload_id: uploadId, total_chunks: total } = init.data;
+  for (let index = 0; index < total; index++) {
+    const part = file.slice(index * CHUNK_SIZE, (index + 1) * CHUNK_SIZE);
+    for (let attempt = 1; ; attempt++) {
+      try {
+        await axios.put(`/api/uploads/${uploadId}/parts/${index}`, part, {
+          headers: { 'Content-Type': 'application/octet-stream' },
+        });
+        break;
+      } catch (err) {
+        if (attempt >= PART_RETRIES) throw err;
+      }
+    }
+    onUpdate({ progress: `uploading ${Math.round(100 * (index + 1) / total)}%` });
+  }
+  const res = await axios.post(`/api/uploads/${uploadId}/complete`);
+  return res.data;
+};
+
 const UploadForm = ({ onFileProcessed }) => {
   const [selectedFiles, setSelectedFiles] = useState([]);
   const [uploadQueue, setUploadQueue] = useState([]);
   const [streamURL, setStreamURL] = useState('');
   const [uploading, setUploading] = useState(false);
+  const [outputMode, setOutputMode] = useState('full');
 
   const handleFileChange = (e) => {
     const files = Array.from(e.target.files);
@@ -19,33 +96,40 @@ const UploadForm = ({ onFileProcessed }) => {
     setUploadQueue(selectedFiles.map(file => ({ name: file.name, status: 'pending' })));
 
     for (let file of selectedFiles) {
-      const formData = new FormData();
-      formData.append('file', file);
+      const update = (fields) =>
+        setUploadQueue(prev =>
+          prev.map(f =>
+            f.name === file.name ? { ...f, ...fields } : f
+          )
+        );
 
       try {
-        const res = await axios.post('/api/upload', formData);
-        const jobId = res.data.job_id;
+        let data;
+        if (file.size > CHUNKED_UPLOAD_THRESHOLD) {
+          update({ status: 'processing' });
+          data = await uploadInChunks(file, outputMode, update);
+        } else {
+          const formData = new FormData();
+          formData.append('file', file);
+          formData.append('output', outputMode);
+          data = (await axios.post('/api/upload', formData)).data;
+        }
+        const jobId = data.job_id;
+        const position = data.queue_position;
         setUploadQueue(prev =>
           prev.map(f =>
-            f.name === file.name ? { ...f, status: 'processing' } : f
+            f.name === file.name
+              ? { ...f, status: 'processing', progress: position ? `#${position} in queue` : null }
+              : f
           )
         );
-        // Poll for job status
-        let status = 'processing';
-        let outputFile = null;
-        while (status === 'processing') {
-          await new Promise(r => setTimeout(r, 1500));
-          const statusRes = await axios.get(`/api/status/${jobId}`);
-          status = statusRes.data.status;
-          if (status === 'completed') {
-            outputFile = statusRes.data.output_image || statusRes.data.output_video;
-            break;
-          } else if (status === 'failed' || status === 'timeout' || status === 'error') {
-            break;
-          }
-        }
-        if (outputFile) {
-          onFileProcessed(outputFile);
+        const result = data.status === 'completed' ? data : await waitForJob(jobId, update);
+        const outputFile = result.status === 'completed'
+          ? result.output_image || result.output_video
+          : null;
+        if (result.status === 'completed') {
+          // With output "none" a video job only produces its plate log and thumbnails
+          if (outputFile) onFileProcessed(outputFile);
           setUploadQueue(prev =>
             prev.map(f =>
               f.name === file.name ? { ...f, status: 'done' } : f
@@ -93,6 +177,11 @@ const UploadForm = ({ onFileProcessed }) => {
         accept="video/*,image/*"
         onChange={handleFileChange}
       />
+      <select value={outputMode} onChange={(e) => setOutputMode(e.target.value)}>
+        <option value="full">Full annotated video</option>
+        <option value="preview">Low-bitrate preview</option>
+        <option value="none">Plate log + thumbnails only</option>
+      </select>
       <button onClick={handleUpload} disabled={uploading}>
         {uploading ? 'Uploading...' : 'Upload & Detect'}
       </button>
@@ -104,6 +193,8 @@ const UploadForm = ({ onFileProcessed }) => {
             {uploadQueue.map((f, idx) => (
               <li key={idx} className={`status ${f.status}`}>
                 {f.name} — {f.status}
+                {f.status === 'processing' && f.progress && ` (${f.progress})`}
+                {f.vehicles > 0 && ` · ${f.vehicles} vehicle${f.vehicles === 1 ? '' : 's'}`}
               </li>
             ))}
           </ul>
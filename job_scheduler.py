@@ -0,0 +1,94 @@
+"""Bounded priority scheduler for processing jobs.
+
+A fixed number of runner threads take jobs from a priority queue, so at most
+MAX_CONCURRENT_JOBS jobs compete for the inference workers at a time and the
+rest wait in order: lower priority class first, then first come first served.
+"""
+import os
+import heapq
+import itertools
+import threading
+
+import worker_pool
+
+# === CONFIGURATION ===
+MAX_CONCURRENT_JOBS = int(os.environ.get('MAX_CONCURRENT_JOBS', worker_pool.INFERENCE_WORKERS))
+MAX_QUEUED_JOBS = int(os.environ.get('MAX_QUEUED_JOBS', 50))  # uploads beyond this are rejected
+
+# Lower runs first: live streams, then images, then videos
+PRIORITY_CLASSES = {'stream': 0, 'image': 1, 'video': 2}
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobScheduler:
+    def __init__(self, run, max_concurrent=MAX_CONCURRENT_JOBS, max_queued=MAX_QUEUED_JOBS):
+        """run(job_id, *args) is called in a runner thread for every job that is not cancelled first"""
+        self.run = run
+        self.max_concurrent = max(max_concurrent, 1)
+        self.max_queued = max_queued
+        self._queue = []  # heap of (priority, seq, job_id, args)
+        self._running = set()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def _start(self):
+        # Runner threads are started on the first submit so importing app.py stays cheap
+        if not self._threads:
+            for i in range(self.max_concurrent):
+                thread = threading.Thread(target=self._loop, name=f"job-runner-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, job_id, priority, *args):
+        """Queue a job; raises QueueFull when max_queued jobs are already waiting"""
+        with self._cond:
+            if self.max_queued and len(self._queue) >= self.max_queued:
+                raise QueueFull(f"{len(self._queue)} jobs already queued")
+            heapq.heappush(self._queue, (PRIORITY_CLASSES.get(priority, priority), next(self._seq), job_id, args))
+            self._start()
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue)
+                _, _, job_id, args = heapq.heappop(self._queue)
+                self._running.add(job_id)
+            try:
+                self.run(job_id, *args)
+            except Exception as e:
+                print(f"[ERROR] Job {job_id} failed: {e}")  # keep the runner thread alive
+            finally:
+                with self._cond:
+                    self._running.discard(job_id)
+
+    def position(self, job_id):
+        """1-based place of a waiting job in the queue, or None if it is not waiting"""
+        with self._cond:
+            for i, entry in enumerate(sorted(self._queue)):
+                if entry[2] == job_id:
+                    return i + 1
+        return None
+
+    def cancel(self, job_id):
+        """Drop a waiting job. Returns its args if it was queued, None otherwise"""
+        with self._cond:
+            for i, entry in enumerate(self._queue):
+                if entry[2] == job_id:
+                    self._queue.pop(i)
+                    heapq.heapify(self._queue)
+                    return entry[3]
+        return None
+
+    def is_running(self, job_id):
+        with self._cond:
+            return job_id in self._running
+
+    def stats(self):
+        with self._cond:
+            return {'running': len(self._running), 'queued': len(self._queue),
+                    'max_concurrent': self.max_concurrent, 'max_queued': self.max_queued}
@@ -1,14 +1,25 @@
 import os
+import io
+import hashlib
+import contextlib
 import cv2
 import numpy as np
-from ultralytics import YOLO
-from paddleocr import PaddleOCR
-from PIL import Image, ImageEnhance
 from pathlib import Path
 import logging
 import csv
 from collections import defaultdict
 import difflib
+import time
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pipeline import Pipeline
+from stream_reader import LatestFrameReader, UPLOADING_SUFFIX
+from video_io import open_capture, scaled_size, VideoOutput, VIDEO_OUTPUT
+from detection_store import get_detection_store, timestamp_seconds, VehicleRecorder
+import metrics
 
 # === CONFIGURATION ===
 YOLO_MODEL_PATH = os.environ.get("YOLO_MODEL_PATH", "best.pt")
@@ -16,24 +27,160 @@ VIDEO_DIR = os.environ.get("INPUT_DIR", "input")
 IMAGE_DIR = os.environ.get("INPUT_DIR", "input")
 OUTPUT_DIR = os.environ.get("OUTPUT_DIR", "output")
 DEVICE = os.environ.get('DEVICE', 'cpu')
+DETECT_BATCH_SIZE = int(os.environ.get('DETECT_BATCH_SIZE', 8))
+OCR_BATCH_SIZE = int(os.environ.get('OCR_BATCH_SIZE', 16))
+OCR_MIN_CONFIDENCE = float(os.environ.get('OCR_MIN_CONFIDENCE', 0))  # opt-in: lower readings become UNREADABLE
+OCR_CACHE_SIZE = int(os.environ.get('OCR_CACHE_SIZE', 1024))  # plate crops whose reading is remembered; 0 = off
+OCR_CACHE_TTL = float(os.environ.get('OCR_CACHE_TTL', 30))  # seconds a cached reading stays valid
+OCR_CACHE_MAX_DIFF = int(os.environ.get('OCR_CACHE_MAX_DIFF', 24))  # grey levels a near-duplicate crop may differ by; 0 = pixel-identical only
+PIPELINE_QUEUE_SIZE = int(os.environ.get('PIPELINE_QUEUE_SIZE', 4))  # frame batches buffered between stages
+INFERENCE_SIZE = int(os.environ.get('INFERENCE_SIZE', 0))  # YOLO input side in pixels; 0 = full frames, YOLO letterboxes
+DECODE_MAX_WIDTH = int(os.environ.get('DECODE_MAX_WIDTH', 0))  # video frames wider than this reach YOLO downscaled; 0 = off
+
+# Plate track / OCR scheduling
+TRACK_IOU_THRESHOLD = float(os.environ.get('TRACK_IOU_THRESHOLD', 0.3))
+TRACK_MAX_MISSED = int(os.environ.get('TRACK_MAX_MISSED', 10))  # frames a track survives without a box
+TRACK_OCR_CONFIDENCE = float(os.environ.get('TRACK_OCR_CONFIDENCE', 0.9))  # stop re-reading above this
+TRACK_OCR_RETRY_FRAMES = int(os.environ.get('TRACK_OCR_RETRY_FRAMES', 5))  # min gap between low-confidence retries
+TRACK_REOCR_GAIN = float(os.environ.get('TRACK_REOCR_GAIN', 1.3))  # crop must be this much larger/sharper
+STREAM_TARGET_FPS = float(os.environ.get('STREAM_TARGET_FPS', 0))  # 0 = process as fast as possible
+STREAM_MAX_LATENCY = float(os.environ.get('STREAM_MAX_LATENCY', 1.0))  # seconds; older frames are skipped
+MOTION_GATE = os.environ.get('MOTION_GATE', '0') == '1'  # opt-in: skip inference on frames with no scene change
+MOTION_THRESHOLD = float(os.environ.get('MOTION_THRESHOLD', 0.002))  # fraction of pixels that must change
+MOTION_PIXEL_DELTA = int(os.environ.get('MOTION_PIXEL_DELTA', 25))  # grey-level change that counts as changed
+MOTION_DOWNSCALE_WIDTH = int(os.environ.get('MOTION_DOWNSCALE_WIDTH', 160))
+MOTION_MAX_SKIP = int(os.environ.get('MOTION_MAX_SKIP', 50))  # force inference after this many skipped frames
+INFERENCE_STRIDE = int(os.environ.get('INFERENCE_STRIDE', 1))  # run inference on every Nth frame
+ENHANCE_MODE = os.environ.get('ENHANCE_MODE', 'frame')  # 'frame': enhance whole frames, 'roi': plate crops only
+CONDITION_SAMPLE_WIDTH = int(os.environ.get('CONDITION_SAMPLE_WIDTH', 320))  # pixels sampled per row
+CONDITION_INTERVAL = int(os.environ.get('CONDITION_INTERVAL', 25))  # frames between re-classifications
+CONDITION_SHIFT = float(os.environ.get('CONDITION_SHIFT', 15))  # brightness change forcing a re-check
+TRACKER_MAX_READINGS = int(os.environ.get('TRACKER_MAX_READINGS', 32))  # distinct readings kept per vehicle
+PROGRESS_INTERVAL = float(os.environ.get('PROGRESS_INTERVAL', 0.5))  # seconds between progress events
+CHUNK_WORKERS = int(os.environ.get('CHUNK_WORKERS', 1))  # processes per long video; 1 = no chunking
+CHUNK_MIN_SECONDS = float(os.environ.get('CHUNK_MIN_SECONDS', 60))  # shortest time range worth its own process
+MODEL_STUBS = os.environ.get('MODEL_STUBS', '0') == '1'  # stand-in models (model_stubs.py) for benchmarks/CI
 
-# Create output directory
-os.makedirs(OUTPUT_DIR, exist_ok=True)
 CSV_PATH = os.path.join(OUTPUT_DIR, "vehicle_log.csv")
 
 # Suppress PaddleOCR DEBUG logs
 logging.getLogger('ppocr').setLevel(logging.WARNING)
 
-# === Initialize Models ===
-print("[INFO] Loading YOLOv8 model...")
-yolo = YOLO(YOLO_MODEL_PATH).to(DEVICE)
-print("[INFO] Loading PaddleOCR...")
-ocr = PaddleOCR(use_angle_cls=True, lang='en', use_gpu=False)
+# === Models ===
+# Loaded on first use (or by warm_up()), so importing main stays cheap for tools that
+# only need its helpers; ultralytics and paddleocr are not even imported until then.
+_yolo = None
+_ocr = None
+_model_lock = threading.Lock()
+model_load_seconds = {}  # model -> seconds it took to load
+
+def get_yolo():
+    """The plate detector, loaded on first call"""
+    global _yolo
+    if _yolo is None:
+        with _model_lock:
+            if _yolo is None:
+                started = time.perf_counter()
+                if MODEL_STUBS:
+                    from model_stubs import StubDetector
+                    print("[WARN] MODEL_STUBS=1: using a stand-in detector, results are not real readings")
+                    model = StubDetector()
+                else:
+                    from detector_backend import load_detector
+                    print("[INFO] Loading YOLOv8 model...")
+                    model = load_detector(YOLO_MODEL_PATH, device=DEVICE)
+                model_load_seconds['yolo'] = time.perf_counter() - started
+                _yolo = model
+    return _yolo
+
+def get_ocr():
+    """PaddleOCR (plate text recognizer), loaded on first call"""
+    global _ocr
+    if _ocr is None:
+        with _model_lock:
+            if _ocr is None:
+                started = time.perf_counter()
+                if MODEL_STUBS:
+                    from model_stubs import StubOCR
+                    print("[WARN] MODEL_STUBS=1: using a stand-in OCR, results are not real readings")
+                    model = StubOCR()
+                else:
+                    from paddleocr import PaddleOCR
+                    print("[INFO] Loading PaddleOCR...")
+                    model = PaddleOCR(use_angle_cls=True, lang='en', use_gpu=False, rec_batch_num=OCR_BATCH_SIZE)
+                model_load_seconds['ocr'] = time.perf_counter() - started
+                _ocr = model
+    return _ocr
+
+def set_models(yolo=None, ocr=None):
+    """Replace the detector and/or OCR (e.g. another detector backend in benchmarks)"""
+    global _yolo, _ocr
+    with _model_lock:
+        if yolo is not None:
+            _yolo = yolo
+        if ocr is not None:
+            _ocr = ocr
+
+def models_loaded():
+    return _yolo is not None and _ocr is not None
+
+def warm_up():
+    """Load both models and run one tiny inference each, so the first real frame pays no
+    start-up cost (lazy framework initialisation, kernel selection). Returns the load times."""
+    yolo, ocr = get_yolo(), get_ocr()
+    started = time.perf_counter()
+    yolo([np.zeros((64, 64, 3), dtype=np.uint8)], verbose=False)
+    ocr.ocr([np.zeros((32, 96, 3), dtype=np.uint8)], det=False, cls=True)
+    model_load_seconds['warm_up'] = time.perf_counter() - started
+    return dict(model_load_seconds)
 
 # === Vehicle Tracking Class ===
-class VehicleTracker:
+_PLATE_CHARS = {c: i for i, c in enumerate("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ")}
+
+def _char_counts(key):
+    counts = np.zeros(len(_PLATE_CHARS) + 1, dtype=np.uint16)  # last column: any other character
+    for c in key:
+        counts[_PLATE_CHARS.get(c, len(_PLATE_CHARS))] += 1
+    return counts
+
+class _LengthBucket:
+    """Character-count rows of every indexed plate key of one length"""
     def __init__(self):
-        self.vehicles = []  # List of [best_plate, all_readings, first_timestamp]
+        self.counts = np.zeros((16, len(_PLATE_CHARS) + 1), dtype=np.uint16)
+        self.vehicle_ids = np.zeros(16, dtype=np.int64)
+        self.keys = []
+
+    def add(self, key, counts, vehicle_id):
+        n = len(self.keys)
+        if n == len(self.vehicle_ids):
+            self.counts = np.concatenate([self.counts, np.zeros_like(self.counts)])
+            self.vehicle_ids = np.concatenate([self.vehicle_ids, np.zeros_like(self.vehicle_ids)])
+        self.counts[n] = counts
+        self.vehicle_ids[n] = vehicle_id
+        self.keys.append(key)
+
+    def candidates(self, counts, total_len, threshold):
+        """Rows whose shared-character count could still reach the similarity threshold"""
+        n = len(self.keys)
+        overlap = np.minimum(self.counts[:n], counts).sum(axis=1)
+        return np.nonzero(2.0 * overlap / total_len >= threshold)[0]
+
+class VehicleTracker:
+    """Groups plate readings into vehicles using the 0.75 SequenceMatcher similarity.
+
+    Instead of comparing a detection with every stored reading, readings are indexed
+    by length and character counts. Only keys whose length and shared characters can
+    still reach the threshold (the same upper bound as difflib's quick_ratio) are
+    compared with SequenceMatcher, so matches are identical to a full linear scan.
+    """
+    def __init__(self, threshold=0.75, max_readings=TRACKER_MAX_READINGS):
+        self.vehicles = []  # List of [best_plate, distinct_readings, first_timestamp]
+        self.details = []  # Per vehicle: last_seen, detections, and box/confidence of the most confident reading
+        self.threshold = threshold
+        self.max_readings = max_readings
+        self._vehicle_keys = []  # per vehicle: set of indexed comparison keys
+        self._buckets = defaultdict(_LengthBucket)  # cleaned key length -> bucket
+        self._unreadable_id = None  # first vehicle holding an UNREADABLE reading
         
     def clean_plate(self, text):
         """Clean plate text for comparison"""
@@ -66,88 +213,711 @@ class VehicleTracker:
             # Return longest readable plate (usually more complete)
             return max(readable, key=len)
         return "UNREADABLE"
+
+    def find_vehicle(self, plate_text):
+        """Index of the first vehicle with a reading similar to plate_text, or None"""
+        if plate_text == "UNREADABLE":
+            return self._unreadable_id
+
+        key = self.clean_plate(plate_text)
+        if not key:
+            # An empty key only equals another empty key
+            bucket = self._buckets.get(0)
+            return int(bucket.vehicle_ids[:len(bucket.keys)].min()) if bucket and bucket.keys else None
+
+        counts = _char_counts(key)
+        length = len(key)
+        # ratio = 2*M / (len1 + len2) <= 2*min(len1, len2) / (len1 + len2) bounds the other length
+        min_len = int(np.ceil(length * self.threshold / (2 - self.threshold)))
+        max_len = int(length * (2 - self.threshold) / self.threshold)
+
+        best_id = None
+        for other_len in range(max(min_len, 1), max_len + 1):
+            bucket = self._buckets.get(other_len)
+            if not bucket or not bucket.keys:
+                continue
+            for row in bucket.candidates(counts, length + other_len, self.threshold):
+                vehicle_id = int(bucket.vehicle_ids[row])
+                if best_id is not None and vehicle_id >= best_id:
+                    continue
+                other = bucket.keys[row]
+                if key == other or difflib.SequenceMatcher(None, key, other).ratio() >= self.threshold:
+                    best_id = vehicle_id
+        return best_id
+
+    def _index_reading(self, vehicle_id, plate_text):
+        if plate_text == "UNREADABLE":
+            if self._unreadable_id is None:
+                self._unreadable_id = vehicle_id
+            return
+        key = self.clean_plate(plate_text)
+        if key in self._vehicle_keys[vehicle_id]:
+            return
+        self._vehicle_keys[vehicle_id].add(key)
+        self._buckets[len(key)].add(key, _char_counts(key), vehicle_id)
     
-    def add_detection(self, plate_text, timestamp):
+    def add_detection(self, plate_text, timestamp, box=None, confidence=0.0):
         """Add a new plate detection"""
         # Find if this matches any existing vehicle
-        for i, (best_plate, readings, first_time) in enumerate(self.vehicles):
-            if self.plates_similar(plate_text, best_plate) or any(self.plates_similar(plate_text, r) for r in readings):
-                # Update existing vehicle
+        i = self.find_vehicle(plate_text)
+        if i is not None:
+            details = self.details[i]
+            details['last_seen'] = timestamp
+            details['detections'] += 1
+            if box is not None and (details['box'] is None or confidence >= details['confidence']):
+                details['box'] = box
+                details['confidence'] = confidence
+            # Update existing vehicle; readings are deduplicated and capped
+            best_plate, readings, first_time = self.vehicles[i]
+            is_best = plate_text != "UNREADABLE" and (best_plate == "UNREADABLE" or len(plate_text) > len(best_plate))
+            if plate_text not in readings and (len(readings) < self.max_readings or is_best):
                 readings.append(plate_text)
-                new_best = self.get_best_plate(readings)
-                self.vehicles[i] = [new_best, readings, first_time]
-                return False  # Not a new vehicle
+                self._index_reading(i, plate_text)
+            if is_best:
+                best_plate = plate_text
+            self.vehicles[i] = [best_plate, readings, first_time]
+            return False  # Not a new vehicle
         
         # New vehicle
         self.vehicles.append([plate_text, [plate_text], timestamp])
+        self.details.append({'last_seen': timestamp, 'detections': 1, 'box': box, 'confidence': confidence})
+        self._vehicle_keys.append(set())
+        self._index_reading(len(self.vehicles) - 1, plate_text)
         return True  # New vehicle
     
+    def merge(self, vehicles, details):
+        """Fold in another tracker's vehicles/details (e.g. of the next chunk of the same video).
+
+        A vehicle matching an existing one keeps the earliest first timestamp and is
+        counted once; the rest are added as new vehicles in their original order. The
+        other tracker already separated its own vehicles, so they are only matched
+        against the vehicles and readings held before the merge. Returns, for each of
+        the other tracker's vehicles, whether it was added as a new vehicle.
+        """
+        known = len(self.vehicles)
+        # Readings are in the order they were seen; like add_detection, the earliest one that
+        # matches decides which vehicle this is. find_vehicle returns the lowest matching id,
+        # so an id >= known means no earlier vehicle matched.
+        targets = [next((i for i in map(self.find_vehicle, readings) if i is not None and i < known), None)
+                   for _, readings, _ in vehicles]
+
+        for (best_plate, readings, first_time), detail, i in zip(vehicles, details, targets):
+            if i is None:
+                self.vehicles.append([best_plate, [], first_time])
+                self.details.append(dict(detail))
+                self._vehicle_keys.append(set())
+                i = len(self.vehicles) - 1
+                for reading in readings:
+                    self.vehicles[i][1].append(reading)
+                    self._index_reading(i, reading)
+                continue
+
+            own_best, own_readings, own_first = self.vehicles[i]
+            for reading in readings:
+                if reading not in own_readings and len(own_readings) < self.max_readings:
+                    own_readings.append(reading)
+                    self._index_reading(i, reading)
+            if best_plate != "UNREADABLE" and (own_best == "UNREADABLE" or len(best_plate) > len(own_best)):
+                own_best = best_plate
+            # format_timestamp strings are zero-padded, so they compare in time order
+            self.vehicles[i] = [own_best, own_readings, min(own_first, first_time)]
+            own = self.details[i]
+            own['last_seen'] = max(own['last_seen'], detail['last_seen'])
+            own['detections'] += detail['detections']
+            if detail['box'] is not None and (own['box'] is None or detail['confidence'] >= own['confidence']):
+                own['box'] = detail['box']
+                own['confidence'] = detail['confidence']
+        return [i is None for i in targets]
+
     def get_unique_vehicles(self):
         """Get list of unique vehicles with their best plate reading"""
         return [(best_plate, first_time) for best_plate, readings, first_time in self.vehicles]
 
+    def get_vehicle_records(self):
+        """Unique vehicles with first/last seen timestamps, best box and OCR confidence"""
+        return [{'plate': best_plate, 'first_seen': first_time, **details}
+                for (best_plate, readings, first_time), details in zip(self.vehicles, self.details)]
+
+# === Plate Box Tracking ===
+class PlateTrack:
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = box
+        self.velocity = None  # per-update box motion, known once the track has been matched
+        self.missed = 0
+        self.text = "UNREADABLE"
+        self.confidence = 0.0
+        self.ocr_area = 0
+        self.ocr_sharpness = 0.0
+        self.last_ocr_frame = None
+
+class PlateTracker:
+    """Follows YOLO plate boxes across frames so each physical plate keeps one track ID.
+
+    Boxes are matched against where each track is predicted to be, so plates still
+    link up when inference skips frames (stride). Until a track has moved once, the
+    centroid fallback reaches stride box widths instead of one. OCR is only scheduled
+    for a track when it is new, its crop is clearly larger or sharper than the one
+    last read, or its reading is still below TRACK_OCR_CONFIDENCE.
+    """
+    def __init__(self, iou_threshold=TRACK_IOU_THRESHOLD, max_missed=TRACK_MAX_MISSED, stride=1):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.stride = stride  # video frames per update
+        self.tracks = []
+        self.next_id = 1
+        self.frame_num = 0
+        self.ocr_runs = 0
+        self.ocr_skipped = 0
+
+    @staticmethod
+    def iou(a, b):
+        ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+        ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+        inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+        union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+        return inter / union if union > 0 else 0.0
+
+    @staticmethod
+    def centroid_distance(a, b):
+        ax, ay = (a[0] + a[2]) / 2, (a[1] + a[3]) / 2
+        bx, by = (b[0] + b[2]) / 2, (b[1] + b[3]) / 2
+        return ((ax - bx) ** 2 + (ay - by) ** 2) ** 0.5
+
+    @staticmethod
+    def centroid_close(a, b, reach=1):
+        """Fallback for fast movers: centres closer than `reach` previous box widths"""
+        return PlateTracker.centroid_distance(a, b) < (a[2] - a[0]) * reach
+
+    @staticmethod
+    def predict(track):
+        """Where the track's box should be now, assuming it kept its last motion"""
+        if track.velocity is None:
+            return track.box
+        steps = track.missed + 1
+        return tuple(c + v * steps for c, v in zip(track.box, track.velocity))
+
+    def update(self, boxes):
+        """Associate one frame's boxes with existing tracks; returns a PlateTrack per box"""
+        self.frame_num += self.stride
+        assigned = [None] * len(boxes)
+        matched = set()
+        predicted = [self.predict(t) for t in self.tracks]
+
+        pairs = sorted(((self.iou(p, b), ti, bi)
+                        for ti, p in enumerate(predicted) for bi, b in enumerate(boxes)), reverse=True)
+        for score, ti, bi in pairs:
+            if score < self.iou_threshold:
+                break
+            if ti not in matched and assigned[bi] is None:
+                matched.add(ti)
+                assigned[bi] = self.tracks[ti]
+
+        # Closest pairs first, so a neighbouring plate cannot take a track's box
+        pairs = sorted((self.centroid_distance(p, b), ti, bi)
+                       for ti, p in enumerate(predicted) for bi, b in enumerate(boxes)
+                       if ti not in matched and assigned[bi] is None)
+        for _, ti, bi in pairs:
+            track = self.tracks[ti]
+            reach = 1 if track.velocity is not None else self.stride
+            if ti not in matched and assigned[bi] is None and self.centroid_close(predicted[ti], boxes[bi], reach):
+                matched.add(ti)
+                assigned[bi] = track
+
+        for ti, track in enumerate(self.tracks):
+            if ti not in matched:
+                track.missed += 1
+        self.tracks = [t for t in self.tracks if t.missed * self.stride <= self.max_missed]
+
+        for bi, box in enumerate(boxes):
+            track = assigned[bi]
+            if track is None:
+                track = assigned[bi] = PlateTrack(self.next_id, box)
+                self.next_id += 1
+                self.tracks.append(track)
+            else:
+                track.velocity = tuple((c - p) / (track.missed + 1) for c, p in zip(box, track.box))
+            track.box = box
+            track.missed = 0
+        return assigned
+
+    def needs_ocr(self, track, crop):
+        """Decide whether this frame's crop of the track is worth sending to OCR"""
+        if crop.size == 0:
+            run = False
+        else:
+            area = crop.shape[0] * crop.shape[1]
+            sharpness = cv2.Laplacian(cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY), cv2.CV_64F).var()
+            if track.last_ocr_frame is None:
+                run = True
+            elif area >= track.ocr_area * TRACK_REOCR_GAIN or sharpness >= track.ocr_sharpness * TRACK_REOCR_GAIN:
+                run = True
+            else:
+                run = (track.confidence < TRACK_OCR_CONFIDENCE
+                       and self.frame_num - track.last_ocr_frame >= TRACK_OCR_RETRY_FRAMES)
+            if run:
+                track.ocr_area = max(track.ocr_area, area)
+                track.ocr_sharpness = max(track.ocr_sharpness, sharpness)
+                track.last_ocr_frame = self.frame_num
+
+        if run:
+            self.ocr_runs += 1
+        else:
+            self.ocr_skipped += 1
+        return run
+
+    def record_ocr(self, track, text, confidence):
+        """Keep the most confident readable text seen for the track"""
+        if text != "UNREADABLE" and (track.text == "UNREADABLE" or confidence >= track.confidence):
+            track.text = text
+            track.confidence = confidence
+
 # === Enhancement Functions ===
-def enhance_image(image):
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    brightness = np.mean(gray)
-    contrast = np.std(gray)
+_SHARPEN_KERNEL = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
+_clahe_local = threading.local()
 
-    condition = "Clear"
+def sample_gray(image, width=CONDITION_SAMPLE_WIDTH):
+    """Greyscale copy of every Nth pixel; nearest sampling keeps mean and std representative"""
+    step = max(1, image.shape[1] // width)
+    sample = np.ascontiguousarray(image[::step, ::step])
+    return cv2.cvtColor(sample, cv2.COLOR_BGR2GRAY) if sample.ndim == 3 else sample
 
+def classify_condition(gray):
+    brightness = gray.mean()
+    contrast = gray.std()
     if brightness < 80:
-        condition = "Lowlight"
-        image = enhance_lowlight(image)
+        return "Lowlight"
     elif contrast < 30:
-        condition = "Foggy"
-        image = enhance_fog(image)
+        return "Foggy"
     elif brightness > 200 and contrast < 40:
-        condition = "Rainy"
-        image = enhance_rain(image)
+        return "Rainy"
+    return "Clear"
+
+class ConditionClassifier:
+    """Re-classifies the scene every CONDITION_INTERVAL frames, or sooner if brightness shifts"""
+    def __init__(self, interval=CONDITION_INTERVAL, shift=CONDITION_SHIFT):
+        self.interval = interval
+        self.shift = shift
+        self.condition = None
+        self.brightness = 0.0
+        self.frames_since = 0
+
+    def classify(self, image):
+        self.frames_since += 1
+        # A much sparser sample is enough to notice sudden changes (headlights, tunnel exit)
+        brightness = sample_gray(image, CONDITION_SAMPLE_WIDTH // 4).mean()
+        if (self.condition is None or self.frames_since >= self.interval
+                or abs(brightness - self.brightness) > self.shift):
+            self.condition = classify_condition(sample_gray(image))
+            self.brightness = brightness
+            self.frames_since = 0
+        return self.condition
+
+def enhance_image(image, classifier=None):
+    condition = classifier.classify(image) if classifier else classify_condition(sample_gray(image))
+    if condition in _ENHANCERS:
+        image = _ENHANCERS[condition](image)
+    return image, condition
 
+def normalize_image(image, classifier=None):
+    """Light frame-wide normalization for ENHANCE_MODE=roi: only dark frames get a brightness LUT"""
+    condition = classifier.classify(image) if classifier else classify_condition(sample_gray(image))
+    if condition == "Lowlight":
+        image = cv2.LUT(image, _BRIGHTNESS_LUT_U8)
     return image, condition
 
+def enhance_plate_crop(crop, condition):
+    """Condition-specific enhancement of a single plate crop (ENHANCE_MODE=roi)"""
+    if crop.size == 0 or condition not in _ENHANCERS:
+        return crop
+    return _ENHANCERS[condition](crop)
+
 def enhance_fog(img):
+    # CLAHE objects keep internal buffers, so reuse one per thread rather than one per call
+    clahe = getattr(_clahe_local, 'clahe', None)
+    if clahe is None:
+        clahe = _clahe_local.clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
     lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
     l, a, b = cv2.split(lab)
-    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
     l = clahe.apply(l)
     lab = cv2.merge((l, a, b))
     return cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
 
 def enhance_rain(img):
     filtered = cv2.bilateralFilter(img, 9, 75, 75)
-    kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-    sharpened = cv2.filter2D(filtered, -1, kernel)
+    sharpened = cv2.filter2D(filtered, -1, _SHARPEN_KERNEL)
     return cv2.addWeighted(filtered, 0.7, sharpened, 0.3, 0)
 
+_BRIGHTNESS_LUT = np.clip(np.round(np.arange(256) * 1.5), 0, 255)
+
 def enhance_lowlight(img):
-    pil_img = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-    pil_img = ImageEnhance.Brightness(pil_img).enhance(1.5)
-    pil_img = ImageEnhance.Contrast(pil_img).enhance(1.3)
-    return cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
+    """Brightness x1.5 then contrast x1.3 around the mean grey level, as a single LUT pass"""
+    mean = int(_BRIGHTNESS_LUT[sample_gray(img)].mean() + 0.5)
+    lut = np.clip(np.round(mean + 1.3 * (_BRIGHTNESS_LUT - mean)), 0, 255).astype(np.uint8)
+    return cv2.LUT(img, lut)
+
+_BRIGHTNESS_LUT_U8 = _BRIGHTNESS_LUT.astype(np.uint8)
+_ENHANCERS = {"Lowlight": enhance_lowlight, "Foggy": enhance_fog, "Rainy": enhance_rain}
+
+# === OCR Result Cache ===
+_DHASH_SIZE = (16, 4)  # gradient cells per crop
+_DHASH_MIN_STEP = 12  # grey-level step that counts as an edge; flatter cells hash as 0
+_DHASH_MAX_DISTANCE = 8  # differing hash bits before a cached crop is not even compared
+_THUMB_SIZE = (48, 12)
+_SIZE_TOLERANCE = 0.1  # cached crop's width/height may differ by this fraction
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], np.uint8)  # set bits per byte value
+
+
+def plate_dhash(gray):
+    """Difference hash of a grey plate crop as packed bits: which cells are clearly darker / brighter than
+    their right neighbour"""
+    small = cv2.resize(gray, (_DHASH_SIZE[0] + 1, _DHASH_SIZE[1]), interpolation=cv2.INTER_AREA).astype(np.int16)
+    step = small[:, 1:] - small[:, :-1]
+    return np.packbits(np.concatenate([(step > _DHASH_MIN_STEP).ravel(), (step < -_DHASH_MIN_STEP).ravel()]))
+
+
+class OCRCache:
+    """LRU of recent plate readings so repeated crops (a parked car, a duplicate image) skip OCR.
+
+    A crop's dHash only picks candidates: it is cheap but too coarse to tell plates
+    one character apart. A pixel-identical candidate is always reused. Otherwise the
+    closest crop of about the same size is reused if no cell of the mean-subtracted
+    48x12 grey thumbnail differs by more than max_diff grey levels: sensor noise,
+    small lighting changes and JPEG artifacts stay below about 10, a changed character
+    does not. max_diff 0 reuses pixel-identical crops only. Anything else is a miss
+    and goes to OCR. Entries live in fixed slots of numpy arrays so a lookup compares
+    against all of them at once.
+    """
+    def __init__(self, max_entries=OCR_CACHE_SIZE, ttl=OCR_CACHE_TTL, max_diff=OCR_CACHE_MAX_DIFF):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_diff = max_diff
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.clear()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    @staticmethod
+    def fingerprint(crop):
+        """(hash, size, thumbnail, digest of the exact pixels) used to look a crop up and to store its reading"""
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+        thumb = cv2.resize(gray, _THUMB_SIZE, interpolation=cv2.INTER_AREA).astype(np.int16)
+        thumb -= int(thumb.mean())
+        digest = hashlib.blake2b(repr((crop.shape, crop.dtype.str)).encode() + np.ascontiguousarray(crop).tobytes(),
+                                 digest_size=16).digest()
+        return plate_dhash(gray), (gray.shape[1], gray.shape[0]), thumb, digest
+
+    def clear(self):
+        with self._lock:
+            n = max(self.max_entries, 0)
+            hash_bytes = _DHASH_SIZE[0] * _DHASH_SIZE[1] * 2 // 8
+            self._hashes = np.zeros((n, hash_bytes), np.uint8)
+            self._sizes = np.zeros((n, 2), np.int32)
+            self._thumbs = np.zeros((n, _THUMB_SIZE[1], _THUMB_SIZE[0]), np.int16)
+            self._stored_at = np.full(n, -np.inf)
+            self._last_used = np.zeros(n, np.int64)
+            self._readings = [None] * n
+            self._digests = [None] * n
+            self._count = 0  # slots filled so far
+            self._tick = 0
+
+    def get(self, fingerprint, now=None):
+        """Cached (text, confidence) of the same or a near-duplicate crop, or None"""
+        key, size, thumb, digest = fingerprint
+        now = time.monotonic() if now is None else now
+        reading = None
+        with self._lock:
+            n = self._count
+            widths, heights = self._sizes[:n, 0], self._sizes[:n, 1]
+            candidates = np.flatnonzero(
+                (now - self._stored_at[:n] <= self.ttl)
+                & (_POPCOUNT.take(self._hashes[:n] ^ key).sum(axis=1) <= _DHASH_MAX_DISTANCE)
+                & (np.abs(widths - size[0]) <= _SIZE_TOLERANCE * np.maximum(widths, size[0]))
+                & (np.abs(heights - size[1]) <= _SIZE_TOLERANCE * np.maximum(heights, size[1])))
+            slot = next((c for c in candidates if self._digests[c] == digest), None)
+            if slot is None and candidates.size and self.max_diff > 0:
+                diffs = np.abs(self._thumbs[candidates] - thumb).max(axis=(1, 2))
+                if diffs.min() <= self.max_diff:
+                    slot = candidates[diffs.argmin()]
+            if slot is not None:
+                self._tick += 1
+                self._last_used[slot] = self._tick
+                reading = self._readings[slot]
+            if reading is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.OCR_CACHE.inc(result='miss' if reading is None else 'hit')
+        return reading
+
+    def put(self, fingerprint, reading, now=None):
+        if not self.enabled:
+            return
+        key, size, thumb, digest = fingerprint
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self._count < self.max_entries:
+                slot = self._count
+                self._count += 1
+            else:
+                # Reuse an expired slot, else the least recently used one
+                expired = now - self._stored_at > self.ttl
+                slot = int(np.argmin(np.where(expired, -1, self._last_used)))
+            self._tick += 1
+            self._hashes[slot] = key
+            self._sizes[slot] = size
+            self._thumbs[slot] = thumb
+            self._stored_at[slot] = now
+            self._last_used[slot] = self._tick
+            self._readings[slot] = reading
+            self._digests[slot] = digest
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'entries': self._count, 'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0}
+
+ocr_cache = OCRCache()
+
 
 # === OCR Function ===
 def recognize_plate(plate_img):
-    result = ocr.ocr(plate_img, cls=True)
-    if result and result[0]:
-        return result[0][0][1][0]
-    return "UNREADABLE"
+    text, _ = recognize_plates([plate_img])[0]
+    return text
+
+def recognize_plates(plate_imgs):
+    """Recognize a list of plate crops in one recognizer pass; returns (text, confidence) per crop"""
+    readings = [("UNREADABLE", 0.0)] * len(plate_imgs)
+    valid = [i for i, img in enumerate(plate_imgs) if img is not None and img.size > 0]
+    if not valid:
+        return readings
+
+    fingerprints = {}
+    if ocr_cache.enabled:
+        pending = []
+        for i in valid:
+            fingerprints[i] = ocr_cache.fingerprint(plate_imgs[i])
+            cached = ocr_cache.get(fingerprints[i])
+            if cached is None:
+                pending.append(i)
+            else:
+                readings[i] = cached
+        valid = pending
+
+    # The crops are already plate regions, so skip PaddleOCR's text detector and
+    # send them straight through angle classification + recognition as a batch
+    if valid:
+        started = time.perf_counter()
+        result = get_ocr().ocr([plate_imgs[i] for i in valid], det=False, cls=True)
+        metrics.INFERENCE_SECONDS.observe(time.perf_counter() - started, model='ocr')
+        if result and result[0]:
+            for i, (text, confidence) in zip(valid, result[0]):
+                if text.strip() and confidence >= OCR_MIN_CONFIDENCE:
+                    readings[i] = (text, float(confidence))
+        for i in valid:
+            if i in fingerprints:
+                ocr_cache.put(fingerprints[i], readings[i])
+    unreadable = sum(text == "UNREADABLE" for text, _ in readings)
+    metrics.OCR_READINGS.inc(len(readings) - unreadable, result='readable')
+    metrics.OCR_READINGS.inc(unreadable, result='unreadable')
+    return readings
 
 # === Plate Detection ===
+class InferenceResizer:
+    """Letterboxes frames into reused size x size buffers for YOLO and maps boxes back.
+
+    Frames are scaled to fit with their aspect ratio kept and padded with grey, like
+    YOLO's own letterbox, so YOLO gets input at exactly its inference size and skips
+    resizing. Buffers come from a free list and are handed back with release() once
+    YOLO has run; the padding is filled when a buffer is allocated and never touched again.
+    """
+    def __init__(self, size=INFERENCE_SIZE):
+        self.size = size
+        self._shape = None
+        self._free = []
+
+    def _configure(self, shape):
+        h, w = shape[:2]
+        self.scale = min(self.size / w, self.size / h)
+        self.resized = (max(1, round(w * self.scale)), max(1, round(h * self.scale)))
+        self.pad = ((self.size - self.resized[0]) // 2, (self.size - self.resized[1]) // 2)
+        self._shape = shape
+        self._free = []  # buffers padded for the previous frame size
+
+    def resize(self, frame):
+        if frame.shape != self._shape:
+            self._configure(frame.shape)
+        try:
+            buffer = self._free.pop()
+        except IndexError:
+            buffer = np.full((self.size, self.size, frame.shape[2]), 114, dtype=np.uint8)
+        (x, y), (w, h) = self.pad, self.resized
+        # Resize straight into the buffer's content area instead of allocating a new image
+        cv2.resize(frame, (w, h), dst=buffer[y:y + h, x:x + w], interpolation=cv2.INTER_LINEAR)
+        return buffer
+
+    def release(self, buffers):
+        self._free.extend(b for b in buffers if b.shape[2] == self._shape[2])
+
+    @property
+    def imgsz(self):
+        return self.size
+
+    def to_frame(self, box):
+        """Map an (x1, y1, x2, y2) box from buffer coordinates to the full-resolution frame"""
+        (px, py), (h, w) = self.pad, self._shape[:2]
+        x1, y1, x2, y2 = map(float, box)
+        return (min(max(round((x1 - px) / self.scale), 0), w), min(max(round((y1 - py) / self.scale), 0), h),
+                min(max(round((x2 - px) / self.scale), 0), w), min(max(round((y2 - py) / self.scale), 0), h))
+
+class ScaledResizer:
+    """Downscales frames wider than max_width for YOLO and maps boxes back (DECODE_MAX_WIDTH).
+
+    The aspect ratio is kept without padding and YOLO still letterboxes to its own input
+    size, so only the detector sees the smaller frame; OCR crops, thumbnails and the
+    annotated output keep the full resolution. Narrower frames are passed through.
+    """
+    imgsz = None  # YOLO's default input size
+
+    def __init__(self, max_width=DECODE_MAX_WIDTH):
+        self.max_width = max_width
+        self._shape = None
+
+    def resize(self, frame):
+        if frame.shape != self._shape:
+            h, w = frame.shape[:2]
+            self.size = scaled_size(w, h, self.max_width)
+            self.scale = (self.size[0] / w, self.size[1] / h)
+            self._shape = frame.shape
+        if self.size == (frame.shape[1], frame.shape[0]):
+            return frame
+        return cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+
+    def release(self, buffers):
+        pass
+
+    def to_frame(self, box):
+        """Map an (x1, y1, x2, y2) box from the scaled frame to the full-resolution frame"""
+        (sx, sy), (h, w) = self.scale, self._shape[:2]
+        x1, y1, x2, y2 = map(float, box)
+        return (min(max(round(x1 / sx), 0), w), min(max(round(y1 / sy), 0), h),
+                min(max(round(x2 / sx), 0), w), min(max(round(y2 / sy), 0), h))
+
+_resizer_local = threading.local()
+
+def default_resizer():
+    """InferenceResizer of the calling thread (None when INFERENCE_SIZE is 0)"""
+    if not INFERENCE_SIZE:
+        return None
+    resizer = getattr(_resizer_local, 'resizer', None)
+    if resizer is None:
+        resizer = _resizer_local.resizer = InferenceResizer()
+    return resizer
+
 def detect_plates(frame):
-    detections = []
-    results = yolo(frame, verbose=False)
-    for r in results:
-        for box in r.boxes:
-            x1, y1, x2, y2 = map(int, box.xyxy[0].cpu().numpy())
-            plate_crop = frame[y1:y2, x1:x2]
-            text = recognize_plate(plate_crop)
-            detections.append((x1, y1, x2, y2, text))
-    return detections
+    return detect_plates_batch([frame], resizer=default_resizer())[0]
+
+def detect_plates_batch(frames, plate_tracker=None, crop_frames=None, conditions=None, resizer=None,
+                        inference_frames=None, plate_trackers=None):
+    """Run YOLO once over a list of frames and OCR the batch's plate crops together.
+
+    With a PlateTracker (frames must then be consecutive and in order), only crops of
+    tracks that need a new reading are OCR'd and the rest reuse their track's text.
+    plate_trackers gives one tracker per frame instead, for batches mixing several
+    sources (e.g. cameras); each source's frames must still be in order.
+    crop_frames/conditions (ENHANCE_MODE=roi) cut plates from the unenhanced frames and
+    apply the condition's enhancement to each crop before OCR.
+    With an InferenceResizer (e.g. default_resizer() for INFERENCE_SIZE) or a
+    ScaledResizer (DECODE_MAX_WIDTH), YOLO runs on reduced copies (inference_frames if already made by resizer.resize) and boxes are
+    mapped back, so plates are still cropped from the full-resolution frames. The copies
+    go back to the resizer afterwards.
+    Returns one list of (x1, y1, x2, y2, text, confidence) detections per frame.
+    """
+    if not frames:
+        return []
+    if resizer is not None and inference_frames is None:
+        inference_frames = [resizer.resize(frame) for frame in frames]
+    if plate_trackers is None:
+        plate_trackers = [plate_tracker] * len(frames)
+    boxes = []  # (frame index, x1, y1, x2, y2, track)
+    crops = []
+    pending = []  # indexes into boxes that are being OCR'd
+    yolo = get_yolo()
+    started = time.perf_counter()
+    if resizer is not None and resizer.imgsz:
+        results = yolo(inference_frames, verbose=False, imgsz=resizer.imgsz)
+    elif resizer is not None:
+        results = yolo(inference_frames, verbose=False)
+    else:
+        results = yolo(frames, verbose=False)
+    metrics.INFERENCE_SECONDS.observe(time.perf_counter() - started, model='yolo')
+    metrics.INFERENCE_FRAMES.inc(len(frames))
+    for idx, (frame, r) in enumerate(zip(frames, results)):
+        xyxys = r.boxes.xyxy.cpu().numpy()
+        if resizer is not None:
+            frame_boxes = [resizer.to_frame(xyxy) for xyxy in xyxys]
+        else:
+            frame_boxes = [tuple(map(int, xyxy)) for xyxy in xyxys]
+        frame_tracker = plate_trackers[idx]
+        tracks = frame_tracker.update(frame_boxes) if frame_tracker else [None] * len(frame_boxes)
+        source = crop_frames[idx] if crop_frames is not None else frame
+        for (x1, y1, x2, y2), track in zip(frame_boxes, tracks):
+            plate_crop = source[y1:y2, x1:x2]
+            if track is None or frame_tracker.needs_ocr(track, plate_crop):
+                pending.append(len(boxes))
+                crops.append(enhance_plate_crop(plate_crop, conditions[idx]) if conditions else plate_crop)
+            boxes.append((idx, x1, y1, x2, y2, track))
+
+    metrics.OCR_CROPS.inc(len(pending), result='ocr')
+    metrics.OCR_CROPS.inc(len(boxes) - len(pending), result='skipped')
+    readings = {}
+    for i, (text, confidence) in zip(pending, recognize_plates(crops)):
+        idx, track = boxes[i][0], boxes[i][5]
+        if track is None:
+            readings[i] = (text, confidence)
+        else:
+            plate_trackers[idx].record_ocr(track, text, confidence)
+
+    if resizer is not None:
+        resizer.release(inference_frames)
+
+    batch_detections = [[] for _ in frames]
+    for i, (idx, x1, y1, x2, y2, track) in enumerate(boxes):
+        text, confidence = readings[i] if track is None else (track.text, track.confidence)
+        batch_detections[idx].append((x1, y1, x2, y2, text, confidence))
+    return batch_detections
+
+def read_frame_batches(cap, batch_size=DETECT_BATCH_SIZE, max_frames=None, stop_event=None, start_frame=0):
+    """Yield lists of (frame_num, frame) pairs read from an open VideoCapture until stop_event is set.
+
+    Frames are numbered from start_frame (the capture's current position) and at most
+    max_frames are read.
+    """
+    batch = []
+    frame_num = start_frame
+    end_frame = None if max_frames is None else start_frame + max_frames
+    while cap.isOpened() and (end_frame is None or frame_num < end_frame):
+        if stop_event is not None and not batch and stop_event.is_set():
+            return
+        ret, frame = cap.read()
+        if not ret:
+            break
+        batch.append((frame_num, frame))
+        frame_num += 1
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 # === Annotate Frame ===
 def annotate_frame(frame, detections, extra_text=None):
-    for (x1, y1, x2, y2, text) in detections:
+    for (x1, y1, x2, y2, text, _) in detections:
         cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
         cv2.putText(frame, text, (x1, y1 - 10),
                     cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
@@ -164,74 +934,426 @@ def format_timestamp(frame_num, fps):
     h, m = divmod(m, 60)
     return f"{h:02}:{m:02}:{s:02}.{ms:03}"
 
+# === Motion Gating ===
+class MotionGate:
+    """Skips inference on frames that barely differ from the last frame that was inferred"""
+    def __init__(self, threshold=MOTION_THRESHOLD, width=MOTION_DOWNSCALE_WIDTH, max_skip=MOTION_MAX_SKIP,
+                 pixel_delta=MOTION_PIXEL_DELTA):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.width = width
+        self.max_skip = max_skip
+        self.reference = None
+        self.skipped_in_row = 0
+        self.skipped = 0
+
+    def changed(self, frame):
+        h, w = frame.shape[:2]
+        small = cv2.resize(frame, (self.width, max(1, h * self.width // w)), interpolation=cv2.INTER_AREA)
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        if (self.reference is None or self.skipped_in_row >= self.max_skip
+                or np.count_nonzero(cv2.absdiff(small, self.reference) > self.pixel_delta) >= self.threshold * small.size):
+            self.reference = small
+            self.skipped_in_row = 0
+            return True
+        self.skipped_in_row += 1
+        self.skipped += 1
+        return False
+
+def interpolate_detections(left, right, t, reach=1):
+    """Linearly move boxes from left to right detections (matched by IoU/centroid) at 0 <= t <= 1;
+    reach is how many box widths a plate may travel between the two (the inference stride)"""
+    interpolated = []
+    unmatched = list(right)
+    for (lx1, ly1, lx2, ly2, text, conf) in left:
+        match = None
+        for det in unmatched:
+            box = det[:4]
+            if PlateTracker.iou((lx1, ly1, lx2, ly2), box) > 0 or PlateTracker.centroid_close((lx1, ly1, lx2, ly2), box, reach):
+                match = det
+                break
+        if match is None:
+            interpolated.append((lx1, ly1, lx2, ly2, text, conf))
+            continue
+        unmatched.remove(match)
+        rx1, ry1, rx2, ry2, rtext, rconf = match
+        interpolated.append((round(lx1 + (rx1 - lx1) * t), round(ly1 + (ry1 - ly1) * t),
+                             round(lx2 + (rx2 - lx2) * t), round(ly2 + (ry2 - ly2) * t), rtext, rconf))
+    return interpolated
+
+# === Progress Events ===
+class ProgressReporter:
+    """Sends frame progress (done/total, FPS, ETA) and newly confirmed vehicles to on_event"""
+    def __init__(self, on_event, source, total_frames=0, max_frames=None, interval=PROGRESS_INTERVAL):
+        self.on_event = on_event
+        self.source = source
+        total = int(total_frames) if total_frames and total_frames > 0 else None
+        self.total = min(total, max_frames) if total and max_frames else (total or max_frames)
+        self.interval = interval
+        self.done = 0
+        self.started = time.monotonic()
+        self._last_sent = 0.0
+
+    def advance(self, frames, force=False):
+        self.done += frames
+        if self.on_event is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_sent < self.interval:
+            return
+        self._last_sent = now
+        elapsed = now - self.started
+        fps = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / fps if self.total and fps else None
+        self.on_event({
+            'type': 'progress',
+            'file': self.source,
+            'frames_done': self.done,
+            'frames_total': self.total,
+            'fps': round(fps, 2),
+            'eta_seconds': round(max(eta, 0.0), 1) if eta is not None else None,
+        })
+
+    def vehicle(self, plate, timestamp, confidence=None):
+        if self.on_event is not None:
+            self.on_event({'type': 'vehicle', 'file': self.source, 'plate': plate, 'first_seen': timestamp,
+                           'confidence': round(float(confidence), 3) if confidence is not None else None})
+
+# === Frame Pipeline ===
+def observe_stage(stage, seconds, frames):
+    """Pipeline on_item hook: per-frame time of each video stage for /metrics"""
+    if frames:
+        metrics.STAGE_SECONDS.observe(seconds / frames, stage=stage)
+
+def process_capture(cap, out, fps, tracker, max_frames=None, motion_gate=MOTION_GATE, stride=INFERENCE_STRIDE,
+                    enhance_mode=ENHANCE_MODE, on_event=None, source=None, stop_event=None, start_frame=0,
+                    inference_size=INFERENCE_SIZE, decode_max_width=DECODE_MAX_WIDTH):
+    """Run decode → enhance → detect/OCR → annotate → encode concurrently over a capture.
+
+    Stages are connected by bounded queues of frame batches. Inference runs on every
+    stride-th frame, and with motion_gate only when the scene changed since the last
+    inferred frame. Other frames reuse (or interpolate between) inferred detections and
+    are not fed to the VehicleTracker. enhance_mode "roi" enhances plate crops instead
+    of whole frames. With inference_size, the enhance stage also letterboxes each
+    stride-th frame into a reused buffer for YOLO (see InferenceResizer) while detect
+    works on the previous batch; otherwise decode_max_width gives YOLO downscaled copies
+    of wider frames (see ScaledResizer). Plates are always cropped from the full-resolution
+    frames. on_event receives "progress" events (at most every PROGRESS_INTERVAL
+    seconds) and a "vehicle" event for every new vehicle. Reading stops early once
+    stop_event is set. start_frame numbers the frames of a capture that was seeked
+    into (chunked processing). When out is a VideoOutput that writes no video, only
+    frames with a new vehicle are annotated, for its thumbnails. Returns the scene
+    condition of the last frame.
+    """
+    state = {'condition': "Clear", 'last': None, 'inferred': 0, 'frames': 0}
+    plate_tracker = PlateTracker(stride=stride)
+    gate = MotionGate() if motion_gate else None
+    if inference_size:
+        resizer = InferenceResizer(inference_size)
+    else:
+        resizer = ScaledResizer(decode_max_width) if decode_max_width else None
+    cache_before = ocr_cache.stats()
+
+    classifier = ConditionClassifier()
+    total_frames = cap.get(cv2.CAP_PROP_FRAME_COUNT) - start_frame
+    progress = ProgressReporter(on_event, source, total_frames, max_frames)
+
+    def enhance(batch):
+        if enhance_mode == "roi":
+            enhanced = [(frame_num, *normalize_image(frame, classifier), frame) for frame_num, frame in batch]
+        else:
+            enhanced = [(frame_num, *enhance_image(frame, classifier), None) for frame_num, frame in batch]
+        return [(frame_num, frame, condition, original,
+                 resizer.resize(frame) if resizer is not None and frame_num % stride == 0 else None)
+                for frame_num, frame, condition, original in enhanced]
+
+    def detect(batch):
+        infer = [frame_num % stride == 0 and (gate is None or gate.changed(frame))
+                 for frame_num, frame, _, _, _ in batch]
+        selected = [item for item, run in zip(batch, infer) if run]
+        if resizer is not None:
+            # Copies made for frames the motion gate skipped go straight back
+            resizer.release([small for (_, _, _, _, small), run in zip(batch, infer) if small is not None and not run])
+        roi = enhance_mode == "roi"
+        inferred = iter(detect_plates_batch(
+            [frame for _, frame, _, _, _ in selected], plate_tracker,
+            crop_frames=[original for _, _, _, original, _ in selected] if roi else None,
+            conditions=[condition for _, _, condition, _, _ in selected] if roi else None,
+            resizer=resizer,
+            inference_frames=[small for _, _, _, _, small in selected] if resizer is not None else None))
+        anchors = {}
+        for (frame_num, _, _, _, _), run in zip(batch, infer):
+            if run:
+                anchors[frame_num] = next(inferred)
+        state['inferred'] += len(anchors)
+        state['frames'] += len(batch)
+
+        results = []
+        for (frame_num, frame, condition, _, _), run in zip(batch, infer):
+            if run:
+                detections = anchors[frame_num]
+                state['last'] = (frame_num, detections)
+            elif state['last'] is None:
+                detections = []
+            else:
+                last_num, last_detections = state['last']
+                following = [n for n in anchors if n > frame_num]
+                # Interpolate across a plain stride gap; carry forward across gated (static) gaps
+                if following and following[0] - last_num <= stride:
+                    t = (frame_num - last_num) / (following[0] - last_num)
+                    detections = interpolate_detections(last_detections, anchors[following[0]], t, reach=stride)
+                else:
+                    detections = last_detections
+            results.append((frame_num, frame, condition, detections, run))
+        return results
+
+    write_frames = getattr(out, 'write_frames', True)
+    thumbnail = getattr(out, 'thumbnail', None)
+
+    def annotate(batch):
+        annotated = []
+        for frame_num, frame, condition, detections, inferred in batch:
+            video_ts = format_timestamp(frame_num, fps)
+            new_plates = []
+            if inferred:
+                for (x1, y1, x2, y2, text, confidence) in detections:
+                    if tracker.add_detection(text, video_ts, (x1, y1, x2, y2), confidence):
+                        progress.vehicle(text, video_ts, confidence)
+                        new_plates.append(text)
+            if write_frames or new_plates:
+                frame = annotate_frame(frame, detections, extra_text=condition)
+                if thumbnail is not None:
+                    for text in new_plates:
+                        thumbnail(frame, frame_num, text)
+                if write_frames:
+                    annotated.append(frame)
+            state['condition'] = condition
+        progress.advance(len(batch))
+        metrics.FRAMES.inc(len(batch), source='video')
+        return annotated
+
+    def encode(frames):
+        for frame in frames:
+            out.write(frame)
+
+    pipeline = Pipeline(
+        read_frame_batches(cap, max_frames=max_frames, stop_event=stop_event, start_frame=start_frame),
+        [("enhance", enhance), ("detect", detect), ("annotate", annotate), ("encode", encode)],
+        queue_size=PIPELINE_QUEUE_SIZE,
+        item_size=len,
+        on_item=observe_stage
+    )
+    pipeline.run()
+    progress.advance(0, force=True)
+    print(pipeline.format_stats())
+    total_plates = plate_tracker.ocr_runs + plate_tracker.ocr_skipped
+    print(f"[OCR] {plate_tracker.ocr_runs} OCR calls for {total_plates} plate detections "
+          f"({plate_tracker.ocr_skipped} skipped by track scheduling, {plate_tracker.next_id - 1} tracks)")
+    if ocr_cache.enabled:
+        cache_after = ocr_cache.stats()
+        hits = cache_after['hits'] - cache_before['hits']
+        lookups = hits + cache_after['misses'] - cache_before['misses']
+        print(f"[OCR] cache: {hits}/{lookups} crops reused a cached reading "
+              f"({hits / lookups:.0%} hit rate)" if lookups else "[OCR] cache: no lookups")
+    print(f"[GATE] inference on {state['inferred']}/{state['frames']} frames "
+          f"({gate.skipped if gate else 0} skipped as static, stride {stride})")
+    return state['condition']
+
+# === Chunked Video Processing ===
+def chunk_ranges(total_frames, fps, workers=CHUNK_WORKERS, min_seconds=CHUNK_MIN_SECONDS):
+    """Split [0, total_frames) into up to `workers` contiguous (start, end) ranges of at least
+    min_seconds each; a single range means the video is not worth chunking"""
+    if total_frames <= 0 or workers <= 1:
+        return [(0, None)]
+    count = max(1, min(workers, int(total_frames / (fps * min_seconds)) if min_seconds else workers))
+    bounds = [round(i * total_frames / count) for i in range(count + 1)]
+    ranges = list(zip(bounds[:-1], bounds[1:]))
+    # The frame count in the header can be off; the last chunk reads to the real end
+    ranges[-1] = (ranges[-1][0], None)
+    return ranges
+
+def process_chunk(path, start, end, segment_path, stop_event=None, output_mode=VIDEO_OUTPUT,
+                  thumbnail_dir=None, name=None):
+    """Process frames [start, end) of a video in a chunk worker; end None reads to the end.
+
+    The segment is written in output_mode (thumbnails go to thumbnail_dir in mode "none").
+    Returns the chunk's tracker vehicles/details, last condition, frame count, thumbnails
+    (one per vehicle, in order), what it printed and the metrics it counted (merged by the parent).
+    """
+    buffer = io.StringIO()
+    with contextlib.redirect_stdout(buffer):
+        cap = open_capture(path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        if start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        out = VideoOutput(segment_path, fps, size, output_mode, thumbnail_dir=thumbnail_dir, name=name)
+        tracker = VehicleTracker()
+        try:
+            condition = process_capture(cap, out, fps, tracker, max_frames=None if end is None else end - start,
+                                        stop_event=stop_event, start_frame=start)
+            frames = int(cap.get(cv2.CAP_PROP_POS_FRAMES)) - start
+        finally:
+            cap.release()
+            out.release()
+    return {'vehicles': tracker.vehicles, 'details': tracker.details, 'condition': condition, 'frames': frames,
+            'thumbnails': out.thumbnails, 'stdout': buffer.getvalue(), 'metrics': metrics.REGISTRY.take_delta()}
+
+def concat_segments(segment_paths, out):
+    """Append annotated segments to a VideoOutput in order"""
+    for segment_path in segment_paths:
+        cap = open_capture(segment_path)
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            out.append(frame)
+        cap.release()
+
+def process_video_chunked(path, out, tracker, ranges, pool=None, on_event=None, source=None, stop_event=None):
+    """Process the frame ranges of one video in parallel and merge them into out and tracker.
+
+    Segments are written next to the input in out's output mode, concatenated in order, and each chunk's
+    vehicles are merged into tracker in time order so a vehicle crossing a boundary is
+    counted once with its earliest timestamp. Without a pool, one process per range is
+    started for this video (each loads its own models) and stopped afterwards, so no
+    model copies stay in memory between videos. Returns the condition of the last chunk.
+    """
+    if pool is None:
+        with ProcessPoolExecutor(max_workers=len(ranges), mp_context=multiprocessing.get_context('spawn')) as pool:
+            return process_video_chunked(path, out, tracker, ranges, pool, on_event, source, stop_event)
+
+    cap = open_capture(path)
+    progress = ProgressReporter(on_event, source, cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    segment_dir = tempfile.mkdtemp(prefix=".chunks_", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        segment_paths = [os.path.join(segment_dir, f"part{i:03}.mp4") for i in range(len(ranges))]
+        futures = {pool.submit(process_chunk, path, start, end, segment_path, stop_event, out.mode,
+                               out.thumbnail_dir, out.name): i
+                   for i, ((start, end), segment_path) in enumerate(zip(ranges, segment_paths))}
+        results = [None] * len(ranges)
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            metrics.REGISTRY.merge(results[futures[future]].pop('metrics', None))
+            progress.advance(results[futures[future]]['frames'], force=True)
+
+        if out.write_frames:
+            concat_segments(segment_paths, out)
+        known = len(tracker.vehicles)
+        for result in results:
+            # Chunk workers print into their result, so it ends up in this job's output
+            print(result['stdout'], end='')
+            added = tracker.merge(result['vehicles'], result['details'])
+            # Keep the thumbnail of a vehicle only from the chunk where it was first seen
+            for thumb, new in zip(result['thumbnails'], added):
+                if new:
+                    out.thumbnails.append(thumb)
+                elif os.path.exists(thumb):
+                    os.remove(thumb)
+        for (best_plate, _, first_time), details in zip(tracker.vehicles[known:], tracker.details[known:]):
+            progress.vehicle(best_plate, first_time, details['confidence'])
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+    print(f"[CHUNKS] {os.path.basename(path)}: {len(ranges)} chunks, {progress.done} frames")
+    return results[-1]['condition']
+
 # === CSV Summary Tracker ===
 summary_data = defaultdict(int)
 
 # === Process Videos ===
-def process_videos():
-    with open(CSV_PATH, mode='w', newline='') as csvfile:
+def process_videos(video_dir=VIDEO_DIR, output_dir=OUTPUT_DIR, job_id=None, on_event=None, stop_event=None,
+                   output_mode=VIDEO_OUTPUT):
+    os.makedirs(output_dir, exist_ok=True)
+    store = get_detection_store()
+    csv_path = os.path.join(output_dir, "vehicle_log.csv")
+    with open(csv_path, mode='w', newline='') as csvfile:
         csv_writer = csv.writer(csvfile)
         csv_writer.writerow(["Video Timestamp", "Plates Detected", "Vehicle Count", "Condition"])
 
-        for filename in os.listdir(VIDEO_DIR):
+        for filename in os.listdir(video_dir):
             if not filename.lower().endswith((".mp4", ".avi", ".mov", ".mkv")):
                 continue
-            path = os.path.join(VIDEO_DIR, filename)
-            cap = cv2.VideoCapture(path)
+            if stop_event is not None and stop_event.is_set():
+                print("[INFO] Job cancelled")
+                return
+            path = os.path.join(video_dir, filename)
+            # A file that is still being uploaded is read as it grows, so it cannot be chunked
+            growing = os.path.exists(path + UPLOADING_SUFFIX)
+            cap = open_capture(path)
             fps = cap.get(cv2.CAP_PROP_FPS)
             w, h = int(cap.get(3)), int(cap.get(4))
-            out_path = os.path.join(OUTPUT_DIR, f"annotated_{filename}")
-            out = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+            out_path = os.path.join(output_dir, f"annotated_{filename}")
+            out = VideoOutput(out_path, fps, (w, h), output_mode, name=os.path.splitext(filename)[0])
 
-            frame_num = 0
             tracker = VehicleTracker()
-
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    break
-
-                video_ts = format_timestamp(frame_num, fps)
-                frame, condition = enhance_image(frame)
-                detections = detect_plates(frame)
-                annotated = annotate_frame(frame, detections, extra_text=condition)
-                out.write(annotated)
-
-                # Process detections
-                for (_, _, _, _, text) in detections:
-                    tracker.add_detection(text, video_ts)
-
-                frame_num += 1
+            ranges = [(0, None)] if growing else chunk_ranges(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), fps or 25)
+            if len(ranges) > 1:
+                condition = process_video_chunked(path, out, tracker, ranges, on_event=on_event, source=filename,
+                                                  stop_event=stop_event)
+            else:
+                condition = process_capture(cap, out, fps, tracker, on_event=on_event, source=filename,
+                                            stop_event=stop_event)
 
             # Write unique vehicles to CSV
             unique_vehicles = tracker.get_unique_vehicles()
             for plate, first_time in unique_vehicles:
                 csv_writer.writerow([first_time, plate, 1, condition])
                 summary_data[plate] = 1
+            csvfile.flush()  # make this video's rows visible to the API while later files run
+            if store:
+                store.add_vehicles(tracker.get_vehicle_records(), source=filename, job_id=job_id, condition=condition)
+                store.flush()
 
             cap.release()
             out.release()
-            print(f"[DONE] Saved: {out_path} - Found {len(unique_vehicles)} unique vehicles")
+            thumbnails = [os.path.relpath(thumb, output_dir) for thumb in out.thumbnails]
+            if on_event:
+                on_event({'type': 'file_done', 'file': filename,
+                          'output': os.path.basename(out.path) if out.path else None, 'thumbnails': thumbnails,
+                          'vehicles': len(unique_vehicles), 'condition': condition})
+            if out.path:
+                print(f"[DONE] Saved: {out_path} - Found {len(unique_vehicles)} unique vehicles")
+            else:
+                print(f"[DONE] {filename}: no video written, {len(thumbnails)} thumbnails - "
+                      f"Found {len(unique_vehicles)} unique vehicles")
 
 # === Process Images ===
-def process_images():
-    with open(CSV_PATH, mode='a', newline='') as csvfile:
+def process_images(image_dir=IMAGE_DIR, output_dir=OUTPUT_DIR, job_id=None, on_event=None, stop_event=None):
+    os.makedirs(output_dir, exist_ok=True)
+    store = get_detection_store()
+    csv_path = os.path.join(output_dir, "vehicle_log.csv")
+    with open(csv_path, mode='a', newline='') as csvfile:
         csv_writer = csv.writer(csvfile)
-        for filename in os.listdir(IMAGE_DIR):
+        for filename in os.listdir(image_dir):
             if not filename.lower().endswith((".jpg", ".jpeg", ".png")):
                 continue
-            path = os.path.join(IMAGE_DIR, filename)
+            if stop_event is not None and stop_event.is_set():
+                print("[INFO] Job cancelled")
+                break
+            path = os.path.join(image_dir, filename)
             img = cv2.imread(path)
-            img, condition = enhance_image(img)
-            detections = detect_plates(img)
+            if ENHANCE_MODE == "roi":
+                original = img
+                img, condition = normalize_image(img)
+                detections = detect_plates_batch([img], crop_frames=[original], conditions=[condition],
+                                                 resizer=default_resizer())[0]
+            else:
+                img, condition = enhance_image(img)
+                detections = detect_plates(img)
             annotated = annotate_frame(img, detections, extra_text=condition)
-            out_path = os.path.join(OUTPUT_DIR, f"annotated_{filename}")
+            out_path = os.path.join(output_dir, f"annotated_{filename}")
             cv2.imwrite(out_path, annotated)
+            metrics.FRAMES.inc(source='image')
 
             # Use tracker for images too
             tracker = VehicleTracker()
-            for (_, _, _, _, text) in detections:
-                tracker.add_detection(text, f"Image: {filename}")
+            progress = ProgressReporter(on_event, filename, total_frames=1)
+            for (x1, y1, x2, y2, text, confidence) in detections:
+                if tracker.add_detection(text, f"Image: {filename}", (x1, y1, x2, y2), confidence):
+                    progress.vehicle(text, f"Image: {filename}", confidence)
+            progress.advance(1, force=True)
 
             unique_vehicles = tracker.get_unique_vehicles()
             if unique_vehicles:
@@ -241,56 +1363,145 @@ def process_images():
                 
                 for plate, _ in unique_vehicles:
                     summary_data[plate] = 1
+                csvfile.flush()
+            if store:
+                store.add_vehicles(tracker.get_vehicle_records(), source=filename, job_id=job_id, condition=condition)
+            if on_event:
+                on_event({'type': 'file_done', 'file': filename, 'output': f"annotated_{filename}",
+                          'vehicles': len(unique_vehicles), 'condition': condition})
 
             print(f"[DONE] Saved: {out_path} - Found {len(unique_vehicles)} unique vehicles")
 
-def process_stream(stream_url, save_name="stream_output.mp4"):
-    cap = cv2.VideoCapture(stream_url)
-    if not cap.isOpened():
+    if store:
+        store.flush()
+
+def process_stream(stream_url, save_name="stream_output.mp4", max_frames=None,
+                   target_fps=STREAM_TARGET_FPS, max_latency=STREAM_MAX_LATENCY,
+                   replay=None, stop_event=None, stats=None):
+    """Process a live stream continuously, always working on the newest frame.
+
+    Frames that arrive while a frame is being processed are dropped, frames older than
+    max_latency seconds are skipped, and processing is paced to target_fps (0 = as fast
+    as possible). Runs until the stream ends, max_frames frames were processed or
+    stop_event is set; a stream that stalls without ending is waited for. replay paces
+    a local file at its native FPS (see LatestFrameReader). Vehicles go to the detection
+    store from the loop once they have left the scene (see VehicleRecorder).
+    """
+    reader = LatestFrameReader(stream_url, replay=replay)
+    if not reader.is_opened():
         print(f"[ERROR] Could not open stream: {stream_url}")
         return None, []
 
-    fps = cap.get(cv2.CAP_PROP_FPS) or 25
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = reader.fps
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
     out_path = os.path.join(OUTPUT_DIR, f"annotated_{save_name}")
-    out = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    out = VideoOutput(out_path, target_fps or fps, (reader.width, reader.height))
 
     print(f"[INFO] Processing CCTV stream...")
-    frame_num = 0
+    store = get_detection_store()
+    recorder = VehicleRecorder(store, stream_url) if store else None
     tracker = VehicleTracker()
+    plate_tracker = PlateTracker()
+    classifier = ConditionClassifier()
+    processed = 0
+    stale = 0
+    lags = []
+    stalled_since, stall_reported = None, False
+    reader.start()
+    try:
+        while max_frames is None or processed < max_frames:
+            if stop_event is not None and stop_event.is_set():
+                break
+            item = reader.read(timeout=1.0)
+            if item is None:
+                if reader.finished:
+                    break
+                # A timeout is only a stall (e.g. RTSP hiccup): keep waiting until the source ends or we are stopped
+                stalled_since = stalled_since or time.monotonic()
+                if not stall_reported and time.monotonic() - stalled_since >= 5:
+                    print("[WARN] No frame from the stream for 5s, still waiting")
+                    stall_reported = True
+                continue
+            stalled_since, stall_reported = None, False
+            frame_num, frame, captured_at = item
+            started = time.monotonic()
+            if started - captured_at > max_latency:
+                stale += 1
+                metrics.FRAMES_DROPPED.inc(source='stream', reason='stale')
+                continue
 
-    while cap.isOpened() and frame_num < 100:
-        ret, frame = cap.read()
-        if not ret:
-            break
+            video_ts = format_timestamp(frame_num, fps)
+            if ENHANCE_MODE == "roi":
+                original = frame
+                frame, condition = normalize_image(frame, classifier)
+                detections = detect_plates_batch([frame], plate_tracker, crop_frames=[original], conditions=[condition],
+                                                 resizer=default_resizer())[0]
+            else:
+                frame, condition = enhance_image(frame, classifier)
+                detections = detect_plates_batch([frame], plate_tracker, resizer=default_resizer())[0]
+            annotated = annotate_frame(frame, detections, extra_text=condition)
+            out.write(annotated)
 
-        video_ts = format_timestamp(frame_num, fps)
-        frame, condition = enhance_image(frame)
-        detections = detect_plates(frame)
-        annotated = annotate_frame(frame, detections, extra_text=condition)
-        out.write(annotated)
+            # Process detections
+            for (x1, y1, x2, y2, text, confidence) in detections:
+                if tracker.add_detection(text, video_ts, (x1, y1, x2, y2), confidence):
+                    out.thumbnail(annotated, frame_num, text)
+            if recorder is not None:
+                recorder.update(tracker, timestamp_seconds(video_ts), condition)
 
-        # Process detections
-        for (_, _, _, _, text) in detections:
-            tracker.add_detection(text, video_ts)
+            processed += 1
+            lags.append(time.monotonic() - captured_at)
+            metrics.FRAMES.inc(source='stream')
+            metrics.CAMERA_LAG.observe(lags[-1], source='stream')
+            if target_fps:
+                remaining = 1.0 / target_fps - (time.monotonic() - started)
+                if remaining > 0:
+                    time.sleep(remaining)
+    finally:
+        reader.stop()
+        out.release()
+        metrics.FRAMES_DROPPED.inc(reader.frames_dropped, source='stream', reason='behind')
 
-        frame_num += 1
+    stream_stats = {
+        'frames_read': reader.frames_read,
+        'frames_processed': processed,
+        'frames_dropped': reader.frames_dropped,
+        'frames_stale': stale,
+        'avg_lag_ms': round(1000 * sum(lags) / len(lags), 1) if lags else 0.0,
+        'max_lag_ms': round(1000 * max(lags), 1) if lags else 0.0,
+    }
+    if stats is not None:
+        stats.update(stream_stats)
+
+    if recorder is not None:
+        recorder.finish(tracker, classifier.condition)
 
     unique_vehicles = tracker.get_unique_vehicles()
     final_plates = [plate for plate, _ in unique_vehicles]
 
-    cap.release()
-    out.release()
+    print(f"[STREAM] processed {processed}/{reader.frames_read} frames, dropped {reader.frames_dropped}, "
+          f"stale {stale}, lag avg {stream_stats['avg_lag_ms']}ms max {stream_stats['max_lag_ms']}ms")
     print(f"[DONE] Stream saved to: {out_path} - Found {len(unique_vehicles)} unique vehicles")
     return f"annotated_{save_name}", sorted(final_plates)
 
+# === Job Entry Point ===
+def run_job(input_dir, output_dir=OUTPUT_DIR, job_id=None, on_event=None, stop_event=None, output_mode=None):
+    """Process all videos and images in input_dir with the already loaded models.
+
+    on_event(dict) receives progress, vehicle and file_done events while the job runs.
+    Setting stop_event cancels the job after the current frame batch or image.
+    output_mode ("full", "preview" or "none") overrides VIDEO_OUTPUT for the videos.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    summary_data.clear()
+    process_videos(input_dir, output_dir, job_id, on_event, stop_event, output_mode or VIDEO_OUTPUT)
+    process_images(input_dir, output_dir, job_id, on_event, stop_event)
+    return dict(summary_data)
 
 # === MAIN ===
 if __name__ == "__main__":
     print("[START] Processing videos and images...")
-    process_videos()
-    process_images()
+    run_job(VIDEO_DIR, OUTPUT_DIR)
 
     print("\n[SUMMARY]")
     print("Total Unique Vehicles Detected (including UNREADABLE):", len(summary_data))
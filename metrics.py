@@ -0,0 +1,200 @@
+"""Prometheus-style counters, histograms and gauges, served by app.py at /metrics.
+
+The pipeline runs in worker processes (inference workers, chunk workers, the
+camera supervisor), so each process counts into its own REGISTRY. take_delta()
+hands over and resets what a process has counted since the last call, and the
+Flask process merge()s those deltas into its registry. Workers send theirs with
+their job events every METRICS_FLUSH_INTERVAL seconds and when the job ends.
+Chunk workers return theirs with the chunk result. The camera supervisor is
+asked for its delta on every scrape. Gauges describe the current state, so they
+are only set in the Flask process and are never merged.
+
+Hooks are cheap (a lock and a dict update) and turn into no-ops with METRICS=0.
+"""
+import os
+import bisect
+import threading
+
+# === CONFIGURATION ===
+METRICS_ENABLED = os.environ.get('METRICS', '1') == '1'
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))  # seconds between worker updates
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+JOB_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, help, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values tuple -> value
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED or not amount:
+            return
+        key = self._key(labels)
+        with self.registry.lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _merge(self, key, value):
+        self._values[key] = self._values.get(key, 0) + value
+
+    def render(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """Current value, set in the Flask process (not carried in deltas)"""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.registry.lock:
+            self._values[self._key(labels)] = value
+
+    def render(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]  # buckets, +Inf, sum
+            counts[i] += 1
+            counts[-1] += value
+
+    def _merge(self, key, value):
+        counts = self._values.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+        for i, v in enumerate(value):
+            counts[i] += v
+
+    def render(self):
+        lines = []
+        for key, counts in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def _add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(self, name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._add(Gauge(self, name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(self, name, help, labelnames, buckets))
+
+    def take_delta(self):
+        """Counter and histogram values counted since the last call, as picklable data; resets them"""
+        delta = {}
+        with self.lock:
+            for name, metric in self.metrics.items():
+                if metric.kind != 'gauge' and metric._values:
+                    delta[name] = list(metric._values.items())
+                    metric._values = {}
+        return delta
+
+    def merge(self, delta):
+        """Add another process's take_delta() to this registry"""
+        with self.lock:
+            for name, values in (delta or {}).items():
+                metric = self.metrics.get(name)
+                if metric is None or metric.kind == 'gauge':
+                    continue
+                for key, value in values:
+                    metric._merge(tuple(key), value)
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        with self.lock:
+            for metric in self.metrics.values():
+                lines += metric.header() + metric.render()
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# === Metrics ===
+# Flask process
+JOB_QUEUE_WAIT = REGISTRY.histogram('anpr_job_queue_wait_seconds', 'Time jobs spent queued before processing started',
+                                    buckets=JOB_BUCKETS)
+JOB_DURATION = REGISTRY.histogram('anpr_job_duration_seconds', 'Processing time of finished jobs', ['status'],
+                                  buckets=JOB_BUCKETS)
+UPLOAD_BYTES = REGISTRY.counter('anpr_upload_bytes_total', 'Bytes received in uploads', ['kind'])
+JOBS_RUNNING = REGISTRY.gauge('anpr_jobs_running', 'Jobs currently being processed')
+JOBS_QUEUED = REGISTRY.gauge('anpr_jobs_queued', 'Jobs waiting for a worker')
+WORKERS = REGISTRY.gauge('anpr_inference_workers', 'Inference worker processes (INFERENCE_WORKERS)')
+CAMERAS = REGISTRY.gauge('anpr_cameras', 'Cameras by status', ['status'])
+
+# Pipeline (worker processes)
+WORKER_BUSY = REGISTRY.counter('anpr_worker_busy_seconds_total',
+                               'Seconds inference workers spent running jobs; rate() / workers = utilization')
+FRAMES = REGISTRY.counter('anpr_frames_processed_total', 'Frames processed', ['source'])
+FRAMES_DROPPED = REGISTRY.counter('anpr_frames_dropped_total',
+                                  'Live frames skipped because processing fell behind or they were too old',
+                                  ['source', 'reason'])
+INFERENCE_FRAMES = REGISTRY.counter('anpr_inference_frames_total', 'Frames run through the plate detector')
+STAGE_SECONDS = REGISTRY.histogram('anpr_stage_seconds', 'Video pipeline time per frame in each stage', ['stage'])
+INFERENCE_SECONDS = REGISTRY.histogram('anpr_inference_seconds', 'Duration of one detector or OCR batch call',
+                                       ['model'])
+OCR_CROPS = REGISTRY.counter('anpr_ocr_crops_total', 'Plate detections OCR\'d or skipped by track scheduling',
+                             ['result'])
+OCR_CACHE = REGISTRY.counter('anpr_ocr_cache_total', 'OCR cache lookups for plate crops, hit or miss', ['result'])
+OCR_READINGS = REGISTRY.counter('anpr_ocr_readings_total', 'OCR results, readable or UNREADABLE', ['result'])
+CAMERA_LAG = REGISTRY.histogram('anpr_camera_lag_seconds', 'Capture-to-result latency of live frames', ['source'])
@@ -0,0 +1,83 @@
+"""Lightweight stand-ins for YOLO and PaddleOCR (MODEL_STUBS=1).
+
+They load instantly, need neither ultralytics nor paddleocr, and return results in
+the same shapes, so the whole pipeline and the benchmarks run on any CPU box.
+The detector reports bright, plate-shaped regions (like the plates drawn by
+benchmark.py's synthetic workload). The OCR turns a crop's coarse appearance into
+a stable plate-like string, so the same plate gets the same text from frame to frame.
+Their timings only stand for the cost of the surrounding pipeline, not of the models.
+"""
+import hashlib
+import string
+
+import cv2
+import numpy as np
+
+_ALPHABET = string.ascii_uppercase + string.digits
+
+
+class _Tensor:
+    """Just enough of a torch tensor for `.cpu().numpy()`"""
+    def __init__(self, array):
+        self._array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self._array
+
+
+class _Boxes:
+    def __init__(self, xyxy):
+        self.xyxy = _Tensor(xyxy)
+
+
+class _Result:
+    def __init__(self, xyxy):
+        self.boxes = _Boxes(xyxy)
+
+
+class StubDetector:
+    """Callable like an ultralytics YOLO model: finds bright regions with a plate's aspect ratio"""
+    def __init__(self, threshold=200, min_area=400, aspect=(2.0, 6.0)):
+        self.threshold = threshold
+        self.min_area = min_area
+        self.aspect = aspect
+
+    def _detect(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        _, mask = cv2.threshold(gray, self.threshold, 255, cv2.THRESH_BINARY)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        boxes = []
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            if w * h >= self.min_area and self.aspect[0] <= w / h <= self.aspect[1]:
+                boxes.append((x, y, x + w, y + h))
+        return np.array(sorted(boxes), dtype=np.float32).reshape(-1, 4)
+
+    def __call__(self, frames, verbose=False, **kwargs):
+        if isinstance(frames, np.ndarray):
+            frames = [frames]
+        return [_Result(self._detect(frame)) for frame in frames]
+
+    def to(self, device):
+        return self
+
+
+class StubOCR:
+    """Answers PaddleOCR.ocr() calls with a deterministic reading per crop"""
+    def read(self, crop):
+        # 4x2 grey thumbnail quantized to 16 levels: stable while the plate moves a few pixels
+        thumb = cv2.resize(cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY), (4, 2), interpolation=cv2.INTER_AREA) // 16
+        digest = hashlib.sha1(thumb.tobytes()).digest()
+        return ''.join(_ALPHABET[b % len(_ALPHABET)] for b in digest[:10]), 0.95
+
+    def ocr(self, imgs, det=True, cls=True):
+        if isinstance(imgs, np.ndarray):
+            imgs = [imgs]
+        if det:
+            # One text line spanning each image, like PaddleOCR's detector+recognizer output
+            return [[[[[0, 0], [img.shape[1], 0], [img.shape[1], img.shape[0]], [0, img.shape[0]]], self.read(img)]]
+                    for img in imgs]
+        return [[self.read(img) for img in imgs]]
@@ -0,0 +1,148 @@
+"""Threaded stage pipeline for video processing.
+
+Every stage runs in its own thread and hands its output to the next stage
+through a bounded queue, so a slow stage applies backpressure to the ones
+before it instead of letting frames pile up in memory. Each stage is a single
+thread reading a FIFO queue, which keeps items in their original order.
+"""
+import queue
+import threading
+import time
+
+_END = object()
+
+
+class Stage:
+    def __init__(self, name, func, maxsize):
+        self.name = name
+        self.func = func
+        self.input = queue.Queue(maxsize=maxsize)
+        self.processed = 0
+        self.busy_time = 0.0
+        self.received = 0
+        self.max_depth = 0
+        self.depth_total = 0
+
+    def stats(self):
+        return {
+            'stage': self.name,
+            'processed': self.processed,
+            'busy_seconds': round(self.busy_time, 3),
+            'items_per_sec': round(self.processed / self.busy_time, 2) if self.busy_time else 0.0,
+            'queue_depth': self.input.qsize(),
+            'max_queue_depth': self.max_depth,
+            'avg_queue_depth': round(self.depth_total / self.received, 2) if self.received else 0.0,
+        }
+
+
+class Pipeline:
+    def __init__(self, source, stages, queue_size=4, source_name="decode", item_size=None, on_item=None):
+        """source is any iterable (read in its own thread); stages is a list of (name, func).
+
+        Each func receives the previous stage's output and returns the input for the next
+        one; the last stage's return value is discarded. item_size(item) gives the number
+        of units (e.g. frames in a batch) an item counts for in the throughput stats.
+        on_item(stage_name, seconds, units) is called after every item a stage handles.
+        """
+        self.source = source
+        self.item_size = item_size or (lambda item: 1)
+        self.on_item = on_item
+        self.source_stage = Stage(source_name, None, queue_size)
+        self.stages = [Stage(name, func, queue_size) for name, func in stages]
+        self._stop = threading.Event()
+        self._error = None
+
+    def _put(self, q, item):
+        # Block for backpressure, but wake up regularly to notice a failure elsewhere
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fail(self, exc):
+        if self._error is None:
+            self._error = exc
+        self._stop.set()
+
+    def _run_source(self, output):
+        stage = self.source_stage
+        try:
+            iterator = iter(self.source)
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                elapsed = time.perf_counter() - start
+                stage.busy_time += elapsed
+                stage.processed += self.item_size(item)
+                if self.on_item is not None:
+                    self.on_item(stage.name, elapsed, self.item_size(item))
+                if not self._put(output, item):
+                    return
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(output, _END)
+
+    def _run_stage(self, stage, output):
+        try:
+            while not self._stop.is_set():
+                try:
+                    item = stage.input.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _END:
+                    break
+                depth = stage.input.qsize()
+                stage.received += 1
+                stage.max_depth = max(stage.max_depth, depth + 1)
+                stage.depth_total += depth + 1
+
+                start = time.perf_counter()
+                result = stage.func(item)
+                elapsed = time.perf_counter() - start
+                stage.busy_time += elapsed
+                stage.processed += self.item_size(item)
+                if self.on_item is not None:
+                    self.on_item(stage.name, elapsed, self.item_size(item))
+                if output is not None and not self._put(output, result):
+                    return
+        except Exception as e:
+            self._fail(e)
+        finally:
+            if output is not None:
+                self._put(output, _END)
+
+    def run(self):
+        """Run all stages to completion; re-raises the first exception raised by any stage"""
+        first_input = self.stages[0].input if self.stages else None
+        threads = [threading.Thread(target=self._run_source, args=(first_input,),
+                                    name=f"pipeline-{self.source_stage.name}", daemon=True)]
+        for i, stage in enumerate(self.stages):
+            output = self.stages[i + 1].input if i + 1 < len(self.stages) else None
+            threads.append(threading.Thread(target=self._run_stage, args=(stage, output),
+                                            name=f"pipeline-{stage.name}", daemon=True))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if self._error is not None:
+            raise self._error
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        """Per-stage processed count, throughput and input queue depth"""
+        return [self.source_stage.stats()] + [stage.stats() for stage in self.stages]
+
+    def format_stats(self):
+        stats = self.stats()
+        bottleneck = max(stats, key=lambda s: s['busy_seconds'])['stage'] if stats else None
+        parts = [f"{s['stage']}: {s['items_per_sec']}/s (queue max {s['max_queue_depth']})" for s in stats]
+        return f"[STATS] {' | '.join(parts)} | bottleneck: {bottleneck}"
@@ -0,0 +1,209 @@
+"""On-disk cache of finished job outputs, keyed by what determines them.
+
+The key combines the SHA-256 of the uploaded file, of the YOLO weights and of the
+pipeline settings, so re-uploading the same clip with the same model and config
+returns the earlier annotated output and vehicle log without running inference.
+Entries are evicted least recently used first once the cache exceeds its size.
+"""
+import os
+import csv
+import json
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+# === CONFIGURATION ===
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', os.path.join('cache', 'results'))
+RESULT_CACHE_MAX_BYTES = int(float(os.environ.get('RESULT_CACHE_MAX_BYTES', 2 * 1024 ** 3)))  # 0 disables the cache
+YOLO_MODEL_PATH = os.environ.get("YOLO_MODEL_PATH", "best.pt")
+
+# Bump when a code change alters the output for the same input and settings
+CACHE_VERSION = 5
+
+# Settings read by main.py that change detections or the annotated output
+PIPELINE_SETTINGS = [
+    'YOLO_MODEL_PATH', 'OCR_MIN_CONFIDENCE', 'TRACK_IOU_THRESHOLD', 'TRACK_MAX_MISSED', 'TRACK_OCR_CONFIDENCE',
+    'TRACK_OCR_RETRY_FRAMES', 'TRACK_REOCR_GAIN', 'MOTION_GATE', 'MOTION_THRESHOLD', 'MOTION_PIXEL_DELTA',
+    'MOTION_DOWNSCALE_WIDTH', 'MOTION_MAX_SKIP', 'INFERENCE_STRIDE', 'ENHANCE_MODE', 'CONDITION_SAMPLE_WIDTH',
+    'CONDITION_INTERVAL', 'CONDITION_SHIFT', 'TRACKER_MAX_READINGS', 'CHUNK_WORKERS', 'CHUNK_MIN_SECONDS',
+    'VIDEO_BACKEND', 'VIDEO_OUTPUT', 'DECODE_MAX_WIDTH', 'VIDEO_CODEC', 'PREVIEW_WIDTH', 'PREVIEW_FPS',
+    'PREVIEW_BITRATE', 'THUMBNAIL_WIDTH', 'INFERENCE_SIZE', 'DETECTOR_BACKEND', 'DETECTOR_IMGSZ', 'DETECTOR_INT8',
+    'DETECTOR_INT8_DATA', 'MODEL_STUBS', 'OCR_CACHE_SIZE', 'OCR_CACHE_TTL', 'OCR_CACHE_MAX_DIFF',
+]
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+_weights_hashes = {}  # (path, size, mtime) -> digest
+
+
+def weights_sha256(path=YOLO_MODEL_PATH):
+    """Hash of the model weights, recomputed only when the file changes"""
+    if not os.path.exists(path):
+        return 'missing'
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    if key not in _weights_hashes:
+        _weights_hashes[key] = file_sha256(path)
+    return _weights_hashes[key]
+
+
+def pipeline_fingerprint():
+    settings = {name: os.environ.get(name, '') for name in PIPELINE_SETTINGS}
+    return json.dumps({'version': CACHE_VERSION, 'settings': settings}, sort_keys=True)
+
+
+def cache_key(input_path, file_hash=None, output_mode=None):
+    """Cache key of an uploaded file under the current weights and pipeline settings.
+    Pass file_hash when the file's SHA-256 is already known (e.g. from a chunked upload),
+    and the job's output_mode when it overrides VIDEO_OUTPUT."""
+    digest = hashlib.sha256()
+    for part in (file_hash or file_sha256(input_path), weights_sha256(), pipeline_fingerprint(), output_mode or ''):
+        digest.update(part.encode())
+    return digest.hexdigest()
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _copy_vehicle_log(src, dst, old_filename, filename):
+    """Copy a vehicle_log.csv, pointing its image rows ("Image: <file>") at the new upload's name"""
+    with open(src, newline='') as f:
+        rows = list(csv.reader(f))
+    for row in rows:
+        if row and row[0] == f"Image: {old_filename}":
+            row[0] = f"Image: {filename}"
+    with open(dst, 'w', newline='') as f:
+        csv.writer(f).writerows(rows)
+
+
+class ResultCache:
+    def __init__(self, root=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self._lock = threading.Lock()
+        if self.enabled:
+            os.makedirs(root, exist_ok=True)
+            self._load()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _load(self):
+        """Rebuild the LRU order from entry directory mtimes (touched on every hit)"""
+        entries = []
+        for key in os.listdir(self.root):
+            path = os.path.join(self.root, key)
+            if key.startswith('.tmp-') or not os.path.exists(os.path.join(path, 'meta.json')):
+                shutil.rmtree(path, ignore_errors=True)  # incomplete write
+                continue
+            size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+            entries.append((os.path.getmtime(path), key, size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+
+    def get(self, key, output_dir, filename):
+        """On a hit, place the cached outputs in output_dir and return the metadata.
+
+        Outputs named after the cached upload are renamed for filename: the annotated file,
+        thumbnails ("<name>_<frame>_<plate>.jpg") and the image rows of the vehicle log.
+        """
+        if not self.enabled:
+            return None
+        path = os.path.join(self.root, key)
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            os.utime(path)
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+            os.makedirs(output_dir, exist_ok=True)
+            old_filename = meta.get('filename', filename)
+            thumbnail_prefix = os.path.join('thumbnails', os.path.splitext(old_filename)[0] + '_')
+            for name in meta['files']:
+                target = name
+                if name == meta.get('annotated'):
+                    target = f"annotated_{filename}"
+                elif name.startswith(thumbnail_prefix):
+                    suffix = name[len(thumbnail_prefix):]  # "<frame>_<plate>.jpg"
+                    target = os.path.join('thumbnails', f"{os.path.splitext(filename)[0]}_{suffix}")
+                target = os.path.join(output_dir, target)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                if name == 'vehicle_log.csv' and old_filename != filename:
+                    _copy_vehicle_log(os.path.join(path, name), target, old_filename, filename)
+                else:
+                    _link_or_copy(os.path.join(path, name), target)
+        return meta
+
+    def put(self, key, output_dir, filename, **meta):
+        """Store a finished job's annotated file, thumbnails and vehicle log; extra keyword arguments go into the metadata"""
+        if not self.enabled:
+            return False
+        annotated = f"annotated_{filename}"
+        files = [name for name in (annotated, 'vehicle_log.csv') if os.path.exists(os.path.join(output_dir, name))]
+        thumbnail_dir = os.path.join(output_dir, 'thumbnails')
+        if os.path.isdir(thumbnail_dir):
+            files += [os.path.join('thumbnails', name) for name in sorted(os.listdir(thumbnail_dir))]
+        size = sum(os.path.getsize(os.path.join(output_dir, name)) for name in files)
+        if size > self.max_bytes:
+            return False
+
+        # Write into a temporary directory and rename it, so a crash never leaves a half entry
+        tmp_path = os.path.join(self.root, f".tmp-{key}-{threading.get_ident()}")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name in files:
+            os.makedirs(os.path.dirname(os.path.join(tmp_path, name)), exist_ok=True)
+            _link_or_copy(os.path.join(output_dir, name), os.path.join(tmp_path, name))
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump({'files': files, 'annotated': annotated if annotated in files else None,
+                       'filename': filename, 'created_at': time.time(), **meta}, f)
+
+        with self._lock:
+            path = os.path.join(self.root, key)
+            if key in self._entries:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                return True
+            os.rename(tmp_path, path)
+            self._entries[key] = size
+            self._evict()
+        return True
+
+    def _evict(self):
+        while self._entries and sum(self._entries.values()) > self.max_bytes:
+            key, _ = self._entries.popitem(last=False)
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': sum(self._entries.values()),
+                'max_bytes': self.max_bytes,
+            }
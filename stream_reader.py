@@ -0,0 +1,177 @@
+"""Capture readers for sources that are not plain finished files.
+
+LatestFrameReader is for live CCTV streams: a background thread reads the capture
+as fast as the source delivers and keeps only the newest frame. Consumers that
+fall behind get the most recent frame and the ones in between are counted as
+dropped, so processing never lags further and further behind real time.
+
+GrowingFileCapture reads a video that is still being uploaded.
+"""
+import os
+import time
+import threading
+
+import cv2
+
+
+class LatestFrameReader:
+    def __init__(self, source, replay=None):
+        """replay paces a local video file at its native FPS so it behaves like a camera.
+
+        By default it is enabled when source is an existing file.
+        """
+        self.cap = cv2.VideoCapture(source)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 25
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.replay = os.path.isfile(str(source)) if replay is None else replay
+
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self._latest = None  # (frame_num, frame, captured_at)
+        self._finished = False
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def is_opened(self):
+        return self.cap.isOpened()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stream-reader", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        frame_num = 0
+        started = time.monotonic()
+        try:
+            while not self._stop.is_set() and self.cap.isOpened():
+                if self.replay:
+                    # Emulate a live camera: frame N becomes available at N / fps
+                    delay = started + frame_num / self.fps - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                with self._cond:
+                    if self._latest is not None:
+                        self.frames_dropped += 1
+                    self._latest = (frame_num, frame, time.monotonic())
+                    self.frames_read += 1
+                    self._cond.notify()
+                frame_num += 1
+        finally:
+            with self._cond:
+                self._finished = True
+                self._cond.notify_all()
+
+    @property
+    def finished(self):
+        """True once the source ended or failed; frames already read can still be returned"""
+        return self._finished
+
+    def read(self, timeout=5.0):
+        """Return the newest unread (frame_num, frame, captured_at), or None when the stream ended"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._latest is not None or self._finished, timeout=timeout):
+                return None
+            item, self._latest = self._latest, None
+            return item
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.cap.release()
+
+
+# A file with this suffix next to a video marks the video as still being written
+UPLOADING_SUFFIX = ".uploading"
+UPLOAD_STALL_TIMEOUT = float(os.environ.get('UPLOAD_STALL_TIMEOUT', 300))  # seconds without new data before giving up
+
+
+class GrowingFileCapture:
+    """cv2.VideoCapture look-alike for a video whose upload is still in progress.
+
+    The file only ever contains the contiguous prefix received so far. When a read
+    fails while the marker file exists, the capture waits for more data, reopens the
+    file and seeks back to the next frame. Needs a container that can be decoded from
+    a prefix (e.g. MKV, MPEG-TS or MP4 with faststart).
+    """
+    def __init__(self, path, marker=None, poll_interval=1.0, stall_timeout=UPLOAD_STALL_TIMEOUT):
+        self.path = path
+        self.marker = marker or path + UPLOADING_SUFFIX
+        self.poll_interval = poll_interval
+        self.stall_timeout = stall_timeout
+        self.frame_num = 0
+        self.cap = None
+        self._wait_for_header()
+
+    def uploading(self):
+        return os.path.exists(self.marker)
+
+    def _reopen(self):
+        if self.cap is not None:
+            self.cap.release()
+        self.cap = cv2.VideoCapture(self.path)
+        if self.frame_num and self.cap.isOpened():
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.frame_num)
+
+    def _wait_for_header(self):
+        """Block until the container header arrived so fps and frame size are known"""
+        deadline = time.monotonic() + self.stall_timeout
+        while True:
+            self._reopen()
+            if self.cap.isOpened() and self.cap.get(cv2.CAP_PROP_FPS) > 0:
+                return
+            if not self.uploading() or time.monotonic() > deadline:
+                return
+            time.sleep(self.poll_interval)
+
+    def read(self):
+        last_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        deadline = time.monotonic() + self.stall_timeout
+        retried_after_upload = False
+        while True:
+            ret, frame = self.cap.read() if self.cap.isOpened() else (False, None)
+            if ret:
+                self.frame_num += 1
+                return ret, frame
+            if not self.uploading():
+                # The upload finished since the last attempt: read once more from the complete file
+                if retried_after_upload:
+                    return False, None
+                retried_after_upload = True
+            else:
+                time.sleep(self.poll_interval)
+                size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+                if size != last_size:
+                    last_size, deadline = size, time.monotonic() + self.stall_timeout
+                elif time.monotonic() > deadline:
+                    print(f"[WARN] No new data for {self.path} in {self.stall_timeout:.0f}s, stopping early")
+                    return False, None
+            self._reopen()
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.frame_num = int(value)
+        return self.cap.set(prop, value)
+
+    def isOpened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+
+
+def open_video(path):
+    """VideoCapture for path, or a GrowingFileCapture while its upload is still running"""
+    if os.path.exists(path + UPLOADING_SUFFIX):
+        return GrowingFileCapture(path)
+    return cv2.VideoCapture(path)
@@ -0,0 +1,39 @@
+import main
+from detection_store import DetectionStore, VehicleRecorder
+
+
+def test_video_time_query_uses_the_source_index(tmp_path):
+    store = DetectionStore(str(tmp_path / "detections.db"))
+    for i, (source, seen) in enumerate([("cam1", "00:00:05.000"), ("cam1", "00:01:10.500"), ("cam2", "00:01:00.000"),
+                                        ("cam1", "00:00:59.000"), ("cam1", "00:02:00.000")]):
+        store.add(f"MH12AB{i:04}", seen, source=source, detected_at=1000 - i)
+    store.flush()
+
+    rows = store.query(source="cam1", seen_from=30, seen_to=120)
+    assert [(r['plate'], r['first_seen_s']) for r in rows] == [("MH12AB0003", 59.0), ("MH12AB0001", 70.5)]
+    with store.connect() as conn:
+        plan = conn.execute("EXPLAIN QUERY PLAN SELECT * FROM detections WHERE source = ? AND first_seen_s >= ? "
+                            "AND first_seen_s < ? ORDER BY first_seen_s, id", ("cam1", 30, 120)).fetchall()
+    assert any("idx_detections_seen" in row['detail'] for row in plan)
+
+    cam1, = (r for r in store.camera_counts() if r['source'] == "cam1")
+    assert (cam1['vehicles'], cam1['first_seen_s'], cam1['last_seen_s']) == (4, 5.0, 120.0)
+
+
+def test_live_vehicles_are_written_once_they_leave(tmp_path):
+    store = DetectionStore(str(tmp_path / "detections.db"), batch_size=1000)
+    recorder = VehicleRecorder(store, "cam1", idle_seconds=5, flush_seconds=0)
+    tracker = main.VehicleTracker()
+    tracker.add_detection("MH12AB1234", "00:00:01.000", (0, 0, 10, 4), 0.9)
+    tracker.add_detection("MH12AB1234", "00:00:03.000", (0, 0, 10, 4), 0.95)
+    tracker.add_detection("KA01CD5678", "00:00:06.000", (20, 0, 30, 4), 0.9)
+
+    recorder.update(tracker, 7.0, "Clear")
+    assert store.query(source="cam1") == []  # nobody has been gone for 5 s yet
+    recorder.update(tracker, 8.5, "Clear")
+    written, = store.query(source="cam1")  # visible before the camera stops
+    assert (written['plate'], written['first_seen_s'], written['last_seen_s']) == ("MH12AB1234", 1.0, 3.0)
+
+    assert recorder.finish(tracker, "Night") == 2
+    assert [(r['plate'], r['condition']) for r in store.query(source="cam1", seen_from=0)] == [
+        ("MH12AB1234", "Clear"), ("KA01CD5678", "Night")]
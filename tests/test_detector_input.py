@@ -0,0 +1,72 @@
+import cv2
+import numpy as np
+
+import main
+from model_stubs import StubDetector
+
+
+class RecordingDetector(StubDetector):
+    """StubDetector that remembers the widths of the frames YOLO was given"""
+    def __init__(self):
+        super().__init__(min_area=100)
+        self.widths = []
+
+    def __call__(self, frames, verbose=False, **kwargs):
+        self.widths += [frame.shape[1] for frame in frames]
+        return super().__call__(frames, verbose=verbose, **kwargs)
+
+
+class RecordingOCR:
+    def __init__(self):
+        self.shapes = []
+
+    def ocr(self, imgs, det=False, cls=True):
+        self.shapes += [img.shape[:2] for img in imgs]
+        return [[("MH12AB1234", 0.95) for _ in imgs]]
+
+
+class NullOutput:
+    def write(self, frame):
+        pass
+
+
+def parked_plate_video(path, count=8, width=1280, height=720):
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 25, (width, height))
+    for _ in range(count):
+        frame = np.full((height, width, 3), 70, np.uint8)
+        cv2.rectangle(frame, (500, 400), (740, 460), (235, 235, 235), -1)
+        cv2.putText(frame, "MH12AB1234", (510, 442), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (20, 20, 20), 2)
+        out.write(frame)
+    out.release()
+
+
+def test_scaled_resizer_maps_boxes_back_to_the_full_frame():
+    resizer = main.ScaledResizer(640)
+    small = resizer.resize(np.zeros((720, 1280, 3), np.uint8))
+    assert small.shape == (360, 640, 3)
+    assert resizer.to_frame((250, 200, 370, 230)) == (500, 400, 740, 460)
+    narrow = np.zeros((360, 480, 3), np.uint8)
+    assert resizer.resize(narrow) is narrow
+
+
+def test_only_the_detector_sees_downscaled_frames(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, 'ocr_cache', main.OCRCache(max_entries=0))
+    path = str(tmp_path / "parked.avi")
+    parked_plate_video(path)
+
+    runs = {}
+    for max_width in (0, 640):
+        detector, ocr = RecordingDetector(), RecordingOCR()
+        monkeypatch.setattr(main, '_yolo', detector)
+        monkeypatch.setattr(main, '_ocr', ocr)
+        cap = cv2.VideoCapture(path)
+        tracker = main.VehicleTracker()
+        main.process_capture(cap, NullOutput(), 25, tracker, motion_gate=False, decode_max_width=max_width)
+        cap.release()
+        runs[max_width] = (set(detector.widths), ocr.shapes, tracker.details[0]['box'])
+
+    assert runs[0][0] == {1280} and runs[640][0] == {640}
+    # OCR crops and the logged box are at full resolution either way (within the rounding of the 2x downscale)
+    (full_h, full_w), (h, w) = runs[0][1][0], runs[640][1][0]
+    assert abs(h - full_h) <= 2 and abs(w - full_w) <= 2 and full_w >= 238
+    assert all(abs(a - b) <= 2 for a, b in zip(runs[0][2], runs[640][2]))
@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+import threading
+
+import main
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def reset_models(monkeypatch):
+    monkeypatch.setattr(main, 'MODEL_STUBS', True)
+    monkeypatch.setattr(main, '_yolo', None)
+    monkeypatch.setattr(main, '_ocr', None)
+    monkeypatch.setattr(main, 'model_load_seconds', {})
+
+
+def test_importing_main_loads_no_model():
+    code = ("import sys, main; "
+            "print(main.models_loaded() or main._yolo is not None or main._ocr is not None, "
+            "sorted(m for m in ('ultralytics', 'paddleocr', 'paddle', 'torch') if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=REPO, check=True)
+    assert result.stdout.split(None, 1) == ["False", "[]\n"]
+
+
+def test_warm_up_loads_both_models(monkeypatch):
+    reset_models(monkeypatch)
+    assert not main.models_loaded()
+    load_seconds = main.warm_up()
+    assert main.models_loaded()
+    assert set(load_seconds) == {'yolo', 'ocr', 'warm_up'}
+
+
+def test_models_are_loaded_once_across_threads(monkeypatch):
+    reset_models(monkeypatch)
+    models = []
+    threads = [threading.Thread(target=lambda: models.append((main.get_yolo(), main.get_ocr()))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(yolo) for yolo, _ in models}) == 1
+    assert len({id(ocr) for _, ocr in models}) == 1
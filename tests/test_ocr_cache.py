@@ -0,0 +1,140 @@
+import csv
+import hashlib
+import os
+import random
+
+import cv2
+import numpy as np
+import pytest
+
+import main
+from benchmark import random_plate, render_plate, synthetic_traffic
+from model_stubs import StubDetector, StubOCR
+
+
+class PixelOCR:
+    """Reads every distinct crop differently, so a reading reused for another crop shows up"""
+    def ocr(self, imgs, det=False, cls=True):
+        return [[(hashlib.sha1(np.ascontiguousarray(img).tobytes()).hexdigest()[:10].upper(),
+                  0.5 + float(img.mean()) / 512) for img in imgs]]
+
+
+class CountingOCR:
+    """Wraps another OCR stand-in and records the size of every batch sent to it"""
+    def __init__(self, ocr):
+        self.inner = ocr
+        self.calls = []
+
+    def ocr(self, imgs, **kwargs):
+        self.calls.append(len(imgs))
+        return self.inner.ocr(imgs, **kwargs)
+
+
+@pytest.fixture
+def stub_models(monkeypatch):
+    monkeypatch.setattr(main, '_yolo', StubDetector())
+    monkeypatch.setattr(main, '_ocr', PixelOCR())
+
+
+def one_char_changed(rng, plate):
+    i = rng.randrange(len(plate))
+    return plate[:i] + rng.choice([c for c in "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789" if c != plate[i]]) + plate[i + 1:]
+
+
+@pytest.mark.parametrize('max_diff', [0, main.OCR_CACHE_MAX_DIFF])
+def test_distinct_plates_are_not_merged(max_diff):
+    rng = random.Random(0)
+    cache = main.OCRCache(max_entries=200, ttl=float('inf'), max_diff=max_diff)
+    plates = list(dict.fromkeys(random_plate(rng) for _ in range(200)))
+    for plate in plates:
+        cache.put(cache.fingerprint(render_plate(plate)), (plate, 0.9))
+
+    for plate in plates:
+        for other in (one_char_changed(rng, plate), random_plate(rng)):
+            reading = cache.get(cache.fingerprint(render_plate(other)))
+            assert reading is None or reading[0] == other
+
+
+def test_hit_returns_what_ocr_returns(stub_models, monkeypatch):
+    rng = random.Random(1)
+    nrng = np.random.default_rng(1)
+    crops = []
+    for plate in (random_plate(rng) for _ in range(20)):
+        crop = render_plate(plate, noise=4, nrng=nrng)
+        crops += [crop, crop.copy()]
+
+    monkeypatch.setattr(main, 'ocr_cache', main.OCRCache(max_entries=0))
+    expected = main.recognize_plates(crops)
+
+    cache = main.OCRCache(max_entries=100, ttl=float('inf'))
+    monkeypatch.setattr(main, 'ocr_cache', cache)
+    assert main.recognize_plates(crops) == expected  # misses (and in-batch duplicates) go to OCR
+    assert cache.stats()['misses'] == len(crops)
+    assert main.recognize_plates(crops) == expected  # every crop is now a hit
+    assert cache.stats()['hits'] == len(crops)
+
+
+def near_duplicates(plate, nrng):
+    _, encoded = cv2.imencode('.jpg', render_plate(plate), [cv2.IMWRITE_JPEG_QUALITY, 70])
+    return [render_plate(plate, noise=4, nrng=nrng), render_plate(plate, brightness=15),
+            cv2.imdecode(encoded, cv2.IMREAD_COLOR)]
+
+
+def test_near_duplicates_are_reused_by_default():
+    nrng = np.random.default_rng(2)
+    for max_diff, hit in ((main.OCR_CACHE_MAX_DIFF, True), (0, False)):
+        cache = main.OCRCache(max_diff=max_diff)
+        cache.put(cache.fingerprint(render_plate("MH12AB1234")), ("MH12AB1234", 0.9))
+        for crop in near_duplicates("MH12AB1234", nrng):
+            assert cache.get(cache.fingerprint(crop)) == (("MH12AB1234", 0.9) if hit else None)
+
+
+def test_parked_plate_is_read_once(stub_models, monkeypatch):
+    ocr = CountingOCR(main._ocr)
+    monkeypatch.setattr(main, '_ocr', ocr)
+    cache = main.OCRCache()
+    monkeypatch.setattr(main, 'ocr_cache', cache)
+    nrng = np.random.default_rng(3)
+    frames = [render_plate("KA01CD5678", brightness=nrng.integers(-5, 6), noise=3, nrng=nrng) for _ in range(25)]
+
+    readings = [main.recognize_plates([crop])[0] for crop in frames]
+    assert ocr.calls == [1] and set(readings) == {readings[0]}
+    assert cache.stats()['hits'] == len(frames) - 1
+
+
+def test_entries_expire_and_least_recently_used_is_evicted():
+    cache = main.OCRCache(max_entries=2, ttl=10)
+    a, b, c = (cache.fingerprint(render_plate(p)) for p in ("MH12AB1234", "KA01CD5678", "DL05EF9012"))
+    cache.put(a, ("A", 0.9), now=0)
+    cache.put(b, ("B", 0.9), now=1)
+    assert cache.get(a, now=5) == ("A", 0.9)
+    cache.put(c, ("C", 0.9), now=6)
+    assert cache.get(b, now=6) is None
+    assert cache.get(c, now=6) == ("C", 0.9)
+    assert cache.get(a, now=11) is None
+
+
+@pytest.mark.parametrize('ocr, max_diff', [(PixelOCR, 0), (StubOCR, main.OCR_CACHE_MAX_DIFF)])
+def test_image_results_do_not_depend_on_the_cache(ocr, max_diff, stub_models, monkeypatch, tmp_path):
+    """Pixel-identical reuse never changes results; near-duplicate reuse does not either when OCR
+    reads near-duplicates alike (StubOCR, like a real recognizer, is insensitive to noise and JPEG)"""
+    monkeypatch.setattr(main, '_ocr', ocr())
+    monkeypatch.setattr(main, 'get_detection_store', lambda: None)
+    frames = synthetic_traffic(random.Random(3), 6, 640, 360, vehicles=3)
+    image_dir = tmp_path / "images"
+    image_dir.mkdir()
+    for i, frame in enumerate(frames + frames[:2]):  # two repeated images
+        cv2.imwrite(str(image_dir / f"frame{i}.png"), frame)
+    for i, frame in enumerate(frames):  # and near-duplicates of every image
+        cv2.imwrite(str(image_dir / f"frame{i}.jpg"), frame, [cv2.IMWRITE_JPEG_QUALITY, 60])
+
+    def run(cache, name):
+        monkeypatch.setattr(main, 'ocr_cache', cache)
+        output_dir = tmp_path / name
+        main.process_images(str(image_dir), str(output_dir))
+        with open(os.path.join(output_dir, "vehicle_log.csv")) as f:
+            return sorted(map(tuple, csv.reader(f)))
+
+    cache = main.OCRCache(ttl=float('inf'), max_diff=max_diff)
+    assert run(cache, "cached") == run(main.OCRCache(max_entries=0), "uncached")
+    assert cache.stats()['hits'] > 0
@@ -0,0 +1,84 @@
+import cv2
+import numpy as np
+import pytest
+
+import main
+from model_stubs import StubDetector
+
+# (text, height, y, first x, pixels per frame); the fastest plate moves more than its width in 4 frames
+PLATES = [("MH12AB1234", 26, 40, 20, 8), ("KA01CD5678", 32, 190, 40, 20),
+          ("DL05EF9012", 38, 340, 820, -26), ("TN09GH3456", 44, 490, 10, 32)]
+PLATE_W = 120
+
+
+class ShapeOCR:
+    """Reads a plate from its crop height, so every crop of one plate gets the same text"""
+    def ocr(self, imgs, det=False, cls=True):
+        return [[(min(PLATES, key=lambda p: abs(p[1] - img.shape[0]))[0], 0.95) for img in imgs]]
+
+
+class CountingPlateTracker(main.PlateTracker):
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.instances.append(self)
+
+
+class NullOutput:
+    def write(self, frame):
+        pass
+
+
+def steady_scene(path, count=24, width=960, height=580):
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 25, (width, height))
+    for i in range(count):
+        frame = np.full((height, width, 3), 70, np.uint8)
+        for text, plate_h, y, x0, speed in PLATES:
+            x = x0 + i * speed
+            cv2.rectangle(frame, (x, y), (x + PLATE_W, y + plate_h), (235, 235, 235), -1)
+            cv2.putText(frame, text, (x + 6, y + plate_h - 8), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (20, 20, 20), 1)
+        out.write(frame)
+    out.release()
+
+
+def boxes_at(update, stride):
+    return [(x0 + update * stride * speed, y, x0 + update * stride * speed + PLATE_W, y + plate_h)
+            for _, plate_h, y, x0, speed in PLATES]
+
+
+@pytest.mark.parametrize('stride', [1, 2, 3, 4])
+def test_plates_keep_their_track_across_skipped_frames(stride):
+    tracker = main.PlateTracker(stride=stride)
+    first = tracker.update(boxes_at(0, stride))
+    for update in range(1, 24 // stride):
+        assert tracker.update(boxes_at(update, stride)) == first
+    assert tracker.next_id - 1 == len(PLATES)
+
+
+def test_lost_tracks_expire_after_max_missed_frames():
+    tracker = main.PlateTracker(max_missed=8, stride=4)
+    tracker.update(boxes_at(0, 4))
+    tracker.update([])
+    tracker.update([])
+    assert len(tracker.tracks) == len(PLATES)
+    tracker.update([])
+    assert tracker.tracks == []
+
+
+def test_stride_does_not_change_the_vehicle_count(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, '_yolo', StubDetector())
+    monkeypatch.setattr(main, '_ocr', ShapeOCR())
+    monkeypatch.setattr(main, 'PlateTracker', CountingPlateTracker)
+    monkeypatch.setattr(main, 'ocr_cache', main.OCRCache(max_entries=0))
+    path = str(tmp_path / "steady.avi")
+    steady_scene(path)
+
+    counts = {}
+    for stride in (1, 2, 3, 4):
+        cap = cv2.VideoCapture(path)
+        tracker = main.VehicleTracker()
+        main.process_capture(cap, NullOutput(), 25, tracker, motion_gate=False, stride=stride)
+        cap.release()
+        counts[stride] = (len(tracker.get_unique_vehicles()), CountingPlateTracker.instances[-1].next_id - 1)
+    assert counts == {stride: (len(PLATES), len(PLATES)) for stride in (1, 2, 3, 4)}
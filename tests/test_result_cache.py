@@ -0,0 +1,55 @@
+import csv
+import os
+
+from detection_store import DetectionStore
+from result_cache import ResultCache, pipeline_fingerprint
+
+
+def write_job_output(output_dir, filename):
+    stem = os.path.splitext(filename)[0]
+    os.makedirs(os.path.join(output_dir, 'thumbnails'))
+    with open(os.path.join(output_dir, f"annotated_{filename}"), 'wb') as f:
+        f.write(b"image")
+    with open(os.path.join(output_dir, 'thumbnails', f"{stem}_0000012_MH12AB1234.jpg"), 'wb') as f:
+        f.write(b"thumb")
+    with open(os.path.join(output_dir, 'vehicle_log.csv'), 'w', newline='') as f:
+        csv.writer(f).writerows([["Video Timestamp", "Plates Detected", "Vehicle Count", "Condition"],
+                                 [f"Image: {filename}", "MH12AB1234", 1, "Clear"]])
+
+
+def test_hit_is_renamed_for_the_new_upload(tmp_path):
+    cache = ResultCache(root=str(tmp_path / "cache"))
+    first, second = str(tmp_path / "job1"), str(tmp_path / "job2")
+    write_job_output(first, "car.jpg")
+    assert cache.put("key", first, "car.jpg", job_id="job1")
+
+    meta = cache.get("key", second, "other.jpg")
+    assert meta['job_id'] == "job1"
+    assert sorted(os.listdir(second)) == ["annotated_other.jpg", "thumbnails", "vehicle_log.csv"]
+    assert os.listdir(os.path.join(second, "thumbnails")) == ["other_0000012_MH12AB1234.jpg"]
+    with open(os.path.join(second, "vehicle_log.csv"), newline='') as f:
+        assert list(csv.reader(f))[1][0] == "Image: other.jpg"
+    # The cached entry (and the first job's log, which it may share a link with) is unchanged
+    with open(os.path.join(first, "vehicle_log.csv"), newline='') as f:
+        assert list(csv.reader(f))[1][0] == "Image: car.jpg"
+
+
+def test_copy_job_records_detections_for_the_cached_job(tmp_path):
+    store = DetectionStore(str(tmp_path / "detections.db"))
+    store.add("MH12AB1234", "00:00:01.000", "00:00:03.000", source="car.mp4", job_id="job1", condition="Clear",
+              box=(1, 2, 3, 4), confidence=0.9, detected_at=100)
+    store.flush()
+
+    assert store.copy_job("job1", "job2", source="other.mp4") == 1
+    original, = store.query(job_id="job1")
+    copy, = store.query(job_id="job2")
+    assert copy['source'] == "other.mp4" and copy['detected_at'] > original['detected_at']
+    for column in ("plate", "first_seen", "last_seen", "condition", "x1", "y2", "confidence"):
+        assert copy[column] == original[column]
+
+
+def test_int8_calibration_data_is_part_of_the_fingerprint(monkeypatch):
+    monkeypatch.setenv('DETECTOR_INT8_DATA', 'plates_a.yaml')
+    first = pipeline_fingerprint()
+    monkeypatch.setenv('DETECTOR_INT8_DATA', 'plates_b.yaml')
+    assert pipeline_fingerprint() != first
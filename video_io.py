@@ -0,0 +1,226 @@
+"""Video decode/encode backends and output modes.
+
+Decoding goes through OpenCV by default or PyAV (FFmpeg) with threaded decoding
+when VIDEO_BACKEND=pyav and the `av` package is installed. Frames are always
+decoded at full resolution; main.py's DECODE_MAX_WIDTH only shrinks YOLO's copy.
+
+The annotated output is written in one of three modes:
+  full    - every frame at the decoded resolution (the original behaviour)
+  preview - frames downscaled to PREVIEW_WIDTH and thinned to PREVIEW_FPS, at a low bitrate with PyAV
+  none    - no video; a JPEG thumbnail of the annotated frame is saved when a new vehicle appears
+"""
+import os
+import re
+from fractions import Fraction
+
+import cv2
+
+from stream_reader import open_video
+
+try:
+    import av
+except ImportError:
+    av = None
+
+# === CONFIGURATION ===
+VIDEO_BACKEND = os.environ.get('VIDEO_BACKEND', 'opencv')  # 'opencv' or 'pyav'
+VIDEO_OUTPUT = os.environ.get('VIDEO_OUTPUT', 'full')  # 'full', 'preview' or 'none'
+DECODE_THREADS = int(os.environ.get('DECODE_THREADS', 0))  # PyAV decoder threads; 0 = FFmpeg decides
+VIDEO_CODEC = os.environ.get('VIDEO_CODEC', 'libx264')  # PyAV encoder
+PREVIEW_WIDTH = int(os.environ.get('PREVIEW_WIDTH', 640))
+PREVIEW_FPS = float(os.environ.get('PREVIEW_FPS', 5))
+PREVIEW_BITRATE = int(float(os.environ.get('PREVIEW_BITRATE', 300e3)))  # bits/s, PyAV only
+THUMBNAIL_WIDTH = int(os.environ.get('THUMBNAIL_WIDTH', 480))
+
+OUTPUT_MODES = ('full', 'preview', 'none')
+
+
+def use_pyav(backend=VIDEO_BACKEND):
+    if backend != 'pyav':
+        return False
+    if av is None:
+        print("[WARN] VIDEO_BACKEND=pyav but PyAV is not installed (pip install av); using OpenCV")
+        return False
+    return True
+
+
+def scaled_size(width, height, max_width):
+    """Frame size after limiting the width to max_width (even numbers, as encoders need)"""
+    if not max_width or width <= max_width:
+        return width, height
+    return max_width // 2 * 2, max(2, round(height * max_width / width) // 2 * 2)
+
+
+# === Decoding ===
+class AVCapture:
+    """cv2.VideoCapture look-alike that decodes with PyAV on several threads"""
+    def __init__(self, path, threads=DECODE_THREADS):
+        self.container = av.open(path)
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = 'AUTO'  # frame and slice threading
+        if threads:
+            self.stream.codec_context.thread_count = threads
+        self.fps = float(self.stream.average_rate or self.stream.guessed_rate or 0)
+        self.frame_count = self.stream.frames
+        if not self.frame_count and self.stream.duration and self.fps:
+            self.frame_count = int(self.stream.duration * self.stream.time_base * self.fps)
+        self.size = (self.stream.codec_context.width, self.stream.codec_context.height)
+        self.position = 0
+        self._frames = self.container.decode(self.stream)
+        self._pending = None
+        self._opened = True
+
+    def read(self):
+        frame = self._pending
+        self._pending = None
+        if frame is None:
+            try:
+                frame = next(self._frames)
+            except (StopIteration, av.FFmpegError):
+                return False, None
+        self.position += 1
+        return True, frame.to_ndarray(format='bgr24')
+
+    def _seek(self, frame_num):
+        frame_pts = 1 / (self.fps * self.stream.time_base)  # pts units per frame
+        target = (self.stream.start_time or 0) + int(frame_num * frame_pts)
+        self.container.seek(target, stream=self.stream, backward=True)
+        self._frames = self.container.decode(self.stream)
+        # The seek lands on the keyframe before the target; decode forward to it
+        for frame in self._frames:
+            if frame.pts is None or frame.pts >= target - frame_pts / 2:
+                self._pending = frame
+                break
+        self.position = frame_num
+
+    def get(self, prop):
+        return {
+            cv2.CAP_PROP_FPS: self.fps,
+            cv2.CAP_PROP_FRAME_COUNT: self.frame_count,
+            cv2.CAP_PROP_FRAME_WIDTH: self.size[0],
+            cv2.CAP_PROP_FRAME_HEIGHT: self.size[1],
+            cv2.CAP_PROP_POS_FRAMES: self.position,
+        }.get(prop, 0)
+
+    def set(self, prop, value):
+        if prop != cv2.CAP_PROP_POS_FRAMES:
+            return False
+        self._seek(int(value))
+        return True
+
+    def isOpened(self):
+        return self._opened
+
+    def release(self):
+        if self._opened:
+            self.container.close()
+            self._opened = False
+
+
+def open_capture(path, backend=VIDEO_BACKEND):
+    """Capture for a video file with the configured backend.
+
+    Files still being uploaded always use the OpenCV GrowingFileCapture.
+    """
+    cap = open_video(path)
+    if cap.__class__ is cv2.VideoCapture and use_pyav(backend):
+        try:
+            av_cap = AVCapture(path)
+            cap.release()
+            return av_cap
+        except (av.FFmpegError, IndexError) as e:
+            print(f"[WARN] PyAV could not open {path} ({e}); using OpenCV")
+    return cap
+
+
+# === Encoding ===
+class AVWriter:
+    """Writes BGR frames with a PyAV encoder (H.264 by default)"""
+    def __init__(self, path, fps, size, codec=VIDEO_CODEC, bit_rate=None):
+        self.container = av.open(path, mode='w')
+        self.stream = self.container.add_stream(codec, rate=Fraction(fps or 25).limit_denominator(1001))
+        self.size = (size[0] // 2 * 2, size[1] // 2 * 2)  # yuv420p needs even dimensions
+        self.stream.width, self.stream.height = self.size
+        self.stream.pix_fmt = 'yuv420p'
+        self.stream.thread_type = 'AUTO'
+        if bit_rate:
+            self.stream.bit_rate = bit_rate
+
+    def write(self, frame):
+        frame = av.VideoFrame.from_ndarray(frame[:self.size[1], :self.size[0]], format='bgr24')
+        for packet in self.stream.encode(frame):
+            self.container.mux(packet)
+
+    def release(self):
+        for packet in self.stream.encode():
+            self.container.mux(packet)
+        self.container.close()
+
+
+def _thumbnail_name(text):
+    return re.sub(r'[^A-Za-z0-9]+', '', text) or 'plate'
+
+
+class VideoOutput:
+    """Annotated video output in one of OUTPUT_MODES; see the module docstring"""
+    def __init__(self, path, fps, size, mode=VIDEO_OUTPUT, backend=VIDEO_BACKEND, thumbnail_dir=None, name=None):
+        if mode not in OUTPUT_MODES:
+            raise ValueError(f"Unknown output mode {mode!r}, expected one of {OUTPUT_MODES}")
+        self.mode = mode
+        self.path = None if mode == 'none' else path
+        self.thumbnail_dir = thumbnail_dir or os.path.join(os.path.dirname(path), 'thumbnails')
+        self.name = name or os.path.splitext(os.path.basename(path))[0]
+        self.thumbnails = []
+        self.every = 1
+        self.size = (int(size[0]), int(size[1]))
+        fps = fps or 25
+        if mode == 'preview':
+            self.every = max(1, round(fps / PREVIEW_FPS)) if PREVIEW_FPS else 1
+            self.size = scaled_size(*self.size, PREVIEW_WIDTH)
+            fps = fps / self.every
+        self.fps = fps
+        self._count = 0
+        self._writer = None
+        if mode != 'none':
+            bit_rate = PREVIEW_BITRATE if mode == 'preview' else None
+            if use_pyav(backend):
+                self._writer = AVWriter(path, fps, self.size, bit_rate=bit_rate)
+            else:
+                self._writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, self.size)
+
+    @property
+    def write_frames(self):
+        """False when frames are discarded, so callers can skip annotating them"""
+        return self._writer is not None
+
+    def write(self, frame):
+        if self._writer is None:
+            return
+        self._count += 1
+        if (self._count - 1) % self.every:
+            return
+        if (frame.shape[1], frame.shape[0]) != self.size:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        self._writer.write(frame)
+
+    def append(self, frame):
+        """Write a frame that is already in this output's size and rate (e.g. from a chunk segment)"""
+        if self._writer is not None:
+            self._writer.write(frame)
+
+    def thumbnail(self, frame, frame_num, text):
+        """Save a keyframe thumbnail for a newly seen vehicle (only when no video is written)"""
+        if self.mode != 'none':
+            return None
+        os.makedirs(self.thumbnail_dir, exist_ok=True)
+        h, w = frame.shape[:2]
+        if w > THUMBNAIL_WIDTH:
+            frame = cv2.resize(frame, (THUMBNAIL_WIDTH, round(h * THUMBNAIL_WIDTH / w)), interpolation=cv2.INTER_AREA)
+        path = os.path.join(self.thumbnail_dir, f"{self.name}_{frame_num:07}_{_thumbnail_name(text)}.jpg")
+        cv2.imwrite(path, frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        self.thumbnails.append(path)
+        return path
+
+    def release(self):
+        if self._writer is not None:
+            self._writer.release()
@@ -0,0 +1,287 @@
+"""Long-lived inference worker processes for the Flask backend.
+
+Each worker loads YOLO and PaddleOCR once when it starts (main.warm_up), and
+reuses them for every job it picks up. warm_up() starts the workers ahead of the
+first job.
+
+Progress events from main.run_job travel back over one shared manager queue as
+(job_id, event) pairs; a dispatcher thread hands them to the on_event callback
+given to submit_job. The same queue carries the workers' metric deltas, which
+the dispatcher merges into metrics.REGISTRY. Running jobs are cancelled cooperatively through a manager
+Event per job that main.run_job checks between frame batches.
+
+Live cameras are handled by a separate process running a camera_supervisor.CameraSupervisor
+(one shared inference engine for all cameras), driven over a pipe by CameraSupervisorProcess.
+"""
+import os
+import io
+import time
+import threading
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+
+# === CONFIGURATION ===
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', 1))
+
+_pool = None
+_pool_lock = threading.Lock()
+_manager = None
+_events = None  # manager queue of (job_id, event); event None marks the end of a job
+_listeners = {}  # job_id -> on_event callback
+_delivered = threading.Condition(_pool_lock)  # notified when a job's last event was delivered
+_stop_events = {}  # job_id -> manager Event that cancels the running job
+
+
+# === Worker Side ===
+def _init_worker():
+    """Load the models once when the worker process starts"""
+    import main
+    main.warm_up()
+
+
+def _warm_up():
+    import main
+    return os.getpid(), main.warm_up()
+
+
+def _run_job(input_dir, output_dir, job_id=None, events=None, stop_event=None, output_mode=None):
+    """Run one job inside a worker and return what main.py printed"""
+    import main
+    on_event = None
+    started = last_flush = time.monotonic()
+    if events is not None:
+        def on_event(event):
+            nonlocal last_flush
+            events.put((job_id, event))
+            if time.monotonic() - last_flush >= metrics.METRICS_FLUSH_INTERVAL:
+                last_flush = time.monotonic()
+                events.put((job_id, {'type': 'metrics', 'metrics': metrics.REGISTRY.take_delta()}))
+    buffer = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(buffer):
+            main.run_job(input_dir, output_dir, job_id, on_event, stop_event, output_mode)
+    finally:
+        metrics.WORKER_BUSY.inc(time.monotonic() - started)
+        if events is not None:
+            events.put((job_id, {'type': 'metrics', 'metrics': metrics.REGISTRY.take_delta()}))
+    return buffer.getvalue()
+
+
+# === Parent Side ===
+def get_pool():
+    """Return the shared worker pool, creating it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=INFERENCE_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker
+            )
+        return _pool
+
+
+def warm_up(timeout=None):
+    """Start the workers and wait until their models are loaded.
+
+    Returns {worker pid: model load seconds}. Each worker that starts warms up in its
+    initializer; this submits one task per worker so all INFERENCE_WORKERS are started.
+    """
+    pool = get_pool()
+    futures = [pool.submit(_warm_up) for _ in range(INFERENCE_WORKERS)]
+    return dict(future.result(timeout=timeout) for future in futures)
+
+
+def _dispatch_events(events):
+    while True:
+        try:
+            job_id, event = events.get()
+        except (EOFError, OSError):
+            return  # manager shut down
+        if isinstance(event, dict) and event.get('type') == 'metrics':
+            metrics.REGISTRY.merge(event['metrics'])
+            continue
+        with _pool_lock:
+            listener = _listeners.get(job_id)
+            if event is None:
+                _listeners.pop(job_id, None)
+                _delivered.notify_all()
+        if listener is not None and event is not None:
+            try:
+                listener(event)
+            except Exception:
+                pass  # a failing listener must not stop events for other jobs
+
+
+def _get_manager():
+    """Manager owning the event queue and cancel events, started with the event dispatcher on first use"""
+    global _manager, _events
+    with _pool_lock:
+        if _manager is None:
+            _manager = multiprocessing.get_context('spawn').Manager()
+            _events = _manager.Queue()
+            threading.Thread(target=_dispatch_events, args=(_events,), name="job-events", daemon=True).start()
+        return _manager
+
+
+def wait_events_delivered(job_id, timeout=5.0):
+    """Block until every event of a finished job has been passed to its on_event callback"""
+    with _delivered:
+        return _delivered.wait_for(lambda: job_id not in _listeners, timeout=timeout)
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def submit_job(input_dir, output_dir, job_id=None, on_event=None, output_mode=None):
+    """Queue a job on the pool and return its Future (result is the job's stdout).
+
+    on_event(dict) is called in a parent-side thread for each event the job reports.
+    Jobs with a job_id can be stopped with cancel_job(job_id). output_mode selects
+    the annotated video output (see video_io.OUTPUT_MODES; default VIDEO_OUTPUT).
+    """
+    events = stop_event = None
+    if job_id is not None:
+        stop_event = _get_manager().Event()
+        with _pool_lock:
+            _stop_events[job_id] = stop_event
+            events = _events  # also carries the job's metrics
+            if on_event is not None:
+                _listeners[job_id] = on_event
+    try:
+        future = get_pool().submit(_run_job, input_dir, output_dir, job_id, events, stop_event, output_mode)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM); start a fresh pool and retry once
+        _reset_pool()
+        future = get_pool().submit(_run_job, input_dir, output_dir, job_id, events, stop_event, output_mode)
+    if job_id is not None:
+        future.add_done_callback(lambda _: _job_finished(job_id, events))
+    return future
+
+
+def _job_finished(job_id, events):
+    with _pool_lock:
+        _stop_events.pop(job_id, None)
+    if events is not None:
+        # Queued after every event the worker put, so the listener is dropped only once they are delivered
+        events.put((job_id, None))
+
+
+def cancel_job(job_id):
+    """Ask a running job to stop after its current frame batch; False if it is not running"""
+    with _pool_lock:
+        stop_event = _stop_events.get(job_id)
+    if stop_event is None:
+        return False
+    stop_event.set()
+    return True
+
+
+def shutdown():
+    global _manager, _events
+    _reset_pool()
+    if _manager is not None:
+        _manager.shutdown()
+    _manager = _events = None
+
+
+# === Camera Supervisor Process ===
+class CameraError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _serve_cameras(conn, output_dir):
+    """Run a CameraSupervisor in this process and answer (command, args) messages from the parent"""
+    from camera_supervisor import CameraSupervisor  # loads the models in this process
+    supervisor = CameraSupervisor(output_dir)
+    while True:
+        try:
+            command, args = conn.recv()
+        except EOFError:
+            command, args = 'stop', ()
+        if command == 'stop':
+            supervisor.stop()
+            conn.close()
+            return
+        try:
+            if command == 'add':
+                source, options = args
+                reply = ('ok', supervisor.add(source, **options).stats())
+            elif command == 'metrics':
+                statuses = [camera.status for camera in list(supervisor.cameras.values())]
+                reply = ('ok', {'metrics': metrics.REGISTRY.take_delta(),
+                                'cameras': {status: statuses.count(status) for status in set(statuses)}})
+            else:
+                reply = ('ok', getattr(supervisor, command)(*args))
+        except KeyError:
+            reply = ('error', (f"Camera {args[0]} not found", 404))
+        except OverflowError as e:
+            reply = ('error', (str(e), 429))
+        except ValueError as e:
+            reply = ('error', (str(e), 409))
+        except Exception as e:
+            reply = ('error', (str(e), 500))
+        conn.send(reply)
+
+
+class CameraSupervisorProcess:
+    """Parent-side handle of the camera supervisor process, which is started on first use"""
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self._process = None
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _call(self, command, *args):
+        with self._lock:
+            if self._process is None or not self._process.is_alive():
+                ctx = multiprocessing.get_context('spawn')
+                self._conn, child = ctx.Pipe()
+                self._process = ctx.Process(target=_serve_cameras, args=(child, self.output_dir),
+                                            name="camera-supervisor", daemon=True)
+                self._process.start()
+            try:
+                self._conn.send((command, args))
+                status, result = self._conn.recv()
+            except (EOFError, OSError):
+                self._process = None  # died (e.g. OOM); the next call starts a fresh one
+                raise CameraError('Camera supervisor process exited', 500)
+        if status == 'error':
+            raise CameraError(*result)
+        return result
+
+    @property
+    def started(self):
+        return self._process is not None
+
+    def add(self, source, camera_id=None, **options):
+        """Start a camera and return its stats; options go to camera_supervisor.Camera"""
+        return self._call('add', source, {'camera_id': camera_id, **options})
+
+    def remove(self, camera_id):
+        return self._call('remove', camera_id)
+
+    def metrics(self):
+        """Metric delta counted by the cameras since the last call, and camera counts by status"""
+        return self._call('metrics')
+
+    def stats(self, camera_id=None):
+        return self._call('stats', camera_id)
+
+    def shutdown(self):
+        with self._lock:
+            if self._process is not None and self._process.is_alive():
+                self._conn.send(('stop', ()))
+                self._process.join(timeout=30)
+            self._process = None